@@ -1,14 +1,42 @@
-from fastapi import FastAPI, Request, HTTPException, UploadFile, File
-from fastapi.responses import RedirectResponse
+# First, so the startup report covers every other import
+import startup
+from fastapi import FastAPI, Request, Response, HTTPException, UploadFile, File, Query
+import asyncio
+import os
+import sys
+import threading
+import time
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from pydantic import BaseModel
 from urllib.parse import urlencode
 
-# Import the main function from scout_orchestrator
-from scout_agents.scout_orchestrator import main as run_scout_orchestration
-# Import Google Drive auth functions
-from google_drive_auth import get_drive_service, get_authorization_url, exchange_code_for_token
+# Import Google Drive auth functions (the Google client libraries load on first use)
+from google_drive_auth import get_authorization_url, exchange_code_for_token
+from credential_store import DEFAULT_USER
+from config import config
+from metrics import get_metrics, span, start_worker_export
+from profiling import PROFILING_ENABLED, profile_request, profiling_requested, read_profile
+from content_store import get_content_store
+from metadata_store import get_metadata_store
+from run_checkpoints import RunInProgressError, load_run, valid_run_id
+# The orchestrator, model and OpenAI modules pull in the agents SDK, openai and
+# pdf2image; they are imported on first use (or preloaded after startup)
+
+_orchestrator_main = None
+
+def _load_orchestrator():
+    global _orchestrator_main
+    if _orchestrator_main is None:
+        from scout_agents.scout_orchestrator import main
+        _orchestrator_main = main
+    return _orchestrator_main
+
+async def run_scout_orchestration(**kwargs):
+    """Run the scout orchestrator, importing it off the event loop the first time."""
+    main = _orchestrator_main or await asyncio.to_thread(_load_orchestrator)
+    return await main(**kwargs)
 
 app = FastAPI()
 
@@ -21,21 +49,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Endpoints that don't act on anyone's Drive or documents, open to requests without a session
+PUBLIC_PATHS = {"/", "/auth/google", "/auth/google/callback", "/metrics", "/config", "/stats",
+                "/docs", "/redoc", "/openapi.json"}
+
+@app.middleware("http")
+async def select_drive_user(request: Request, call_next):
+    # The Drive user a request acts for comes from a session the server issued, never from
+    # the client's say-so; tools read it from a context variable (see drive_pool)
+    from auth_sessions import SESSION_COOKIE, SINGLE_USER, verify_session
+    from drive_pool import set_drive_user
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:].strip() if authorization[:7].lower() == "bearer " else request.cookies.get(SESSION_COOKIE)
+    user_id = None
+    if token:
+        user_id = verify_session(token)
+        if user_id is None:
+            return JSONResponse(status_code=401, content={"detail": "Invalid or expired session. Please authenticate via /auth/google."})
+    elif not SINGLE_USER and request.method != "OPTIONS" and request.url.path not in PUBLIC_PATHS \
+            and not request.url.path.startswith("/profiles/"):
+        # Only a single-user deployment lets requests without a session act for the 'default' user
+        return JSONResponse(status_code=401, content={"detail": "Not authenticated. Please authenticate via /auth/google."})
+    request.state.session_user = user_id
+    set_drive_user(user_id)
+    return await call_next(request)
+
+@app.on_event("startup")
+async def import_legacy_metadata():
+    # One-time import of the old per-upload *_metadata.json files; a no-op once done
+    threading.Thread(target=lambda: get_metadata_store().import_json_metadata(), daemon=True).start()
+
+@app.on_event("startup")
+async def preload_modules():
+    startup.mark("ready")
+    if startup.PRELOAD_ENABLED:
+        # Warm up in the background so the first document doesn't wait for the imports
+        startup.preload("orchestrator", _load_orchestrator)
+    # Network discovery for the OAuth/network log lines, off the startup path
+    startup.preload("network", config.validate)
+    # With several workers, /metrics adds up the metrics every worker exports
+    start_worker_export()
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    # Release the pooled keep-alive connections of the shared clients that were used
+    if 'drive_client' in sys.modules:
+        from drive_client import close_async_drive_client
+        await close_async_drive_client()
+    if 'openai_client' in sys.modules:
+        from openai_client import close_openai_client
+        await close_openai_client()
+    # Commit any queued metadata records
+    get_metadata_store().close()
+    # Write out learned state whose background save hasn't run yet
+    if 'folder_matcher' in sys.modules:
+        from folder_matcher import get_folder_matcher
+        await asyncio.to_thread(get_folder_matcher().flush)
+    if 'document_classifier' in sys.modules:
+        from document_classifier import get_document_classifier
+        classifier = get_document_classifier()
+        if classifier is not None:
+            await asyncio.to_thread(classifier.flush)
+
 @app.get("/")
 def hello_world():
     return {"message": "Hello World!"}
 
 # Google Authentication Endpoints
 @app.get("/auth/google")
-async def auth_google(request: Request):
-    drive_service = get_drive_service()
-    if drive_service:
-        pass
-        
+async def auth_google(request: Request, new_account: bool = False):
+    """Start connecting a Drive account: the session's user, else (or with ?new_account=1) a new user.
+
+    In a single-user deployment (SCOUT_SINGLE_USER) requests without a session reconnect 'default'.
+    """
+    from auth_sessions import SINGLE_USER, new_user_id
+
     app_callback_scheme = request.query_params.get("callback_scheme", "scoutapp")
     
-    authorization_url = get_authorization_url()
-    final_auth_url = get_authorization_url() # Called twice, but okay for now
+    # Re-linking an existing account takes a session for it; anyone else connects a new account
+    session_user = request.state.session_user or (DEFAULT_USER if SINGLE_USER else None)
+    user_id = new_user_id() if new_account or session_user is None else session_user
+    final_auth_url = await asyncio.to_thread(get_authorization_url, user_id)
     print(f"---- DEBUG: Attempting to redirect to Google auth URL: {final_auth_url} ----") # DEBUG PRINT
     return RedirectResponse(final_auth_url)
 
@@ -44,18 +138,29 @@ async def auth_google_callback(request: Request, code: str = None, state: str =
     if not code:
         raise HTTPException(status_code=400, detail="Missing authorization code from Google.")
     
+    from auth_sessions import SESSION_COOKIE, SESSION_TTL, consume_oauth_state, issue_session
+    from drive_pool import get_drive_pool
+
     app_callback_scheme = "scoutapp"
 
-    credentials = exchange_code_for_token(authorization_code=code)
+    # Only a flow this server started, and only once, may store a token
+    user_id = await asyncio.to_thread(consume_oauth_state, state)
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="Unknown or expired OAuth state. Please start again at /auth/google.")
+    credentials = await asyncio.to_thread(exchange_code_for_token, code, user_id)
+    if credentials:
+        # Pick up the new grant on the user's next request
+        await asyncio.to_thread(get_drive_pool().session(user_id).load_credentials, True)
     
     if credentials and credentials.token:
-        access_token = credentials.token
-        redirect_params = {"token": access_token}
-        
-        app_redirect_url = f"{app_callback_scheme}://?status=success" # Temporary change for debugging
+        # The app sends the session back (Authorization: Bearer) to act as this user
+        session = issue_session(user_id)
+        app_redirect_url = f"{app_callback_scheme}://?{urlencode({'status': 'success', 'session': session})}"
         
-        print(f"Redirecting to Swift app: {app_redirect_url}")
-        return RedirectResponse(app_redirect_url)
+        print(f"Redirecting to Swift app for user {user_id}")
+        response = RedirectResponse(app_redirect_url)
+        response.set_cookie(SESSION_COOKIE, session, max_age=int(SESSION_TTL), httponly=True, samesite="lax")
+        return response
     else:
         error_detail = "Failed to exchange authorization code for token or token missing in credentials."
         print(error_detail)
@@ -73,11 +178,14 @@ class OrchestratorResponse(BaseModel):
     final_path_suggestion: str | None = None
     status_updates: list[str]
     error_message: str | None = None
+    # Pass to POST /runs/{run_id}/resume to continue a failed run
+    run_id: str | None = None
 
 # New endpoint to trigger the scout orchestrator
 @app.post("/process-file", response_model=OrchestratorResponse)
 async def trigger_orchestrator_endpoint(payload: OrchestratorRequest):
-    drive_service = get_drive_service()
+    from drive_pool import get_drive_pool
+    drive_service = await get_drive_pool().get_service()
     if not drive_service:
         raise HTTPException(
             status_code=401,
@@ -106,8 +214,9 @@ async def trigger_orchestrator_endpoint(payload: OrchestratorRequest):
 
 # New endpoint to handle PDF uploads from the mobile app
 @app.post("/upload-pdf", response_model=OrchestratorResponse)
-async def upload_pdf_endpoint(file: UploadFile = File(...)):
-    drive_service = get_drive_service()
+async def upload_pdf_endpoint(request: Request, response: Response, file: UploadFile = File(...)):
+    from drive_pool import get_drive_pool
+    drive_service = await get_drive_pool().get_service()
     if not drive_service:
         raise HTTPException(
             status_code=401,
@@ -139,11 +248,12 @@ async def upload_pdf_endpoint(file: UploadFile = File(...)):
         }
         
         media = MediaFileUpload(temp_file_path, mimetype='application/pdf')
-        uploaded_file = drive_service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id'
-        ).execute()
+        with span("drive.upload"):
+            uploaded_file = drive_service.files().create(
+                body=file_metadata,
+                media_body=media,
+                fields='id'
+            ).execute()
         
         file_id = uploaded_file.get('id')
         
@@ -157,12 +267,13 @@ async def upload_pdf_endpoint(file: UploadFile = File(...)):
         import io
         
         # Download the uploaded file from Google Drive to process locally
-        request = drive_service.files().get_media(fileId=file_id)
+        download_request = drive_service.files().get_media(fileId=file_id)
         fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
+        downloader = MediaIoBaseDownload(fh, download_request)
         done = False
-        while not done:
-            status, done = downloader.next_chunk()
+        with span("drive.download"):
+            while not done:
+                status, done = downloader.next_chunk()
         
         # Save to a temporary local file for processing
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_local_file:
@@ -171,11 +282,14 @@ async def upload_pdf_endpoint(file: UploadFile = File(...)):
         
         try:
             # Run the local orchestrator on the downloaded file
-            result_dict = await run_scout_orchestration(
-                pdf_file_path=temp_local_file_path,
-                original_file_name=file.filename,
-                use_local_processing=True
-            )
+            async with profile_request(f"upload-pdf {file.filename}", profiling_requested(request)) as profile:
+                result_dict = await run_scout_orchestration(
+                    pdf_file_path=temp_local_file_path,
+                    original_file_name=file.filename,
+                    use_local_processing=True
+                )
+            if profile:
+                response.headers["X-Scout-Profile-Id"] = profile.profile_id
         finally:
             # Clean up the temporary file
             os.unlink(temp_local_file_path)
@@ -189,14 +303,106 @@ async def upload_pdf_endpoint(file: UploadFile = File(...)):
             error_message=str(e)
         )
 
+async def _orchestrate_local_pdf(request: Request, response: Response, local_file_path: str, original_file_name: str,
+                                 content_hash: str, details: dict, run_id: str | None = None,
+                                 source: str = "process-local-pdf") -> OrchestratorResponse:
+    """Run (or resume) the orchestrator on a working copy in local storage and record the outcome."""
+    from drive_pool import current_drive_user
+    started = time.perf_counter()
+    # Opt-in sampling profile of this run (X-Scout-Profile header or ?profile=1)
+    try:
+        async with profile_request(f"{source} {original_file_name}", profiling_requested(request)) as profile:
+            result_dict = await run_scout_orchestration(
+                pdf_file_path=local_file_path,
+                original_file_name=original_file_name,
+                use_local_processing=True,
+                run_id=run_id,
+                content_hash=content_hash,
+                user_id=current_drive_user()
+            )
+    except RunInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    duration_ms = (time.perf_counter() - started) * 1000
+    if profile:
+        response.headers["X-Scout-Profile-Id"] = profile.profile_id
+
+    # Record metadata in the SQLite index, as the document of the request's user
+    get_metadata_store().record({
+        "user_id": current_drive_user(),
+        "content_hash": content_hash,
+        "original_filename": original_file_name,
+        "renamed_file": result_dict.get("renamed_file"),
+        "target_folder": result_dict.get("target_folder"),
+        "final_path": result_dict.get("final_path_suggestion"),
+        "local_path": local_file_path,
+        "error_message": result_dict.get("error_message"),
+        "duration_ms": duration_ms,
+        "source": source,
+        "summary": result_dict.get("extracted_content"),
+        "vision_analysis": result_dict.get("vision_analysis"),
+        "extracted_text": result_dict.get("extracted_text"),
+        "details_json": {
+            **details,
+            "run_id": result_dict.get("run_id"),
+            "status_updates": result_dict.get("status_updates", []),
+            "token_usage": result_dict.get("token_usage"),
+            "triage": result_dict.get("triage"),
+            "classification": result_dict.get("classification"),
+            "memory": result_dict.get("memory"),
+            "stages": result_dict.get("stages"),
+            "spans": result_dict.get("spans"),
+            "profile": profile.summary if profile else None,
+        },
+    })
+
+    return OrchestratorResponse(**result_dict)
+
+def _load_run_or_404(run_id: str):
+    from drive_pool import current_drive_user
+    if not valid_run_id(run_id):
+        raise HTTPException(status_code=400, detail="Invalid run ID")
+    run = load_run(run_id)
+    # Another user's run is as good as missing
+    if run is None or run.user_id != current_drive_user():
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+async def _resume_run(request: Request, response: Response, run) -> OrchestratorResponse:
+    """Continue a checkpointed run from its first incomplete stage."""
+    if run.status == "completed":
+        # Already recorded when it completed
+        return OrchestratorResponse(**run.state["result"])
+    local_file_path = run.state["file_path"]
+    content_hash = run.state.get("content_hash")
+    if not os.path.exists(local_file_path):
+        if not content_hash:
+            raise HTTPException(status_code=410, detail="The run's document is gone and is not in the content store")
+        # Check the document out of the content store again where the run left it
+        try:
+            local_file_path = await asyncio.to_thread(
+                get_content_store().checkout, content_hash,
+                os.path.dirname(local_file_path), os.path.basename(local_file_path)
+            )
+        except FileNotFoundError:
+            raise HTTPException(status_code=410, detail="The run's document is gone and is no longer in the content store")
+    return await _orchestrate_local_pdf(
+        request, response, local_file_path, run.state["original_file_name"], content_hash,
+        {"resumed": True}, run_id=run.run_id, source="resume"
+    )
+
 # New endpoint to process PDFs locally without uploading to Google Drive
 @app.post("/process-local-pdf", response_model=OrchestratorResponse)
-async def process_local_pdf_endpoint(file: UploadFile = File(...)):
+async def process_local_pdf_endpoint(request: Request, response: Response, file: UploadFile = File(...),
+                                     run_id: str | None = None):
+    """Organize an uploaded PDF. With the run_id of an earlier run of the same file, resume that run."""
+    from drive_pool import current_drive_user
     if not file.filename.endswith('.pdf'):
         raise HTTPException(
             status_code=400,
             detail="File must be a PDF"
         )
+    if run_id is not None and not valid_run_id(run_id):
+        raise HTTPException(status_code=400, detail="Invalid run ID")
 
     try:
         import os
@@ -211,42 +417,150 @@ async def process_local_pdf_endpoint(file: UploadFile = File(...)):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_filename = os.path.splitext(file.filename)[0]
         unique_filename = f"{base_filename}_{timestamp}.pdf"
-        local_file_path = os.path.join(local_storage_dir, unique_filename)
         
-        # Save PDF to local storage
+        # Store the PDF once in the content-addressed store
         content = await file.read()
-        with open(local_file_path, 'wb') as f:
-            f.write(content)
-        
-        # Run the full orchestration for local files using the updated scout_orchestrator
-        result_dict = await run_scout_orchestration(
-            pdf_file_path=local_file_path,
-            original_file_name=file.filename,
-            use_local_processing=True
+        content_store = get_content_store()
+        # Hashing and fsync block, so keep them off the event loop
+        stored_object = await asyncio.to_thread(content_store.put_bytes, content)
+
+        run = load_run(run_id) if run_id else None
+        if run is not None:
+            if run.user_id != current_drive_user():
+                raise HTTPException(status_code=409, detail=f"Run ID {run_id} is already in use")
+            if run.state.get("content_hash") != stored_object.content_hash:
+                raise HTTPException(status_code=409, detail=f"Run {run_id} is processing a different file")
+            return await _resume_run(request, response, run)
+
+        # Check out a working copy (a hard link) for the orchestrator to rename and file
+        local_file_path = await asyncio.to_thread(
+            content_store.checkout, stored_object.content_hash, local_storage_dir, unique_filename, content
+        )
+        return await _orchestrate_local_pdf(
+            request, response, local_file_path, file.filename, stored_object.content_hash,
+            {"processing_timestamp": timestamp, "deduplicated": stored_object.deduplicated},
+            run_id=run_id
         )
         
-        # Save metadata alongside the PDF
-        metadata = {
-            "original_filename": file.filename,
-            "local_path": local_file_path,
-            "processing_timestamp": timestamp,
-            **result_dict  # Include all orchestration results
-        }
-        
-        import json
-        metadata_path = os.path.join(local_storage_dir, f"{base_filename}_{timestamp}_metadata.json")
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
-        
-        return OrchestratorResponse(**result_dict)
-        
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in /process-local-pdf endpoint: {e}")
         return OrchestratorResponse(
             original_file=file.filename,
             status_updates=[f"Processing error: {str(e)}"],
-            error_message=str(e)
+            error_message=str(e),
+            run_id=run_id
         )
 
+@app.get("/runs/{run_id}")
+def get_run(run_id: str):
+    """Status of an orchestrator run: completed stages, the next one, attempts and the last error."""
+    return _load_run_or_404(run_id).summary()
+
+@app.post("/runs/{run_id}/resume", response_model=OrchestratorResponse)
+async def resume_run(request: Request, response: Response, run_id: str):
+    """Retry a failed or interrupted run, restoring its completed stages instead of redoing them."""
+    run = _load_run_or_404(run_id)
+    try:
+        return await _resume_run(request, response, run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in /runs/{run_id}/resume endpoint: {e}")
+        return OrchestratorResponse(
+            original_file=run.state.get("original_file_name") or run_id,
+            status_updates=[f"Processing error: {str(e)}"],
+            error_message=str(e),
+            run_id=run_id
+        )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Per-stage latency histograms and quantiles, in-flight gauges and error counters (of all workers) for Prometheus."""
+    return PlainTextResponse(get_metrics().render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str):
+    """Folded stacks of a profiled request (flamegraph.pl / speedscope input)."""
+    folded = read_profile(profile_id) if PROFILING_ENABLED else None
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(folded)
+
+@app.get("/config")
+def get_config_info():
+    """Server, network and OAuth configuration, for debugging device connectivity."""
+    return config.get_info()
+
+# Processed document metadata queries
+@app.get("/stats")
+def get_stats():
+    """Runtime counters, e.g. how often OpenAI requests reused a pooled connection."""
+    from model_provider import MODEL_PROVIDER, use_fake_models
+    from openai_client import get_openai_client_stats
+    from llm_cache import get_llm_cache
+    from model_governor import get_model_governor
+    from document_classifier import get_document_classifier
+    from scout_agents.triage_agent import get_triage_stats
+
+    stats = {"model_provider": MODEL_PROVIDER, "openai_client": get_openai_client_stats(), "triage": get_triage_stats()}
+    llm_cache = get_llm_cache()
+    stats["llm_cache"] = llm_cache.stats() if llm_cache else None
+    governor = get_model_governor()
+    stats["model_governor"] = governor.stats() if governor else None
+    classifier = get_document_classifier()
+    stats["document_classifier"] = classifier.stats() if classifier else None
+    stats["stages"] = get_metrics().snapshot()
+    stats["startup"] = startup.get_startup_report()
+    from drive_pool import get_drive_pool_stats
+    stats["drive_pool"] = get_drive_pool_stats()
+    if use_fake_models():
+        from fake_model import get_fake_model_stats
+        stats["fake_model"] = get_fake_model_stats()
+    return stats
+
+@app.get("/documents")
+def list_documents(
+    since: str | None = None,
+    until: str | None = None,
+    status: str | None = None,
+    folder: str | None = None,
+    filename: str | None = None,
+    content_hash: str | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    """List the user's processed documents, newest first. since/until are ISO-8601 (UTC) bounds, e.g. 2026-10-18."""
+    from drive_pool import current_drive_user
+    return get_metadata_store().query_documents(
+        current_drive_user(), since=since, until=until, status=status, folder=folder,
+        filename=filename, content_hash=content_hash, limit=limit, offset=offset
+    )
+
+@app.get("/search")
+def search_documents(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Full-text search over the user's processed documents with ranked, highlighted snippets."""
+    from drive_pool import current_drive_user
+    return get_metadata_store().search_documents(current_drive_user(), q, limit=limit, offset=offset)
+
+@app.get("/documents/{document_id}")
+def get_document(document_id: int):
+    from drive_pool import current_drive_user
+    document = get_metadata_store().get_document(current_drive_user(), document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
+
+startup.mark("app_import")
+
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    # Workers are separate processes that import app.py themselves; they read
+    # SCOUT_WORKERS to split server-wide limits (see shared_state)
+    os.environ['SCOUT_WORKERS'] = str(config.workers)
+    uvicorn.run("app:app", host=config.host, port=config.port,
+                workers=config.workers, reload=config.reload)
@@ -0,0 +1,144 @@
+"""
+Drive user sessions and OAuth state for Scout App backend.
+
+Which Drive account a request acts for is decided only from something the
+server issued itself:
+
+- A session token, handed out at the end of the OAuth flow (as the `session`
+  parameter of the app redirect and as the `scout_session` cookie) and sent
+  back as `Authorization: Bearer <token>` or that cookie. It is the user ID and
+  an expiry, signed with HMAC-SHA256 under the server's session secret
+  (SCOUT_SESSION_SECRET, or a random one generated once into
+  SCOUT_SESSION_SECRET_FILE and shared by all workers).
+- Requests without a session are refused (401), except for the endpoints
+  that don't touch anyone's Drive or documents. A single-user deployment
+  (SCOUT_SINGLE_USER=true) instead lets them act for the `default` user, the
+  single account of backend/token.json, as before there were several users.
+
+The OAuth `state` is a random value recorded server-side with the user the
+flow was started for (one file per pending flow under SCOUT_OAUTH_STATE_DIR,
+so any worker can finish it). The callback consumes it exactly once, within
+SCOUT_OAUTH_STATE_TTL seconds; a callback with an unknown, reused or expired
+state is refused before any token is saved.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Optional
+
+from credential_store import valid_user_id
+from shared_state import atomic_write, file_lock
+
+SESSION_COOKIE = 'scout_session'
+# Whether requests without a session act for the 'default' user
+SINGLE_USER = os.getenv('SCOUT_SINGLE_USER', 'false').lower() == 'true'
+SESSION_TTL = float(os.getenv('SCOUT_SESSION_TTL_DAYS', '30')) * 86400
+SESSION_SECRET_FILE = os.getenv('SCOUT_SESSION_SECRET_FILE', 'local_storage/session_secret')
+OAUTH_STATE_DIR = os.getenv('SCOUT_OAUTH_STATE_DIR', 'local_storage/oauth_states')
+OAUTH_STATE_TTL = float(os.getenv('SCOUT_OAUTH_STATE_TTL', '600'))
+
+_STATE = re.compile(r'[A-Za-z0-9_-]{32,64}')
+
+_secret: Optional[bytes] = None
+_secret_lock = threading.Lock()
+
+
+def _session_secret() -> bytes:
+    """The key sessions are signed with, created on first use when not configured."""
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            configured = os.getenv('SCOUT_SESSION_SECRET')
+            if configured:
+                _secret = configured.encode('utf-8')
+            else:
+                # Every worker must sign with the same key; the first one to get here creates it
+                with file_lock(SESSION_SECRET_FILE):
+                    if not os.path.exists(SESSION_SECRET_FILE):
+                        atomic_write(SESSION_SECRET_FILE, secrets.token_hex(32))
+                    with open(SESSION_SECRET_FILE, 'r') as f:
+                        _secret = f.read().strip().encode('utf-8')
+        return _secret
+
+
+def _sign(payload: bytes) -> str:
+    return hmac.new(_session_secret(), payload, hashlib.sha256).hexdigest()
+
+
+def new_user_id() -> str:
+    """A fresh ID for a Drive account connected without an existing session."""
+    return f"u-{secrets.token_hex(8)}"
+
+
+def issue_session(user_id: str, ttl: float = SESSION_TTL) -> str:
+    """A signed session token for user_id."""
+    payload = json.dumps({"user": user_id, "exp": int(time.time() + ttl)}, separators=(',', ':')).encode('utf-8')
+    return f"{base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')}.{_sign(payload)}"
+
+
+def verify_session(token: str) -> Optional[str]:
+    """The user ID of a valid session token, or None when it is forged, malformed or expired."""
+    encoded, _, signature = (token or '').partition('.')
+    try:
+        payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    except (ValueError, TypeError):
+        return None
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        session = json.loads(payload)
+    except json.JSONDecodeError:
+        return None
+    user_id = session.get("user")
+    if not isinstance(user_id, str) or not valid_user_id(user_id) or session.get("exp", 0) < time.time():
+        return None
+    return user_id
+
+
+def _state_path(state: str) -> str:
+    return os.path.join(OAUTH_STATE_DIR, f"{state}.json")
+
+
+def create_oauth_state(user_id: str) -> str:
+    """A random OAuth state, recorded as belonging to a flow for user_id."""
+    _prune_oauth_states()
+    state = secrets.token_urlsafe(32)
+    atomic_write(_state_path(state), json.dumps({"user": user_id, "created": time.time()}))
+    return state
+
+
+def consume_oauth_state(state: Optional[str]) -> Optional[str]:
+    """The user a pending OAuth flow was started for; the state can't be used again. None if unknown or expired."""
+    if not state or not _STATE.fullmatch(state):
+        return None
+    path = _state_path(state)
+    try:
+        with open(path, 'r') as f:
+            pending = json.load(f)
+        # Only one callback (in any worker) gets to remove it
+        os.remove(path)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if pending.get("created", 0) + OAUTH_STATE_TTL < time.time():
+        return None
+    return pending.get("user")
+
+
+def _prune_oauth_states():
+    if not os.path.isdir(OAUTH_STATE_DIR):
+        return
+    cutoff = time.time() - OAUTH_STATE_TTL
+    for name in os.listdir(OAUTH_STATE_DIR):
+        path = os.path.join(OAUTH_STATE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # Consumed concurrently
@@ -0,0 +1,11 @@
+"""
+Micro-benchmarks for the PDF extraction and folder search hot paths.
+
+Run from the backend directory:
+
+    python -m benchmarks                                  # full suite
+    python -m benchmarks --hot-paths read_local_pdf --sizes 1,10
+    python -m benchmarks --compare benchmarks/results/<earlier>.json
+
+The synthetic corpus is generated into benchmarks/corpus on first use.
+"""
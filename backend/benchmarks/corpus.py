@@ -0,0 +1,172 @@
+"""
+Synthetic PDF corpus for the benchmarks.
+
+Documents come in three kinds, each at several page counts:
+
+- text   born-digital pages with a text layer (Helvetica, ~45 lines a page)
+- scan   image-only pages: a noisy grayscale JPEG of a page, no text layer
+- mixed  mostly text pages with every third page a scan
+
+The writer is a minimal PDF 1.4 serializer that streams pages to disk, so
+500-page documents don't need to fit in memory. Content is derived from a
+fixed seed, so the same corpus is produced on every machine and runs can be
+compared across commits.
+"""
+
+import io
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+KINDS = ('text', 'scan', 'mixed')
+SIZES = (1, 10, 100, 500)
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter in points
+SCAN_DPI = 150
+LINES_PER_PAGE = 45
+SEED = 1234
+
+_WORDS = (
+    "invoice account statement payment due amount total balance period service customer "
+    "reference number date charges tax electricity water insurance policy premium renewal "
+    "contract bank transfer credit debit interest annual monthly quarterly summary notice "
+    "address phone email office department report meeting project schedule delivery order"
+).split()
+
+
+def _page_lines(rng: random.Random, page: int) -> List[str]:
+    lines = [f"Document page {page}", f"Reference {rng.randrange(10 ** 7, 10 ** 8)}  Date 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"]
+    for _ in range(LINES_PER_PAGE - len(lines)):
+        words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 12)))
+        lines.append(f"{words.capitalize()}  {rng.randint(1, 9999)}.{rng.randint(0, 99):02d}")
+    return lines
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text_stream(lines: List[str]) -> bytes:
+    shown = " ".join(f"({_escape(line)}) '" for line in lines)
+    return f"BT /F1 10 Tf 50 770 Td 16 TL {shown} ET".encode('latin-1')
+
+
+def _scan_jpeg(lines: List[str], rng: random.Random) -> Tuple[bytes, int, int]:
+    """Render lines onto a grayscale 'scanned' page with sensor noise; returns (jpeg, width, height)."""
+    width, height = PAGE_WIDTH * SCAN_DPI // 72, PAGE_HEIGHT * SCAN_DPI // 72
+    page = Image.new('L', (width, height), 250)
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=20)
+    y = 60
+    for line in lines:
+        draw.text((100 + rng.randint(-3, 3), y), line, fill=30, font=font)
+        y += 34
+    noise = Image.effect_noise((width, height), 24).point(lambda v: v // 6)
+    page = Image.blend(page, noise, 0.08).rotate(rng.uniform(-0.8, 0.8), fillcolor=250)
+    buffered = io.BytesIO()
+    page.save(buffered, format='JPEG', quality=70)
+    return buffered.getvalue(), width, height
+
+
+def _is_scan(kind: str, page: int) -> bool:
+    return kind == 'scan' or (kind == 'mixed' and page % 3 == 0)
+
+
+class _PdfWriter:
+    """Writes numbered objects straight to a file and the xref table at the end."""
+
+    def __init__(self, f):
+        self._f = f
+        self._offsets: Dict[int, int] = {}
+        self._next = 1
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self) -> int:
+        number = self._next
+        self._next += 1
+        return number
+
+    def write(self, body: bytes, number: Optional[int] = None, stream: Optional[bytes] = None) -> int:
+        number = number or self.reserve()
+        self._offsets[number] = self._f.tell()
+        self._f.write(b"%d 0 obj\n" % number + body)
+        if stream is not None:
+            self._f.write(b"\nstream\n" + stream + b"\nendstream")
+        self._f.write(b"\nendobj\n")
+        return number
+
+    def finish(self, root: int):
+        xref = self._f.tell()
+        self._f.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next)
+        for number in range(1, self._next):
+            self._f.write(b"%010d 00000 n \n" % self._offsets[number])
+        self._f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self._next, root, xref))
+
+
+def write_document(path: str, kind: str, pages: int, seed: int = SEED):
+    """Write a synthetic document of the given kind and page count to path."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown document kind: {kind}")
+    rng = random.Random(f"{seed}-{kind}-{pages}")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pdf = _PdfWriter(f)
+        catalog, pages_tree = pdf.reserve(), pdf.reserve()
+        font = pdf.write(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        kids = []
+        for page in range(1, pages + 1):
+            lines = _page_lines(rng, page)
+            if _is_scan(kind, page):
+                jpeg, width, height = _scan_jpeg(lines, rng)
+                image = pdf.write(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                                  b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>" % (width, height, len(jpeg)),
+                                  stream=jpeg)
+                content = b"q %d 0 0 %d 0 0 cm /Im1 Do Q" % (PAGE_WIDTH, PAGE_HEIGHT)
+                resources = b"<< /XObject << /Im1 %d 0 R >> >>" % image
+            else:
+                content = _text_stream(lines)
+                resources = b"<< /Font << /F1 %d 0 R >> >>" % font
+            contents = pdf.write(b"<< /Length %d >>" % len(content), stream=content)
+            kids.append(pdf.write(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R /Resources %s >>"
+                                  % (pages_tree, PAGE_WIDTH, PAGE_HEIGHT, contents, resources)))
+        pdf.write(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)),
+                  number=pages_tree)
+        pdf.write(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_tree, number=catalog)
+        pdf.finish(catalog)
+    os.replace(tmp_path, path)
+
+
+def document_path(corpus_dir: str, kind: str, pages: int) -> str:
+    return os.path.join(corpus_dir, f"{kind}_{pages:03d}.pdf")
+
+
+def ensure_corpus(corpus_dir: str = DEFAULT_CORPUS_DIR, kinds=KINDS, sizes=SIZES) -> List[Dict]:
+    """Generate any missing documents; returns [{'kind', 'pages', 'path'}] for the requested set."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    documents = []
+    for kind in kinds:
+        for pages in sizes:
+            path = document_path(corpus_dir, kind, pages)
+            if not os.path.exists(path):
+                print(f"Generating {os.path.basename(path)}...")
+                write_document(path, kind, pages)
+            documents.append({"kind": kind, "pages": pages, "path": path})
+    return documents
+
+
+def build_folder_tree(root: str, folders: int, seed: int = SEED) -> List[str]:
+    """Create a storage root with the given number of category/year folders; returns their names."""
+    rng = random.Random(f"{seed}-folders-{folders}")
+    names = []
+    while len(names) < folders:
+        category = "_".join(rng.sample(_WORDS, 2)).title()
+        for year in range(2019, 2025):
+            if len(names) >= folders:
+                break
+            names.append(os.path.join(category, str(year)))
+    for name in names:
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+    return names
@@ -0,0 +1,279 @@
+"""
+Benchmark runner for the extraction hot paths.
+
+Hot paths:
+    extract_pdf_images     pdf2image rasterization + PNG/base64 encoding (needs poppler)
+    read_local_pdf         PyPDF2 text extraction of a local file
+    drive_pdf_text         pypdfium2 text extraction of an in-memory PDF, as done for Drive files
+    search_local_folders   folder index search over storage roots of different sizes
+
+Each PDF hot path runs against every corpus document: one warm-up call, then
+up to --repeat timed calls (fewer when --max-seconds runs out). Memory is
+measured in a separate call: the Python heap peak via tracemalloc and, on
+Linux, the growth of the process's peak RSS (VmHWM, reset before the call)
+which also covers native allocations in pdfium and Pillow. pdftoppm runs as
+a subprocess, so extract_pdf_images also reports the peak RSS of children.
+
+Results are written to benchmarks/results/<timestamp>-<commit>.json; pass
+--compare with an earlier file to print the change per case.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, KINDS, SIZES, build_folder_tree, ensure_corpus
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+PDF_HOT_PATHS = ('extract_pdf_images', 'read_local_pdf', 'drive_pdf_text')
+HOT_PATHS = PDF_HOT_PATHS + ('search_local_folders',)
+FOLDER_COUNTS = (100, 1000, 10000)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    summary = {f"p{round(q * 100)}": ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+               for q in QUANTILES}
+    summary.update(mean=sum(ordered) / len(ordered), min=ordered[0], max=ordered[-1])
+    return {key: round(value * 1000, 3) for key, value in summary.items()}
+
+
+def _rss_kb(field: str) -> Optional[int]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure_memory(call: Callable[[], Any]) -> Dict[str, Optional[float]]:
+    """Peak memory of one call: Python heap, process RSS growth and child process RSS, in MB."""
+    rss_before = _rss_kb('VmRSS') if _reset_peak_rss() else None
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    tracemalloc.start()
+    try:
+        call()
+        _current, python_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    peak_rss = _rss_kb('VmHWM')
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "peak_python_mb": round(python_peak / 2 ** 20, 2),
+        "peak_rss_growth_mb": round((peak_rss - rss_before) / 1024, 2) if rss_before is not None and peak_rss else None,
+        # ru_maxrss is the largest child so far, so it only says something when it grew
+        "peak_child_rss_mb": round(children_after / 1024, 2) if children_after > children_before else None,
+    }
+
+
+def time_calls(call: Callable[[], Any], repeat: int, max_seconds: float) -> List[float]:
+    """Latencies of up to repeat calls after one warm-up call, stopping early after max_seconds."""
+    call()
+    latencies = []
+    budget_end = time.perf_counter() + max_seconds
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+        if time.perf_counter() > budget_end:
+            break
+    return latencies
+
+
+def _pdf_call(hot_path: str, path: str) -> Callable[[], Any]:
+    # Imported lazily: the orchestrator pulls in the agents SDK, which read_local_pdf runs don't need
+    if hot_path == 'extract_pdf_images':
+        from scout_agents.scout_orchestrator import extract_pdf_images
+
+        def call():
+            # Stream to a page file, as the orchestrator does
+            fd, images_path = tempfile.mkstemp(prefix='scout-bench-', suffix='.jsonl')
+            os.close(fd)
+            try:
+                result = extract_pdf_images(path, None, images_path)
+            finally:
+                os.remove(images_path)
+            if not result["success"]:
+                raise RuntimeError(result["error"])
+            return result
+        return call
+    if hot_path == 'read_local_pdf':
+        from tools.read_local_pdf import extract_pdf_text
+        return lambda: extract_pdf_text(path)
+    if hot_path == 'drive_pdf_text':
+        from tools.read_drive_file_content_tool import extract_pdf_bytes_text
+        with open(path, 'rb') as f:
+            content_bytes = f.read()
+        return lambda: extract_pdf_bytes_text(content_bytes)
+    raise ValueError(f"Unknown hot path: {hot_path}")
+
+
+def run_pdf_case(hot_path: str, document: Dict[str, Any], repeat: int, max_seconds: float) -> Dict[str, Any]:
+    result = {"hot_path": hot_path, "case": f"{document['kind']}_{document['pages']:03d}",
+              "kind": document['kind'], "pages": document['pages']}
+    try:
+        call = _pdf_call(hot_path, document['path'])
+        latencies = time_calls(call, repeat, max_seconds)
+        result.update(
+            runs=len(latencies),
+            pages_per_s=round(document['pages'] * len(latencies) / sum(latencies), 2),
+            latency_ms=_percentiles(latencies),
+            **measure_memory(call),
+        )
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _folder_queries(names: List[str]) -> List[str]:
+    """Exact names, prefixes, relative paths, typos and misses, in a fixed order."""
+    categories = sorted({name.split(os.sep)[0] for name in names})
+    queries = []
+    for i, category in enumerate(categories[:50]):
+        queries += [category, category[:5], f"{category}/2021", category.replace('_', ' ').lower()]
+        if len(category) > 6:
+            queries.append(category[:3] + category[4:])
+    queries += ["Nonexistent Folder", "zzz", "2024"]
+    return queries
+
+
+def run_folder_case(folders: int, repeat: int, max_seconds: float) -> Dict[str, Any]:
+    from folder_index import get_folder_index
+    result = {"hot_path": "search_local_folders", "case": f"folders_{folders}", "folders": folders}
+    with tempfile.TemporaryDirectory(prefix='scout-bench-') as root:
+        names = build_folder_tree(root, folders)
+        queries = _folder_queries(names)
+        started = time.perf_counter()
+        index = get_folder_index(root)
+        result["index_build_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        def call():
+            for query in queries:
+                index.search(query, max_depth=2)
+
+        latencies = time_calls(call, repeat, max_seconds)
+        per_query = [latency / len(queries) for latency in latencies]
+        result.update(
+            runs=len(latencies),
+            queries=len(queries),
+            queries_per_s=round(len(queries) * len(latencies) / sum(latencies), 2),
+            latency_ms=_percentiles(per_query),
+            **measure_memory(call),
+        )
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print throughput and p50 latency changes against a baseline results file."""
+    previous = {(r["hot_path"], r["case"]): r for r in baseline.get("results", [])}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('created')}):")
+    for r in results["results"]:
+        old = previous.get((r["hot_path"], r["case"]))
+        if not old or "error" in r or "error" in old:
+            continue
+        rate_key = "pages_per_s" if "pages_per_s" in r else "queries_per_s"
+        rate_change = (r[rate_key] / old[rate_key] - 1) * 100
+        p50_change = (r["latency_ms"]["p50"] / old["latency_ms"]["p50"] - 1) * 100
+        print(f"  {r['hot_path']:<22} {r['case']:<14} {rate_key} {old[rate_key]:>10} -> {r[rate_key]:>10} "
+              f"({rate_change:+.1f}%)  p50 {p50_change:+.1f}%")
+
+
+def _print_result(r: Dict[str, Any]):
+    if "error" in r:
+        print(f"  {r['hot_path']:<22} {r['case']:<14} error: {r['error']}")
+        return
+    rate = f"{r['pages_per_s']} pages/s" if "pages_per_s" in r else f"{r['queries_per_s']} queries/s"
+    print(f"  {r['hot_path']:<22} {r['case']:<14} {rate:>18}  p50 {r['latency_ms']['p50']} ms  "
+          f"p95 {r['latency_ms']['p95']} ms  heap {r['peak_python_mb']} MB  rss +{r['peak_rss_growth_mb']} MB")
+
+
+def _csv(value: str, cast=str) -> List:
+    return [cast(item) for item in value.split(',') if item]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--hot-paths', type=_csv, default=list(HOT_PATHS), help=f"comma-separated, default: {','.join(HOT_PATHS)}")
+    parser.add_argument('--kinds', type=_csv, default=list(KINDS), help=f"document kinds, default: {','.join(KINDS)}")
+    parser.add_argument('--sizes', type=lambda v: _csv(v, int), default=list(SIZES), help="page counts, default: 1,10,100,500")
+    parser.add_argument('--folders', type=lambda v: _csv(v, int), default=list(FOLDER_COUNTS), help="folder tree sizes for search_local_folders")
+    parser.add_argument('--repeat', type=int, default=5, help="timed calls per case (after one warm-up call)")
+    parser.add_argument('--max-seconds', type=float, default=30.0, help="stop repeating a case after this long")
+    parser.add_argument('--corpus-dir', default=DEFAULT_CORPUS_DIR)
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.hot_paths) - set(HOT_PATHS)
+    if unknown:
+        parser.error(f"unknown hot paths: {', '.join(sorted(unknown))}")
+
+    commit = _git_commit()
+    results = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"repeat": args.repeat, "max_seconds": args.max_seconds},
+        "results": [],
+    }
+
+    pdf_hot_paths = [hot_path for hot_path in args.hot_paths if hot_path in PDF_HOT_PATHS]
+    if pdf_hot_paths:
+        documents = ensure_corpus(args.corpus_dir, args.kinds, args.sizes)
+        for hot_path in pdf_hot_paths:
+            print(f"{hot_path}:")
+            for document in documents:
+                result = run_pdf_case(hot_path, document, args.repeat, args.max_seconds)
+                results["results"].append(result)
+                _print_result(result)
+    if 'search_local_folders' in args.hot_paths:
+        print("search_local_folders:")
+        for folders in args.folders:
+            result = run_folder_case(folders, args.repeat, args.max_seconds)
+            results["results"].append(result)
+            _print_result(result)
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
@@ -4,7 +4,12 @@ from typing import Optional
 from network_utils import NetworkUtils
 
 class Config:
-    """Configuration class for Scout App backend"""
+    """Configuration class for Scout App backend
+    
+    Creating it only reads the environment. Values that depend on network
+    discovery (local IP, OAuth host, CORS origins) are properties, looked up
+    when first used and cached by NetworkUtils.
+    """
     
     def __init__(self):
         # Environment detection
@@ -14,25 +19,42 @@ class Config:
         self.host = os.getenv('SCOUT_HOST', '0.0.0.0')
         self.port = int(os.getenv('SCOUT_PORT', '8000'))
         
+        # Worker processes: one reloading process in development, one per core in production
+        default_workers = '1' if self.environment == 'development' else str(os.cpu_count() or 1)
+        self.workers = max(1, int(os.getenv('SCOUT_WORKERS', default_workers)))
+        self.reload = self.environment == 'development' and self.workers == 1
+        
         # Network configuration
-        self.local_ip = NetworkUtils.get_local_ip()
-        self.all_local_ips = NetworkUtils.get_all_local_ips()
         self.use_local_ip = os.getenv('SCOUT_USE_LOCAL_IP', 'false').lower() == 'true'
         
-        # OAuth configuration - initialize after network config
-        self.oauth_redirect_uri = self._get_oauth_redirect_uri()
-        self.oauth_base_host = self._get_oauth_base_host()
-        
-        # CORS configuration
-        self.cors_origins = self._get_cors_origins()
-        
         # Debug mode
         self.debug = os.getenv('SCOUT_DEBUG', 'true').lower() == 'true'
         
         # Setup logging
         self._setup_logging()
-        
-        # Validate configuration on startup
+    
+    @property
+    def local_ip(self) -> Optional[str]:
+        return NetworkUtils.get_local_ip()
+    
+    @property
+    def all_local_ips(self) -> list:
+        return NetworkUtils.get_all_local_ips()
+    
+    @property
+    def oauth_redirect_uri(self) -> str:
+        return self._get_oauth_redirect_uri()
+    
+    @property
+    def oauth_base_host(self) -> str:
+        return self._get_oauth_base_host()
+    
+    @property
+    def cors_origins(self) -> list:
+        return self._get_cors_origins()
+    
+    def validate(self):
+        """Log the OAuth and network setup and warn about likely problems (runs network discovery)"""
         self._validate_oauth_config()
         
     def get_network_info(self) -> dict:
@@ -84,7 +106,7 @@ class Config:
         origins.extend([
             f"http://localhost:{self.port}",
             "http://localhost:3000",  # Common frontend dev server
-            "http://127.0.0.1:{self.port}",
+            f"http://127.0.0.1:{self.port}",
         ])
         
         # Add local IP if available
@@ -139,6 +161,8 @@ class Config:
             'environment': self.environment,
             'host': self.host,
             'port': self.port,
+            'workers': self.workers,
+            'reload': self.reload,
             'local_ip': self.local_ip,
             'all_local_ips': self.all_local_ips,
             'use_local_ip': self.use_local_ip,
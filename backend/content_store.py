@@ -0,0 +1,222 @@
+"""
+Content-addressed storage for uploaded PDFs.
+
+Every upload is stored once under its SHA-256 in sharded directories
+(objects/ab/cd/<hash>.pdf), so identical re-uploads cost no extra disk space
+and no single directory grows without bound. Working copies handed to the
+orchestrator are hard links to the stored object; the link count doubles as
+the object's reference count. compact() removes objects nothing links to
+any more once they are older than the retention period, counted from their
+most recent upload. That time is kept in a sidecar file next to the object
+(<hash>.pdf.seen): the object's own timestamps belong to the filed documents
+linked to it.
+
+Hard-linked copies share their content, so filed documents must be replaced
+rather than edited in place (which is what every tool here does). Objects
+are stored read-only, so an edit in place fails instead of changing every
+document with that content.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from file_placement import place_file
+
+CAS_DIR = os.getenv('SCOUT_CAS_DIR', 'local_storage/content_store')
+# Unreferenced objects older than this are removed by compact()
+RETENTION_DAYS = float(os.getenv('SCOUT_CAS_RETENTION_DAYS', '30'))
+# Run compaction in the background after this many stored uploads
+COMPACT_EVERY = int(os.getenv('SCOUT_CAS_COMPACT_EVERY', '100'))
+# Suffix of the file whose mtime is an object's most recent upload
+SEEN_SUFFIX = '.seen'
+
+
+@dataclass
+class StoredObject:
+    content_hash: str
+    path: str
+    size: int
+    deduplicated: bool
+
+
+class ContentStore:
+    """Sharded, deduplicating store for uploaded files."""
+
+    def __init__(self, root: str = CAS_DIR, extension: str = '.pdf'):
+        self.root = root
+        self.extension = extension
+        self._objects_dir = os.path.join(root, 'objects')
+        self._tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._puts_since_compaction = 0
+        self._compaction_lock = threading.Lock()
+
+    def object_path(self, content_hash: str) -> str:
+        return os.path.join(self._objects_dir, content_hash[:2], content_hash[2:4], content_hash + self.extension)
+
+    def put_bytes(self, data: bytes) -> StoredObject:
+        """Store data unless identical content is already present."""
+        content_hash = hashlib.sha256(data).hexdigest()
+        for attempt in range(3):
+            try:
+                stored = self._put(content_hash, data)
+                break
+            except FileNotFoundError:
+                # A compaction removed the object or its shard directory meanwhile; store it again
+                if attempt == 2:
+                    raise
+
+        if not stored.deduplicated:
+            self._count_put()
+        return stored
+
+    def _put(self, content_hash: str, data: bytes) -> StoredObject:
+        path = self.object_path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Retention counts from the most recent upload; marked first, so a compaction
+        # starting now leaves the object alone
+        seen_path = path + SEEN_SUFFIX
+        with open(seen_path, 'a'):
+            pass
+        os.utime(seen_path)
+        if os.path.exists(path):
+            return StoredObject(content_hash, path, len(data), deduplicated=True)
+
+        tmp_path = os.path.join(self._tmp_dir, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fchmod(f.fileno(), 0o444)
+            os.fsync(f.fileno())
+        try:
+            # link() refuses to overwrite, so concurrent identical uploads settle on one object
+            os.link(tmp_path, path)
+            deduplicated = False
+        except FileExistsError:
+            deduplicated = True
+        finally:
+            os.unlink(tmp_path)
+        return StoredObject(content_hash, path, len(data), deduplicated=deduplicated)
+
+    def _count_put(self):
+        self._puts_since_compaction += 1
+        if COMPACT_EVERY and self._puts_since_compaction >= COMPACT_EVERY:
+            self._puts_since_compaction = 0
+            threading.Thread(target=self.compact, name="content-store-compaction", daemon=True).start()
+
+    def checkout(self, content_hash: str, target_dir: str, filename: str, data: Optional[bytes] = None) -> str:
+        """Create a working copy of an object in target_dir and return its path.
+
+        The copy is a hard link when target_dir is on the same filesystem, otherwise
+        a real copy (which then doesn't count as a reference).
+
+        A compaction (possibly in another worker) may remove an unreferenced object
+        between put_bytes() and checkout(); given the object's data, checkout stores
+        it again, otherwise it raises FileNotFoundError.
+        """
+        os.makedirs(target_dir, exist_ok=True)
+        object_path = self.object_path(content_hash)
+        tmp_link = os.path.join(self._tmp_dir, uuid.uuid4().hex)
+        for attempt in range(2):
+            try:
+                os.link(object_path, tmp_link)
+                break
+            except FileNotFoundError:
+                if data is None or attempt:
+                    raise
+                # Compacted away since it was stored; once linked, compaction leaves it alone
+                self.put_bytes(data)
+            except OSError:
+                # Another filesystem (or no hard links); a removed object still fails here
+                shutil.copyfile(object_path, tmp_link)
+                break
+        # place_file picks a free name and handles a target on another filesystem
+        return place_file(tmp_link, target_dir, filename)
+
+    def reference_count(self, content_hash: str) -> int:
+        """Number of working copies linked to an object (0 if none or not stored)."""
+        try:
+            return os.stat(self.object_path(content_hash)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def compact(self, retention_days: Optional[float] = None) -> Dict[str, int]:
+        """Remove unreferenced objects older than the retention period and empty shard directories."""
+        retention_days = RETENTION_DAYS if retention_days is None else retention_days
+        cutoff = time.time() - retention_days * 86400
+        stats = {"objects_scanned": 0, "objects_removed": 0, "bytes_freed": 0, "dirs_removed": 0}
+        if not self._compaction_lock.acquire(blocking=False):
+            return stats  # Another compaction is already running
+        try:
+            for shard_path, _dirs, files in os.walk(self._objects_dir, topdown=False):
+                for name in files:
+                    path = os.path.join(shard_path, name)
+                    if name.endswith(SEEN_SUFFIX):
+                        # The object was removed (by us or an earlier, interrupted compaction)
+                        if not os.path.exists(path[:-len(SEEN_SUFFIX)]):
+                            _remove_if_older(path, cutoff)
+                        continue
+                    stats["objects_scanned"] += 1
+                    try:
+                        st = os.stat(path)
+                        if st.st_nlink > 1 or _last_put(path, st) >= cutoff:
+                            continue
+                        os.unlink(path)
+                        stats["objects_removed"] += 1
+                        stats["bytes_freed"] += st.st_size
+                    except FileNotFoundError:
+                        continue
+                    _remove_if_older(path + SEEN_SUFFIX, cutoff)
+                if shard_path != self._objects_dir:
+                    try:
+                        os.rmdir(shard_path)  # Only succeeds if the shard is now empty
+                        stats["dirs_removed"] += 1
+                    except OSError:
+                        pass
+            # Leftovers from interrupted uploads
+            for name in os.listdir(self._tmp_dir):
+                path = os.path.join(self._tmp_dir, name)
+                try:
+                    if os.stat(path).st_mtime < time.time() - 3600:
+                        os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        finally:
+            self._compaction_lock.release()
+        print(f"Content store compaction finished: {stats}")
+        return stats
+
+
+def _last_put(path: str, st: os.stat_result) -> float:
+    """When the object was last uploaded; objects stored before there were sidecars go by their mtime."""
+    try:
+        return os.stat(path + SEEN_SUFFIX).st_mtime
+    except FileNotFoundError:
+        return st.st_mtime
+
+
+def _remove_if_older(path: str, cutoff: float):
+    try:
+        # Not if an upload of the same content just marked it again
+        if os.stat(path).st_mtime < cutoff:
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+_content_store: Optional[ContentStore] = None
+
+
+def get_content_store() -> ContentStore:
+    """Get the shared content store, creating its directories on first use."""
+    global _content_store
+    if _content_store is None:
+        _content_store = ContentStore()
+    return _content_store
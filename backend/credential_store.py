@@ -0,0 +1,89 @@
+"""
+Google OAuth token storage for Scout App backend.
+
+Tokens are stored per user. The default user keeps the original token.json
+next to the backend; every other user has <user id>.json under
+SCOUT_TOKEN_DIR. User IDs are limited to letters, digits and '_.@-' so they
+are safe as file names.
+
+Token files are shared by every worker process. Reads take a shared lock and
+writes replace the file atomically under an exclusive one, so a worker never
+reads a token another worker is halfway through writing. Refreshing happens
+under the exclusive lock too, and re-reads the file first: when several
+workers find the access token expired at the same moment, the first one
+refreshes it and the others pick up its result instead of spending the
+refresh token again.
+"""
+
+import json
+import os
+import re
+from typing import Any, Callable, Dict, Optional
+
+from shared_state import atomic_write, file_lock
+
+DEFAULT_USER = 'default'
+# Path to store the default user's access and refresh tokens
+TOKEN_FILE = os.getenv('SCOUT_TOKEN_FILE', os.path.join(os.path.dirname(__file__), 'token.json'))
+# Directory for the tokens of all other users
+TOKEN_DIR = os.getenv('SCOUT_TOKEN_DIR', 'local_storage/tokens')
+
+_USER_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.@-]{0,127}')
+
+
+def valid_user_id(user_id: str) -> bool:
+    return bool(_USER_ID.fullmatch(user_id or ''))
+
+
+def token_path(user_id: str = DEFAULT_USER) -> str:
+    """Where the user's token is stored; raises ValueError for an unusable user ID."""
+    if user_id == DEFAULT_USER:
+        return TOKEN_FILE
+    if not valid_user_id(user_id):
+        raise ValueError(f"Invalid user ID: {user_id!r}")
+    return os.path.join(TOKEN_DIR, f"{user_id}.json")
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as token:
+            return json.load(token)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read stored token from {path}: {e}")
+        return None
+
+
+def load_token(user_id: str = DEFAULT_USER) -> Optional[Dict[str, Any]]:
+    """The user's stored authorized-user info, or None when there is none (or it is unreadable)."""
+    path = token_path(user_id)
+    with file_lock(path, shared=True):
+        return _read(path)
+
+
+def save_token(token_json: str, user_id: str = DEFAULT_USER):
+    """Store authorized-user info (Credentials.to_json()), replacing the file atomically."""
+    path = token_path(user_id)
+    with file_lock(path):
+        atomic_write(path, token_json)
+
+
+def refresh_token(is_stale: Callable[[Dict[str, Any]], bool],
+                  refresh: Callable[[Dict[str, Any]], str],
+                  user_id: str = DEFAULT_USER) -> Optional[Dict[str, Any]]:
+    """Refresh the user's stored token once across workers.
+
+    Under the exclusive lock, re-reads the file. If is_stale says the stored
+    token still needs refreshing, refresh(info) must return the new token JSON,
+    which is saved. Returns the token info that is current afterwards.
+    """
+    path = token_path(user_id)
+    with file_lock(path):
+        info = _read(path)
+        if info is None or not is_stale(info):
+            return info  # Gone, or another worker refreshed it while we waited
+        token_json = refresh(info)
+        atomic_write(path, token_json)
+        return json.loads(token_json)
+
@@ -0,0 +1,354 @@
+"""
+Local document-type classifier for Scout App backend.
+
+Much of what arrives is the same kind of document every month: the same
+utility bill, payslip or insurance letter. From every document the agents
+filed successfully, the classifier learns which folder it went to and what
+its new name looked like with the dates taken out (its filename template,
+e.g. 'Stadtwerke_Invoice_{year}-{month}.pdf'). A multinomial naive Bayes
+model over the hashed features of folder_matcher scores a new document
+against every (folder, template) pair seen so far. When the best pair is
+confident, has been seen often enough and its template can be filled in from
+a date in the document, the orchestrator files the document directly and
+skips the rename, folder and mover agents.
+
+Naive Bayes posteriors over thousands of correlated features are always
+0 or 1, so the log-likelihoods are averaged per feature and scaled by
+SCOUT_CLASSIFIER_SHARPNESS before they are turned into probabilities. A
+baseline 'unknown type', SCOUT_CLASSIFIER_MIN_FIT nats per feature better than
+chance, competes with the learned types, so a document unlike any of them
+isn't handed to the closest one.
+Only results of the agents train the model; its own predictions don't, so a
+wrong prediction can't reinforce itself.
+
+Like the folder matcher, the saved state is merged across worker processes:
+each worker saves only what it learned since its last save, on top of the
+current file, and reloads the file when another worker has saved.
+"""
+
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from folder_matcher import (FEATURE_DIM, SparseRows, add_sparse, empty_sparse, hash_features,
+                            load_sparse_rows, sparse_state)
+from shared_state import DebouncedSave, file_lock, file_version
+
+CLASSIFIER_ENABLED = os.getenv('SCOUT_CLASSIFIER', 'true').lower() == 'true'
+# Minimum posterior probability for filing a document without the agents
+MIN_CONFIDENCE = float(os.getenv('SCOUT_CLASSIFIER_MIN_CONFIDENCE', '0.9'))
+# A (folder, template) pair needs this many agent-filed documents before it is predicted
+MIN_EXAMPLES = int(os.getenv('SCOUT_CLASSIFIER_MIN_EXAMPLES', '2'))
+SHARPNESS = float(os.getenv('SCOUT_CLASSIFIER_SHARPNESS', '10'))
+# How much better per feature (in nats) than chance a type must explain a document to match at all;
+# ordinary text shares enough common words and trigrams with any type to score somewhat above chance
+MIN_FIT = float(os.getenv('SCOUT_CLASSIFIER_MIN_FIT', '1.5'))
+STATE_FILE = os.getenv('SCOUT_CLASSIFIER_PATH', 'local_storage/document_classifier.npz')
+# Laplace smoothing of the per-feature counts
+ALPHA = 0.1
+# Characters of document text used as features
+MAX_TEXT_CHARS = 6000
+
+MONTHS = {
+    'en': ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+           'August', 'September', 'October', 'November', 'December'],
+    'de': ['Januar', 'Februar', 'März', 'April', 'Mai', 'Juni', 'Juli',
+           'August', 'September', 'Oktober', 'November', 'Dezember'],
+}
+_MONTH_NUMBER = {name.lower(): i + 1 for names in MONTHS.values() for i, name in enumerate(names)}
+_GERMAN_ONLY_MONTHS = {name.lower() for name in MONTHS['de']} - {name.lower() for name in MONTHS['en']}
+_MONTH_NAMES = '|'.join(sorted(_MONTH_NUMBER, key=len, reverse=True))
+
+_YEAR = r'(?:19|20)\d\d'
+_MM = r'(?:0[1-9]|1[0-2])'
+_DD = r'(?:0[1-9]|[12]\d|3[01])'
+# Date parts of file names, most specific first, with the placeholders they become
+_NAME_DATE_PATTERNS = [
+    (re.compile(rf'(?<!\d)({_YEAR})([-_.]?)({_MM})\2({_DD})(?!\d)'), r'{year}\2{month}\2{day}'),
+    (re.compile(rf'(?<!\d)({_DD})([-_.])({_MM})\2({_YEAR})(?!\d)'), r'{day}\2{month}\2{year}'),
+    (re.compile(rf'(?<!\d)({_YEAR})([-_.])({_MM})(?!\d)'), r'{year}\2{month}'),
+    (re.compile(rf'(?<!\d)({_MM})([-_.])({_YEAR})(?!\d)'), r'{month}\2{year}'),
+    (re.compile(rf'(?<!\d)({_YEAR})(?!\d)'), r'{year}'),
+]
+_NAME_MONTH = re.compile(rf'(?<![^\W\d_])({_MONTH_NAMES})(?![^\W\d_])', re.IGNORECASE)
+# A run of digits left in a template (an invoice or customer number) would be copied wrongly
+_LEFTOVER_NUMBER = re.compile(r'\d{3,}')
+_PLACEHOLDER = re.compile(r'\{(year|month|day|month_name_en|month_name_de)\}')
+
+# Dates in document text: 2024-03-15, 15.03.2024, 15 March 2024, March 2024
+_TEXT_DATE_PATTERNS = [
+    (re.compile(rf'(?<!\d)({_YEAR})-({_MM})-({_DD})(?!\d)'), ('year', 'month', 'day')),
+    (re.compile(rf'(?<!\d)(\d{{1,2}})\.(\d{{1,2}})\.({_YEAR})(?!\d)'), ('day', 'month', 'year')),
+    (re.compile(rf'(?<!\d)(\d{{1,2}})\.?\s+({_MONTH_NAMES})\s+({_YEAR})(?!\d)', re.IGNORECASE), ('day', 'month', 'year')),
+    (re.compile(rf'(?<![^\W\d_])({_MONTH_NAMES})\s+({_YEAR})(?!\d)', re.IGNORECASE), ('month', 'year')),
+]
+
+
+def filename_template(filename: str) -> Optional[str]:
+    """Replace the dates in filename with placeholders; None if the rest isn't reusable."""
+    if '{' in filename or '}' in filename:
+        return None
+    stem, ext = os.path.splitext(filename)
+    for pattern, replacement in _NAME_DATE_PATTERNS:
+        stem = pattern.sub(replacement, stem)
+    stem = _NAME_MONTH.sub(
+        lambda match: '{month_name_de}' if match.group(1).lower() in _GERMAN_ONLY_MONTHS else '{month_name_en}', stem)
+    if _LEFTOVER_NUMBER.search(stem):
+        return None
+    return stem + ext
+
+
+def find_document_date(text: str) -> Optional[Dict[str, int]]:
+    """The first date mentioned in text, as year/month(/day)."""
+    best: Optional[Tuple[int, Dict[str, int]]] = None
+    for pattern, fields in _TEXT_DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            if best is not None and match.start() >= best[0]:
+                break
+            values = {}
+            for field, value in zip(fields, match.groups()):
+                values[field] = _MONTH_NUMBER[value.lower()] if field == 'month' and not value.isdigit() else int(value)
+            if 1 <= values['month'] <= 12 and 1 <= values.get('day', 1) <= 31:
+                best = (match.start(), values)
+                break
+    return best[1] if best else None
+
+
+def fill_template(template: str, text: str) -> Optional[str]:
+    """Fill template's date placeholders from the first date in text; None if it can't be filled."""
+    fields = set(_PLACEHOLDER.findall(template))
+    if not fields:
+        return template
+    date = find_document_date(text)
+    if date is None or ('day' in fields and 'day' not in date):
+        return None
+    values = {
+        'year': f"{date['year']:04d}",
+        'month': f"{date['month']:02d}",
+        'day': f"{date.get('day', 1):02d}",
+        'month_name_en': MONTHS['en'][date['month'] - 1],
+        'month_name_de': MONTHS['de'][date['month'] - 1],
+    }
+    return _PLACEHOLDER.sub(lambda match: values[match.group(1)], template)
+
+
+@dataclass
+class DocumentPrediction:
+    folder_name: str
+    folder_path: str
+    filename_template: Optional[str]
+    filename: Optional[str]
+    confidence: float
+    examples: int
+    confident: bool
+    reason: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class DocumentClassifier:
+    """Online multinomial naive Bayes over (folder, filename template) labels."""
+
+    def __init__(self, state_file: str = STATE_FILE):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._labels: List[Tuple[str, str]] = []
+        self._row: Dict[Tuple[str, str], int] = {}
+        self._doc_counts: List[int] = []
+        self._rows = SparseRows()
+        # Total feature count of each label, for the smoothed likelihoods
+        self._totals: Optional[np.ndarray] = None
+        self._stats = {"predictions": 0, "confident": 0, "bypassed": 0, "agent_runs": 0,
+                       "agent_seconds": 0.0, "bypass_seconds": 0.0}
+        # What this process learned since it last saved: label -> (feature counts, documents)
+        self._pending: Dict[Tuple[str, str], Tuple[Tuple[np.ndarray, np.ndarray], int]] = {}
+        self._version = None
+        self._saver = DebouncedSave(self.save, "document classifier")
+        self._load()
+
+    def _load(self):
+        """Replace the in-memory model with the saved one plus what this process hasn't saved yet."""
+        self._version = file_version(self.state_file)
+        if self._version is None:
+            labels, rows, doc_counts = [], SparseRows(), []
+        else:
+            try:
+                with np.load(self.state_file, allow_pickle=False) as state:
+                    rows = load_sparse_rows(state)
+                    if rows is None:
+                        return  # Saved with a different feature size; start fresh
+                    labels = [(str(folder), str(template)) for folder, template in zip(state['folders'], state['templates'])]
+                    doc_counts = [int(n) for n in state['doc_counts']]
+            except Exception as e:
+                print(f"Could not load document classifier state from {self.state_file}: {e}")
+                return
+        self._labels, self._rows, self._doc_counts = labels, rows, doc_counts
+        self._row = {label: i for i, label in enumerate(self._labels)}
+        self._totals = None
+        for label, (delta, documents) in self._pending.items():
+            row = self._ensure_label(label)
+            self._rows.add(row, delta)
+            self._doc_counts[row] += documents
+
+    def _reload_if_changed(self):
+        # Another worker saved since we last loaded or saved
+        if file_version(self.state_file) != self._version:
+            self._load()
+
+    def save(self):
+        """Merge what this process learned into the state file."""
+        with self._lock, file_lock(self.state_file):
+            self._reload_if_changed()
+            os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+            tmp_path = f"{self.state_file}.tmp.npz"
+            np.savez_compressed(tmp_path, folders=np.array([folder for folder, _ in self._labels], dtype=str),
+                                templates=np.array([template for _, template in self._labels], dtype=str),
+                                doc_counts=np.array(self._doc_counts, dtype=np.int64),
+                                **sparse_state(self._rows))
+            os.replace(tmp_path, self.state_file)
+            self._pending.clear()
+            self._version = file_version(self.state_file)
+
+    def save_later(self):
+        """Save in the background shortly, together with whatever else is learned until then."""
+        self._saver.schedule()
+
+    def flush(self):
+        """Save now if a background save is pending."""
+        self._saver.flush()
+
+    def _ensure_label(self, label: Tuple[str, str]) -> int:
+        row = self._row.get(label)
+        if row is None:
+            row = self._rows.append()
+            self._labels.append(label)
+            self._doc_counts.append(0)
+            self._row[label] = row
+            self._totals = None
+        return row
+
+    def learn(self, folder_path: str, filename: str, text: str):
+        """Add a document the agents filed to the (folder, template) it ended up with."""
+        # An unusable template is stored as '' so the folder still competes, but is never predicted
+        label = (os.path.abspath(folder_path), filename_template(filename) or '')
+        features = hash_features(text[:MAX_TEXT_CHARS])
+        with self._lock:
+            row = self._ensure_label(label)
+            self._rows.add(row, features)
+            self._doc_counts[row] += 1
+            self._totals = None
+            delta, documents = self._pending.get(label, (empty_sparse(), 0))
+            self._pending[label] = (add_sparse(delta, features), documents + 1)
+
+    def _label_totals(self) -> np.ndarray:
+        if self._totals is None:
+            self._totals = np.array([values.sum() for _, values in self._rows.rows], dtype=np.float64)
+        return self._totals
+
+    def predict(self, base_dir: str, text: str) -> Optional[DocumentPrediction]:
+        """Best (folder, template) under base_dir for text, or None when nothing was learned yet."""
+        base_dir = os.path.abspath(base_dir)
+        features, query = hash_features(text[:MAX_TEXT_CHARS])
+        with self._lock:
+            self._reload_if_changed()
+            prefix = base_dir + os.sep
+            candidates = [i for i, (folder, _) in enumerate(self._labels) if folder.startswith(prefix)]
+            if not candidates or not len(features):
+                return None
+            self._stats["predictions"] += 1
+            totals = self._label_totals()[candidates]
+            # Only the document's own features matter, so look those up in each candidate's sparse row
+            counts = np.array([self._rows.lookup(i, features) for i in candidates], dtype=np.float64)
+            log_probs = np.log((counts + ALPHA) / (totals[:, None] + ALPHA * FEATURE_DIM))
+            doc_counts = np.array([self._doc_counts[i] for i in candidates], dtype=np.float64)
+            # Per-feature average keeps the posterior from collapsing to 0/1 on long documents
+            average = (log_probs @ query) / query.sum()
+            # The 'unknown type' baseline keeps documents unlike anything seen so far
+            # from going to the closest known type by default
+            doc_counts = np.append(doc_counts, 1.0)
+            average = np.append(average, -np.log(FEATURE_DIM) + MIN_FIT)
+            logits = np.log(doc_counts / doc_counts.sum()) + SHARPNESS * average
+            posterior = np.exp(logits - logits.max())
+            posterior /= posterior.sum()
+            best = int(np.argmax(posterior[:-1]))
+            unknown = float(posterior[-1])
+            folder_path, template = self._labels[candidates[best]]
+            examples = self._doc_counts[candidates[best]]
+
+        confidence = float(posterior[best])
+        filename = fill_template(template, text) if template else None
+        if unknown > confidence:
+            reason = f"no known document type matches (closest: confidence {confidence:.2f})"
+        elif confidence < MIN_CONFIDENCE:
+            reason = f"confidence {confidence:.2f} below {MIN_CONFIDENCE}"
+        elif examples < MIN_EXAMPLES:
+            reason = f"only {examples} example(s) of this document type"
+        elif not template:
+            reason = "file names of this document type have no reusable template"
+        elif filename is None:
+            reason = f"no date in the document to fill in '{template}'"
+        elif not os.path.isdir(folder_path):
+            reason = f"folder '{folder_path}' no longer exists"
+        else:
+            reason = f"matches {examples} earlier document(s) with confidence {confidence:.2f}"
+        confident = reason.startswith("matches")
+        if confident:
+            with self._lock:
+                self._stats["confident"] += 1
+        return DocumentPrediction(
+            folder_name=os.path.basename(folder_path), folder_path=folder_path,
+            filename_template=template or None, filename=filename,
+            confidence=round(confidence, 4), examples=examples, confident=confident, reason=reason,
+        )
+
+    def record_agent_path(self, seconds: float):
+        """Record how long the rename, folder and mover agents took for a document."""
+        with self._lock:
+            self._stats["agent_runs"] += 1
+            self._stats["agent_seconds"] += seconds
+
+    def record_bypass(self, seconds: float):
+        """Record a document filed from a prediction, and how long that took."""
+        with self._lock:
+            self._stats["bypassed"] += 1
+            self._stats["bypass_seconds"] += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            labels = len(self._labels)
+            documents = sum(self._doc_counts)
+        mean_agent = stats["agent_seconds"] / stats["agent_runs"] if stats["agent_runs"] else None
+        mean_bypass = stats["bypass_seconds"] / stats["bypassed"] if stats["bypassed"] else None
+        saved = (mean_agent - mean_bypass) * stats["bypassed"] if mean_agent is not None and mean_bypass is not None else None
+        return {
+            "document_types": labels,
+            "trained_documents": documents,
+            "predictions": stats["predictions"],
+            "confident": stats["confident"],
+            "bypassed": stats["bypassed"],
+            "hit_rate": round(stats["bypassed"] / stats["predictions"], 4) if stats["predictions"] else None,
+            "mean_agent_path_seconds": round(mean_agent, 3) if mean_agent is not None else None,
+            "mean_bypass_seconds": round(mean_bypass, 4) if mean_bypass is not None else None,
+            "estimated_seconds_saved": round(saved, 3) if saved is not None else None,
+        }
+
+
+_classifier: Optional[DocumentClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_document_classifier() -> Optional[DocumentClassifier]:
+    """Get the process-wide classifier, loading saved state on first use; None when disabled."""
+    global _classifier
+    if not CLASSIFIER_ENABLED:
+        return None
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = DocumentClassifier()
+        return _classifier
@@ -0,0 +1,259 @@
+"""
+Async Google Drive v3 client for Scout App backend.
+
+The Drive tools used to go through googleapiclient, whose blocking
+`.execute()` calls tie up a thread per request. This client talks to the
+Drive REST API directly over a single pooled httpx connection (HTTP/2 when
+the `h2` package is available), so many Drive operations can be in flight
+from one event loop.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from google_drive_auth import DEFAULT_USER, get_drive_credentials
+from metrics import span
+
+DRIVE_API_URL = "https://www.googleapis.com/drive/v3"
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+try:
+    import h2  # noqa: F401  (only needed so httpx can negotiate HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class DriveAPIError(Exception):
+    """Raised when the Drive API answers with a non-success status code."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Drive API error {status_code}: {message}")
+        self.status_code = status_code
+
+
+def create_http_client(max_connections: int = 20, max_keepalive_connections: int = 10,
+                       keepalive_expiry: float = 60.0, timeout: float = 30.0) -> httpx.AsyncClient:
+    """The pooled HTTP client for Drive API requests."""
+    return httpx.AsyncClient(
+        base_url=DRIVE_API_URL,
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(timeout),
+    )
+
+
+class AsyncDriveClient:
+    """Minimal async Drive v3 client covering the operations our tools use."""
+
+    def __init__(self, user_id: str = DEFAULT_USER, http: Optional[httpx.AsyncClient] = None,
+                 load_credentials: Optional[Callable[[bool], Any]] = None):
+        """
+        Args:
+            user_id: Whose Drive to act on.
+            http: Shared HTTP client; the client creates (and closes) its own when omitted.
+            load_credentials: Blocking callable returning the user's credentials, or None
+                when they need to authenticate; its argument asks for a reload after a 401.
+        """
+        self.user_id = user_id
+        self._owns_http = http is None
+        self._http = http or create_http_client()
+        self._load_credentials = load_credentials or (lambda force_refresh: get_drive_credentials(user_id))
+        self._creds = None
+        self._creds_lock = asyncio.Lock()
+        # Memo of resolved folder paths: (root_id, 'Finance', 'Invoices') -> folder ID
+        self._folder_path_memo: Dict[Tuple[str, ...], str] = {}
+        # Locks of the prefixes being resolved right now, and how many calls are using each
+        self._folder_path_locks: Dict[Tuple[str, ...], asyncio.Lock] = {}
+        self._folder_path_lock_users: Dict[Tuple[str, ...], int] = {}
+
+    async def _get_token(self, force_refresh: bool = False) -> str:
+        """Return a valid access token, loading/refreshing credentials off the event loop."""
+        async with self._creds_lock:
+            if force_refresh or not self._creds or not self._creds.valid:
+                # Loading and refreshing credentials is blocking I/O
+                self._creds = await asyncio.to_thread(self._load_credentials, force_refresh)
+            if not self._creds:
+                raise Exception("Could not obtain Google Drive credentials. User might not be authenticated.")
+            return self._creds.token
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        with span(f"drive.{method.lower()}"):
+            return await self._send(method, url, **kwargs)
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        token = await self._get_token()
+        response = await self._http.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            # The token may have been revoked or expired server-side; retry once with fresh credentials
+            token = await self._get_token(force_refresh=True)
+            response = await self._http.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code >= 400:
+            raise DriveAPIError(response.status_code, response.text)
+        return response
+
+    async def get_file(self, file_id: str, fields: str = "id, name, mimeType") -> Dict[str, Any]:
+        """Fetch metadata for a single file."""
+        response = await self._request("GET", f"/files/{file_id}", params={"fields": fields})
+        return response.json()
+
+    async def create_folder(self, name: str, parent_id: Optional[str] = None,
+                            fields: str = "id, name") -> Dict[str, Any]:
+        """Create a folder, optionally under a parent folder."""
+        metadata: Dict[str, Any] = {"name": name, "mimeType": FOLDER_MIME_TYPE}
+        if parent_id:
+            metadata["parents"] = [parent_id]
+        response = await self._request("POST", "/files", params={"fields": fields}, json=metadata)
+        return response.json()
+
+    async def update_file(self, file_id: str, body: Optional[Dict[str, Any]] = None,
+                          add_parents: Optional[str] = None, remove_parents: Optional[str] = None,
+                          fields: str = "id, name, parents") -> Dict[str, Any]:
+        """Update file metadata and/or parentage (used for rename and move)."""
+        params = {"fields": fields}
+        if add_parents:
+            params["addParents"] = add_parents
+        if remove_parents:
+            params["removeParents"] = remove_parents
+        response = await self._request("PATCH", f"/files/{file_id}", params=params, json=body or {})
+        return response.json()
+
+    async def list_files(self, query: str, fields: str = "nextPageToken, files(id, name)",
+                         spaces: str = "drive") -> List[Dict[str, Any]]:
+        """List all files matching a Drive query, following pagination."""
+        files: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            params = {"q": query, "spaces": spaces, "fields": fields}
+            if page_token:
+                params["pageToken"] = page_token
+            response = await self._request("GET", "/files", params=params)
+            payload = response.json()
+            files.extend(payload.get("files", []))
+            page_token = payload.get("nextPageToken")
+            if not page_token:
+                return files
+
+    async def export_media(self, file_id: str, mime_type: str) -> bytes:
+        """Export a Google Workspace document to the given MIME type."""
+        response = await self._request("GET", f"/files/{file_id}/export", params={"mimeType": mime_type})
+        return response.content
+
+    async def download_media(self, file_id: str) -> bytes:
+        """Download the binary content of a file."""
+        response = await self._request("GET", f"/files/{file_id}", params={"alt": "media"})
+        return response.content
+
+    async def find_folder(self, name: str, parent_id: str) -> Optional[Dict[str, Any]]:
+        """Find a non-trashed folder with exactly this name directly under parent_id."""
+        query = (f"mimeType='{FOLDER_MIME_TYPE}' and name = '{escape_query_value(name)}' "
+                 f"and '{escape_query_value(parent_id)}' in parents and trashed=false")
+        matches = await self.list_files(query, fields="nextPageToken, files(id, name, createdTime)")
+        if not matches:
+            return None
+        # Prefer the oldest folder so every caller converges on the same one if duplicates exist
+        return min(matches, key=lambda folder: folder.get("createdTime", ""))
+
+    async def ensure_folder_path(self, path: str, root_id: str = "root") -> str:
+        """Resolve a folder path like 'Finance/Invoices/2026', creating missing folders.
+
+        Resolved path prefixes are memoized, so repeated calls for hot paths cost no
+        round-trips, and concurrent calls for the same prefix wait on one lookup
+        instead of creating duplicate folders. If Drive no longer has a memoized
+        folder (404), the path is forgotten and resolved once more from the root.
+
+        Args:
+            path: Slash-separated folder path relative to root_id.
+            root_id: ID of the folder the path starts from ('root' is My Drive).
+
+        Returns:
+            The ID of the last folder in the path.
+        """
+        segments = [segment.strip() for segment in path.split("/") if segment.strip()]
+        if not segments:
+            raise ValueError("Folder path cannot be empty.")
+
+        try:
+            return await self._resolve_folder_path(segments, root_id)
+        except DriveAPIError as e:
+            if e.status_code != 404:
+                raise
+            # A memoized folder was deleted in Drive, so none along the path can be trusted
+            self.forget_folder_path(path, root_id=root_id)
+            return await self._resolve_folder_path(segments, root_id)
+
+    async def _resolve_folder_path(self, segments: List[str], root_id: str) -> str:
+        parent_id = root_id
+        parent_was_created = False
+        key: Tuple[str, ...] = (root_id,)
+        for segment in segments:
+            key = key + (segment,)
+            folder_id = self._folder_path_memo.get(key)
+            if folder_id:
+                parent_id, parent_was_created = folder_id, False
+                continue
+
+            lock = self._folder_path_locks.setdefault(key, asyncio.Lock())
+            self._folder_path_lock_users[key] = self._folder_path_lock_users.get(key, 0) + 1
+            try:
+                async with lock:
+                    # Another task may have resolved this prefix while we were waiting
+                    folder_id = self._folder_path_memo.get(key)
+                    created = False
+                    if not folder_id:
+                        # A folder we just created cannot have children yet, so skip the lookup
+                        existing = None if parent_was_created else await self.find_folder(segment, parent_id)
+                        if existing:
+                            folder_id = existing["id"]
+                        else:
+                            folder_id = (await self.create_folder(segment, parent_id=parent_id))["id"]
+                            created = True
+                        self._folder_path_memo[key] = folder_id
+            finally:
+                # Once nobody waits on it, the memo answers later calls and the lock can go
+                users = self._folder_path_lock_users.pop(key) - 1
+                if users:
+                    self._folder_path_lock_users[key] = users
+                else:
+                    del self._folder_path_locks[key]
+            parent_id, parent_was_created = folder_id, created
+        return parent_id
+
+    def forget_folder_path(self, path: str, root_id: str = "root"):
+        """Drop memoized entries for a path, its ancestors and everything below it.
+
+        Used after Drive returned 404 for the path: any folder along it may be the
+        one that was deleted, so none of the memoized IDs along it can be trusted.
+        """
+        path_key = (root_id,) + tuple(segment.strip() for segment in path.split("/") if segment.strip())
+        for key in list(self._folder_path_memo):
+            # key is an ancestor of the path (or the path itself), or lies below it
+            if path_key[:len(key)] == key or key[:len(path_key)] == path_key:
+                del self._folder_path_memo[key]
+
+    async def aclose(self):
+        if self._owns_http:
+            await self._http.aclose()
+
+
+def escape_query_value(value: str) -> str:
+    """Escape a value for use inside a single-quoted Drive query string."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def get_async_drive_client(user_id: Optional[str] = None) -> AsyncDriveClient:
+    """Get the async Drive client of user_id (default: the current request's Drive user)."""
+    from drive_pool import get_drive_pool
+    return get_drive_pool().session(user_id).drive
+
+
+async def close_async_drive_client():
+    """Close the shared connection pool (called on app shutdown)."""
+    from drive_pool import close_drive_pool
+    await close_drive_pool()
@@ -0,0 +1,205 @@
+"""
+Per-user Google Drive sessions for Scout App backend.
+
+Loading a user's token takes file I/O and building a googleapiclient
+service parses the Drive discovery document, so neither should happen on
+every request. The pool keeps a DriveSession per recently active user, up
+to SCOUT_DRIVE_POOL_SIZE, evicting the least recently used. A session
+holds the user's credentials, their Drive API service (built on first use)
+and their AsyncDriveClient; all users' async clients share one HTTP
+connection pool.
+
+A background thread refreshes pooled credentials that expire within
+SCOUT_DRIVE_REFRESH_MARGIN seconds. The session's credentials object is
+updated in place, so the service and the async client built on it keep
+working, and requests for a warm user find a valid token without loading or
+refreshing anything.
+
+The Drive user of a request comes from its verified session (see
+auth_sessions; requests without one act for the 'default' user) and is kept
+in a context variable, so the Drive tools pick up the right client without
+passing the user around.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from credential_store import DEFAULT_USER, valid_user_id
+from drive_client import AsyncDriveClient, create_http_client
+from google_drive_auth import build_drive_service, expires_within, get_drive_credentials
+
+# Users whose sessions are kept ready
+POOL_SIZE = int(os.getenv('SCOUT_DRIVE_POOL_SIZE', '32'))
+# Refresh tokens that expire within this many seconds, checking every REFRESH_INTERVAL seconds
+REFRESH_MARGIN = float(os.getenv('SCOUT_DRIVE_REFRESH_MARGIN', '300'))
+REFRESH_INTERVAL = float(os.getenv('SCOUT_DRIVE_REFRESH_INTERVAL', '60'))
+
+_current_user: contextvars.ContextVar[str] = contextvars.ContextVar('drive_user', default=DEFAULT_USER)
+
+
+def set_drive_user(user_id: Optional[str]) -> str:
+    """Make user_id the Drive user of the current request; raises ValueError if it's not a valid ID."""
+    user_id = user_id or DEFAULT_USER
+    if not valid_user_id(user_id):
+        raise ValueError(f"Invalid user ID: {user_id!r}")
+    _current_user.set(user_id)
+    return user_id
+
+
+def current_drive_user() -> str:
+    return _current_user.get()
+
+
+class DriveSession:
+    """One user's credentials, Drive API service and async Drive client."""
+
+    def __init__(self, user_id: str, http):
+        self.user_id = user_id
+        self.credentials = None
+        self._service = None
+        self._lock = threading.Lock()
+        self.drive = AsyncDriveClient(user_id, http=http, load_credentials=self.load_credentials)
+        self.last_used = time.monotonic()
+
+    def load_credentials(self, force_refresh: bool = False, min_valid_seconds: float = 0):
+        """The session's credentials, (re)loaded from the store when missing, invalid or forced.
+
+        Returns None when the user needs to authenticate.
+        """
+        with self._lock:
+            creds = self.credentials
+            if creds is not None and not force_refresh and not expires_within(creds, min_valid_seconds):
+                return creds
+            fresh = get_drive_credentials(self.user_id, min_valid_seconds)
+            if fresh is None or creds is None or fresh.refresh_token != creds.refresh_token:
+                # First load, lost access, or a new grant: start over with these credentials
+                self.credentials, self._service = fresh, None
+            else:
+                # Update in place so the service and async client built on them see the new token
+                creds.token, creds.expiry = fresh.token, fresh.expiry
+            return self.credentials
+
+    @property
+    def warm(self) -> bool:
+        return self.credentials is not None and self.credentials.valid
+
+    def cached_service(self):
+        """The service if it is built and its credentials are valid, without any I/O; else None."""
+        return self._service if self.warm else None
+
+    def service(self):
+        """The user's Drive API service, or None when they need to authenticate."""
+        service = self.cached_service()
+        if service is not None:
+            return service
+        creds = self.load_credentials()
+        if creds is None:
+            return None
+        with self._lock:
+            if self._service is None:
+                self._service = build_drive_service(creds)
+            return self._service
+
+
+class DrivePool:
+    """LRU pool of DriveSessions with background token refresh."""
+
+    def __init__(self, max_users: int = POOL_SIZE, refresh_margin: float = REFRESH_MARGIN,
+                 refresh_interval: float = REFRESH_INTERVAL):
+        self.max_users = max(1, max_users)
+        self.refresh_margin = refresh_margin
+        self.refresh_interval = refresh_interval
+        self._sessions: "OrderedDict[str, DriveSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._http = create_http_client()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "refreshes": 0, "refresh_failures": 0}
+        self._stop = threading.Event()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="drive-token-refresh", daemon=True)
+        self._refresher.start()
+
+    def session(self, user_id: Optional[str] = None) -> DriveSession:
+        """The user's session (default: the current request's Drive user); creating one does no I/O."""
+        user_id = user_id or current_drive_user()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None:
+                self._sessions.move_to_end(user_id)
+                self._stats["hits" if session.warm else "misses"] += 1
+            else:
+                session = self._sessions[user_id] = DriveSession(user_id, self._http)
+                self._stats["misses"] += 1
+                while len(self._sessions) > self.max_users:
+                    # Requests still holding an evicted session can finish with it
+                    self._sessions.popitem(last=False)
+                    self._stats["evictions"] += 1
+            session.last_used = time.monotonic()
+            return session
+
+    async def get_service(self, user_id: Optional[str] = None):
+        """The user's Drive API service, loading credentials and building it off the event loop if needed."""
+        session = self.session(user_id)
+        service = session.cached_service()
+        return service if service is not None else await asyncio.to_thread(session.service)
+
+    def refresh_expiring(self):
+        """Refresh the pooled credentials that expire within the refresh margin."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            creds = session.credentials
+            if creds is None or not expires_within(creds, self.refresh_margin):
+                continue
+            try:
+                refreshed = session.load_credentials(min_valid_seconds=self.refresh_margin)
+            except Exception as e:
+                refreshed = None
+                print(f"Background token refresh for user {session.user_id} failed: {e}")
+            with self._lock:
+                self._stats["refreshes" if refreshed is not None else "refresh_failures"] += 1
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh_expiring()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "users": len(self._sessions), "max_users": self.max_users,
+                    "warm": sum(1 for session in self._sessions.values() if session.warm)}
+
+    async def aclose(self):
+        self._stop.set()
+        await self._http.aclose()
+
+
+_pool: Optional[DrivePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_drive_pool() -> DrivePool:
+    """Get the process-wide Drive session pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DrivePool()
+        return _pool
+
+
+def get_drive_pool_stats() -> Optional[Dict[str, Any]]:
+    """Pool counters, or None when no Drive request has been served yet."""
+    with _pool_lock:
+        pool = _pool
+    return pool.stats() if pool is not None else None
+
+
+async def close_drive_pool():
+    """Stop token refresh and close the shared connection pool (called on app shutdown)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        await pool.aclose()
@@ -0,0 +1,369 @@
+"""
+Deterministic offline model backend for Scout App backend.
+
+Selected with SCOUT_MODEL_PROVIDER=fake. FakeModel stands in for the OpenAI
+model behind every agent: it reads the orchestrator's task prompt, makes the
+tool calls the real agent is expected to make (so files really get read,
+renamed, filed and moved) and answers with a schema-valid final output. The
+vision tool's chat completions are answered by fake_chat_transport() the
+same way, so a whole upload runs without network access.
+
+Outputs depend only on the input and SCOUT_FAKE_SEED. Latency and errors are
+drawn from a seeded generator:
+
+- SCOUT_FAKE_LATENCY_MS: median simulated latency per model call (default 200)
+- SCOUT_FAKE_LATENCY_SPREAD: sigma of the log-normal latency distribution
+  (default 0.5; 0 makes every call take exactly the median)
+- SCOUT_FAKE_ERROR_RATE: fraction of calls failing with a 500 (default 0)
+- SCOUT_FAKE_RATE_LIMIT_RATE: fraction of calls failing with a 429 (default 0)
+"""
+
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from agents.agent_output import AgentOutputSchemaBase
+from agents.handoffs import Handoff
+from agents.items import ModelResponse, TResponseInputItem, TResponseStreamEvent
+from agents.model_settings import ModelSettings
+from agents.models.interface import Model, ModelProvider, ModelTracing
+from agents.tool import Tool
+from agents.usage import Usage
+from openai.types.responses import ResponseFunctionToolCall, ResponseOutputMessage, ResponseOutputText
+
+from document_classifier import find_document_date
+
+FAKE_SEED = int(os.getenv('SCOUT_FAKE_SEED', '0'))
+FAKE_LATENCY_MS = float(os.getenv('SCOUT_FAKE_LATENCY_MS', '200'))
+FAKE_LATENCY_SPREAD = float(os.getenv('SCOUT_FAKE_LATENCY_SPREAD', '0.5'))
+FAKE_ERROR_RATE = float(os.getenv('SCOUT_FAKE_ERROR_RATE', '0'))
+FAKE_RATE_LIMIT_RATE = float(os.getenv('SCOUT_FAKE_RATE_LIMIT_RATE', '0'))
+# Prompt tokens reported per image in a vision request
+FAKE_IMAGE_TOKENS = 765
+
+# Keyword -> folder used when filing documents; checked in order
+FOLDER_KEYWORDS = [
+    ('invoice', 'Invoices'),
+    ('receipt', 'Receipts'),
+    ('contract', 'Contracts'),
+    ('statement', 'Bank Statements'),
+    ('tax', 'Taxes'),
+    ('insurance', 'Insurance'),
+    ('report', 'Reports'),
+    ('letter', 'Letters'),
+]
+DEFAULT_FOLDERS = ['Documents', 'Archive', 'Correspondence', 'Records']
+
+
+class _FaultInjector:
+    """Seeded latency and error draws shared by the fake model and the fake vision endpoint."""
+
+    def __init__(self, seed: int):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.simulated_latency_s = 0.0
+
+    def draw(self) -> Tuple[float, Optional[int]]:
+        """Return (latency in seconds, HTTP error status or None) for one call."""
+        with self._lock:
+            self.calls += 1
+            latency = FAKE_LATENCY_MS / 1000
+            if FAKE_LATENCY_SPREAD > 0:
+                latency *= self._random.lognormvariate(0, FAKE_LATENCY_SPREAD)
+            self.simulated_latency_s += latency
+            roll = self._random.random()
+            if roll < FAKE_RATE_LIMIT_RATE:
+                self.rate_limited += 1
+                return latency, 429
+            if roll < FAKE_RATE_LIMIT_RATE + FAKE_ERROR_RATE:
+                self.errors += 1
+                return latency, 500
+            return latency, None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "simulated_latency_s": round(self.simulated_latency_s, 3),
+            }
+
+
+_faults = _FaultInjector(FAKE_SEED)
+
+
+def get_fake_model_stats() -> Dict[str, Any]:
+    """Call and error counters of the fake backend."""
+    return _faults.snapshot()
+
+
+def _error_response(status: int) -> httpx.Response:
+    request = httpx.Request("POST", "https://fake.invalid/v1/responses")
+    headers = {"retry-after": "1"} if status == 429 else {}
+    body = {"error": {"message": "Simulated rate limit" if status == 429 else "Simulated server error"}}
+    return httpx.Response(status, headers=headers, json=body, request=request)
+
+
+def _digest(*parts: Any) -> str:
+    text = json.dumps([FAKE_SEED, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _pick_folder(text: str, digest: str) -> str:
+    lowered = text.lower()
+    for keyword, folder in FOLDER_KEYWORDS:
+        if keyword in lowered:
+            return folder
+    return DEFAULT_FOLDERS[int(digest[:8], 16) % len(DEFAULT_FOLDERS)]
+
+
+def _first_match(patterns: List[str], text: str) -> Optional[str]:
+    for pattern in patterns:
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _parse_tool_output(output: str) -> Any:
+    """Function tools return str() of their result, so dicts and lists come back as Python literals."""
+    try:
+        return ast.literal_eval(output)
+    except (ValueError, SyntaxError):
+        return output
+
+
+def _synthesize(schema: Dict[str, Any], defs: Dict[str, Any]) -> Any:
+    """Build a minimal value that satisfies a (strict) JSON schema."""
+    if '$ref' in schema:
+        return _synthesize(defs.get(schema['$ref'].split('/')[-1], {}), defs)
+    for key in ('anyOf', 'oneOf'):
+        if key in schema:
+            # Optional fields (X | None) are left empty
+            if any(option.get('type') == 'null' for option in schema[key]):
+                return None
+            return _synthesize(schema[key][0], defs)
+    schema_type = schema.get('type')
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0]
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if schema_type == 'object' or 'properties' in schema:
+        return {name: _synthesize(prop, defs) for name, prop in schema.get('properties', {}).items()}
+    return {'string': 'fake', 'integer': 0, 'number': 0.0, 'boolean': False, 'array': [], 'null': None}.get(schema_type, 'fake')
+
+
+class FakeModel(Model):
+    """Offline stand-in for the agents' OpenAI model."""
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or 'fake'
+
+    async def get_response(
+        self,
+        system_instructions: Optional[str],
+        input: str | List[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: List[Tool],
+        output_schema: Optional[AgentOutputSchemaBase],
+        handoffs: List[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: Optional[str],
+    ) -> ModelResponse:
+        latency, error_status = _faults.draw()
+        await asyncio.sleep(latency)
+        if error_status == 429:
+            raise openai.RateLimitError("Simulated rate limit", response=_error_response(429), body=None)
+        if error_status:
+            raise openai.InternalServerError("Simulated server error", response=_error_response(500), body=None)
+
+        items = [{"role": "user", "content": input}] if isinstance(input, str) else list(input)
+        prompt = "\n".join(str(item.get('content')) for item in items
+                           if isinstance(item, dict) and item.get('role') == 'user')
+        outputs = self._tool_outputs(items)
+        digest = _digest(system_instructions, prompt, sorted(outputs.items()))
+        tool_names = {getattr(tool, 'name', None) for tool in tools}
+
+        calls, final = self._plan(prompt, outputs, tool_names, digest)
+        if calls:
+            output_items = [
+                ResponseFunctionToolCall(
+                    id=f"fc_{digest[:12]}_{i}",
+                    call_id=f"call_{digest[:12]}_{i}",
+                    name=name,
+                    arguments=json.dumps(arguments),
+                    type="function_call",
+                    status="completed",
+                )
+                for i, (name, arguments) in enumerate(calls)
+            ]
+            output_text = json.dumps(calls)
+        else:
+            output_text = self._final_text(final, output_schema)
+            output_items = [
+                ResponseOutputMessage(
+                    id=f"msg_{digest[:12]}",
+                    content=[ResponseOutputText(text=output_text, type="output_text", annotations=[])],
+                    role="assistant",
+                    status="completed",
+                    type="message",
+                )
+            ]
+
+        # Rough token counts (~4 characters per token) so usage accounting has something to add up
+        input_tokens = (len(system_instructions or '') + len(json.dumps(items, default=str))) // 4
+        output_tokens = len(output_text) // 4 + 1
+        usage = Usage(requests=1, input_tokens=input_tokens, output_tokens=output_tokens,
+                      total_tokens=input_tokens + output_tokens)
+        return ModelResponse(output=output_items, usage=usage, response_id=None)
+
+    async def stream_response(self, *args, **kwargs) -> AsyncIterator[TResponseStreamEvent]:
+        raise NotImplementedError("The fake model does not support streaming")
+        yield  # Makes this an async generator
+
+    @staticmethod
+    def _tool_outputs(items: List[Any]) -> Dict[str, str]:
+        """Outputs of earlier tool calls in this run, by tool name."""
+        names_by_call = {}
+        outputs: Dict[str, str] = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            if item.get('type') == 'function_call':
+                names_by_call[item.get('call_id')] = item.get('name')
+            elif item.get('type') == 'function_call_output':
+                name = names_by_call.get(item.get('call_id'))
+                if name:
+                    outputs[name] = str(item.get('output', ''))
+        return outputs
+
+    def _plan(self, prompt: str, outputs: Dict[str, str], tool_names: set, digest: str) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+        """Decide the next step: (tool calls to make, {}) or ([], final output fields)."""
+        if 'read_local_pdf' in tool_names:
+            file_path = _first_match([r"PDF file '([^']+)'"], prompt)
+            if not outputs and file_path:
+                calls = [('read_local_pdf', {'file_path': file_path})]
+                images_file = _first_match([r"file_path='([^']+)'"], prompt)
+                if images_file and 'analyze_pdf_images' in tool_names:
+                    calls.insert(0, ('analyze_pdf_images', {'file_path': images_file}))
+                return calls, {}
+            # Pages the orchestrator's vision stage analyzed come with the prompt
+            vision = outputs.get('analyze_pdf_images') or _first_match([r"(VISION ANALYSIS RESULTS:.*)"], prompt) or ''
+            text = f"{vision} {outputs.get('read_local_pdf', '')}"
+            text = " ".join(text.split())[:600]
+            name = os.path.basename(file_path or 'document.pdf')
+            return [], {'content': f"Document '{name}'. {text}".strip()}
+
+        if 'rename_local_file' in tool_names:
+            file_path = _first_match([r"at '([^']+)'\. Output only", r"file '([^']+\.pdf)'"], prompt)
+            context = _first_match([r"context \('(.*?)\.\.\.'\)"], prompt) or prompt
+            folder = _pick_folder(context, digest)
+            # Name by document type and, like a real model would, by the document's date when it has one
+            date = find_document_date(context)
+            suffix = f"{date['year']:04d}-{date['month']:02d}" if date else digest[:8]
+            new_filename = f"{folder.replace(' ', '_')}_{suffix}.pdf"
+            if 'rename_local_file' not in outputs and file_path:
+                return [('rename_local_file', {'current_file_path': file_path, 'new_filename': new_filename})], {}
+            renamed = outputs.get('rename_local_file', '')
+            return [], {'filename': os.path.basename(renamed) if renamed.endswith('.pdf') else new_filename}
+
+        if 'search_local_folders' in tool_names:
+            file_path = _first_match([r"local PDF file '([^']+)'"], prompt) or ''
+            base_path = os.path.dirname(file_path) or '.'
+            folder = _pick_folder(prompt, digest)
+            if 'search_local_folders' not in outputs:
+                return [('search_local_folders', {'base_path': base_path, 'folder_name_pattern': folder})], {}
+            found = _parse_tool_output(outputs['search_local_folders'])
+            if isinstance(found, list) and found:
+                return [], {'folder_name': os.path.basename(found[0]), 'folder_path': found[0]}
+            if 'create_local_folder' not in outputs and 'create_local_folder' in tool_names:
+                return [('create_local_folder', {'base_path': base_path, 'folder_name': folder})], {}
+            folder_path = outputs.get('create_local_folder') or os.path.join(base_path, folder)
+            return [], {'folder_name': os.path.basename(folder_path), 'folder_path': folder_path}
+
+        if 'move_local_file' in tool_names:
+            source = _first_match([r"from '([^']+)' into"], prompt)
+            target = _first_match([r"\(Path: '([^']+)'\)"], prompt)
+            if 'move_local_file' not in outputs and source and target:
+                return [('move_local_file', {'source_file_path': source, 'target_folder_path': target})], {}
+            result = _parse_tool_output(outputs.get('move_local_file', ''))
+            if isinstance(result, dict):
+                return [], result
+            return [], {'source_file_path': source or '', 'target_folder_path': target or '',
+                        'status': 'failure', 'error': 'Move was not attempted'}
+
+        return [], {}
+
+    @staticmethod
+    def _final_text(final: Dict[str, Any], output_schema: Optional[AgentOutputSchemaBase]) -> str:
+        if output_schema is None or output_schema.is_plain_text():
+            return (final.get('content') or json.dumps(final)) if final else "OK"
+        schema = output_schema.json_schema()
+        value = _synthesize(schema, schema.get('$defs', {}))
+        if isinstance(value, dict):
+            value.update({key: val for key, val in final.items() if key in value})
+        return json.dumps(value)
+
+
+class FakeModelProvider(ModelProvider):
+    """Hands out FakeModel for every model name."""
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        return FakeModel(model_name)
+
+
+async def _fake_chat_completion(request: httpx.Request) -> httpx.Response:
+    latency, error_status = _faults.draw()
+    await asyncio.sleep(latency)
+    if error_status:
+        response = _error_response(error_status)
+        return httpx.Response(error_status, headers=response.headers, content=response.content, request=request)
+
+    payload = json.loads(request.content or b'{}')
+    prompt = " ".join(part.get('text', '') for message in payload.get('messages', [])
+                      for part in (message.get('content') if isinstance(message.get('content'), list) else [])
+                      if isinstance(part, dict))
+    # Batched vision requests list their pages and expect one 'Page N:' section per page
+    pages = _first_match([r"Pages in this request: ([\d, ]+)"], prompt)
+    sections = []
+    for page in (pages.replace(' ', '').split(',') if pages else [None]):
+        digest = _digest(payload.get('messages'), page)
+        analysis = (f"Scanned document page ({digest[:8]}). Document type: "
+                    f"{_pick_folder('', digest).rstrip('s').lower()}; no further details identified.")
+        sections.append(f"Page {page}: {analysis}" if page else analysis)
+    content = "\n".join(sections)
+    # Images are billed per image, not by the size of their base64 encoding
+    images = sum(1 for message in payload.get('messages', [])
+                 for part in (message.get('content') if isinstance(message.get('content'), list) else [])
+                 if isinstance(part, dict) and part.get('type') == 'image_url')
+    prompt_tokens = len(prompt) // 4 + images * FAKE_IMAGE_TOKENS
+    body = {
+        "id": f"chatcmpl-{digest[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get('model', 'fake'),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                  "total_tokens": prompt_tokens + len(content) // 4},
+    }
+    return httpx.Response(200, json=body, request=request)
+
+
+def fake_chat_transport() -> httpx.AsyncBaseTransport:
+    """httpx transport answering chat completion requests locally (used for the vision calls)."""
+    return httpx.MockTransport(_fake_chat_completion)
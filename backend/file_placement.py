@@ -0,0 +1,198 @@
+"""
+Atomic local file placement for Scout App backend.
+
+place_file() puts a file at its final path (new name and target folder) in
+one step:
+
+- On the same filesystem the file is hard-linked to the final name and the
+  source link removed, so the final path never exists half-written and an
+  existing file is never overwritten.
+- Across filesystems the file is staged next to the destination using
+  kernel copy offload (copy_file_range, then sendfile, then a plain copy as
+  a last resort), fsynced and then linked into place.
+
+Name collisions are resolved by trying 'name (1).pdf', 'name (2).pdf', ...
+with exclusive create/link calls instead of stat-ing candidates first.
+"""
+
+import errno
+import os
+import shutil
+import uuid
+from typing import Optional
+
+# Set to 'false' to skip fsyncs entirely, e.g. for bulk runs or on scratch storage: placement
+# stays atomic, but files placed shortly before a crash may be lost
+FSYNC_ENABLED = os.getenv('SCOUT_PLACEMENT_FSYNC', 'true').lower() == 'true'
+MAX_COLLISION_ATTEMPTS = 1000
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Errors meaning the filesystem can't hard-link, so we reserve-and-rename instead
+_NO_LINK_ERRNOS = {errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK, errno.ENOSYS}
+
+
+def _fsync_path(path: str, directory: bool = False):
+    if not FSYNC_ENABLED:
+        return
+    flags = os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # Some filesystems (and Windows directories) don't support fsync here
+    finally:
+        os.close(fd)
+
+
+def _sync_dir(directory: str):
+    _fsync_path(directory, directory=True)
+
+
+def _candidate_names(filename: str):
+    stem, ext = os.path.splitext(filename)
+    yield filename
+    for n in range(1, MAX_COLLISION_ATTEMPTS):
+        yield f"{stem} ({n}){ext}"
+
+
+def _link_to_free_name(existing_path: str, target_dir: str, filename: str) -> str:
+    """Give existing_path an additional name in target_dir, picking the first free candidate."""
+    for candidate in _candidate_names(filename):
+        destination = os.path.join(target_dir, candidate)
+        try:
+            os.link(existing_path, destination)
+            return destination
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No free name for '{filename}' in {target_dir}")
+
+
+def _rename_to_free_name(source_path: str, target_dir: str, filename: str) -> str:
+    """Fallback for filesystems without hard links: reserve a name exclusively, then rename over it."""
+    for candidate in _candidate_names(filename):
+        destination = os.path.join(target_dir, candidate)
+        try:
+            fd = os.open(destination, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        try:
+            os.replace(source_path, destination)
+        except OSError:
+            os.unlink(destination)
+            raise
+        return destination
+    raise FileExistsError(f"No free name for '{filename}' in {target_dir}")
+
+
+def _copy_contents(source_fd: int, destination_fd: int, size: int):
+    """Copy file contents in-kernel where possible."""
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                n = os.copy_file_range(source_fd, destination_fd, min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied >= size:
+                return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+    if hasattr(os, 'sendfile'):
+        try:
+            while copied < size:
+                n = os.sendfile(destination_fd, source_fd, copied, min(COPY_CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied >= size:
+                return
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+    # Plain userspace copy for whatever is left
+    os.lseek(source_fd, copied, os.SEEK_SET)
+    os.lseek(destination_fd, copied, os.SEEK_SET)
+    while True:
+        chunk = os.read(source_fd, 1024 * 1024)
+        if not chunk:
+            return
+        os.write(destination_fd, chunk)
+
+
+def _stage_copy(source_path: str, target_dir: str, filename: str) -> str:
+    """Copy source_path into a hidden temporary file inside target_dir."""
+    staged_path = os.path.join(target_dir, f".{filename}.{uuid.uuid4().hex}.part")
+    with open(source_path, 'rb') as source:
+        size = os.fstat(source.fileno()).st_size
+        destination_fd = os.open(staged_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        try:
+            _copy_contents(source.fileno(), destination_fd, size)
+            if FSYNC_ENABLED:
+                os.fsync(destination_fd)
+        except BaseException:
+            os.close(destination_fd)
+            os.unlink(staged_path)
+            raise
+        os.close(destination_fd)
+    shutil.copystat(source_path, staged_path)
+    return staged_path
+
+
+def place_file(source_path: str, target_dir: str, new_filename: Optional[str] = None) -> str:
+    """Move a file into target_dir, optionally renaming it, as a single placement.
+
+    Args:
+        source_path: Path of the file to place
+        target_dir: Existing directory to place the file in
+        new_filename: New name for the file (defaults to the current name)
+
+    Returns:
+        The final path of the file. If the name was taken, it carries a ' (n)' suffix.
+    """
+    filename = os.path.basename(new_filename or source_path)
+    if not filename:
+        raise ValueError("Target filename cannot be empty.")
+    if not os.path.isdir(target_dir):
+        raise FileNotFoundError(f"Target folder not found: {target_dir}")
+    if os.path.abspath(os.path.join(target_dir, filename)) == os.path.abspath(source_path):
+        return source_path  # Already in place
+
+    try:
+        final_path = _link_to_free_name(source_path, target_dir, filename)
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            # Different filesystem: stage a copy next to the destination, then link it into place
+            staged_path = _stage_copy(source_path, target_dir, filename)
+            try:
+                final_path = _link_to_free_name(staged_path, target_dir, filename)
+            except OSError as link_error:
+                if link_error.errno not in _NO_LINK_ERRNOS:
+                    os.unlink(staged_path)
+                    raise
+                final_path = _rename_to_free_name(staged_path, target_dir, filename)
+            else:
+                os.unlink(staged_path)
+            _sync_dir(target_dir)
+            # The copy is durable, so the source can go
+            os.unlink(source_path)
+            _sync_dir(os.path.dirname(source_path) or '.')
+            return final_path
+        if e.errno in _NO_LINK_ERRNOS:
+            final_path = _rename_to_free_name(source_path, target_dir, filename)
+            _sync_dir(target_dir)
+            return final_path
+        raise
+
+    # Same filesystem: the new name is in place, drop the old one
+    os.unlink(source_path)
+    _sync_dir(target_dir)
+    source_dir = os.path.dirname(os.path.abspath(source_path))
+    if source_dir != os.path.abspath(target_dir):
+        _sync_dir(source_dir)
+    return final_path
@@ -0,0 +1,349 @@
+"""
+In-memory folder index for Scout App backend.
+
+The folder agent may search the storage root several times per document.
+Instead of listing the directory on every call, the storage root
+(LOCAL_STORAGE_DIR) is scanned once into an in-memory index which is kept up
+to date incrementally through inotify (Linux). Where inotify is unavailable,
+or for network filesystems whose remote changes inotify cannot see, the index
+falls back to a periodic rescan controlled by SCOUT_FOLDER_INDEX_TTL.
+
+Directories below the storage root are looked up in its index (pass base= to
+list_folders and search). Other roots get their own index; only the most
+recently used few are kept, and evicted ones close their inotify instance and
+watcher thread.
+"""
+
+import ctypes
+import ctypes.util
+import difflib
+import os
+import select
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# How many directory levels below the root are indexed
+DEFAULT_MAX_DEPTH = int(os.getenv('SCOUT_FOLDER_INDEX_DEPTH', '3'))
+# Seconds between full rescans when inotify is not available
+FALLBACK_RESCAN_TTL = float(os.getenv('SCOUT_FOLDER_INDEX_TTL', '300'))
+# The directory documents are filed under; its index serves every directory below it
+STORAGE_ROOT = os.path.abspath(os.getenv('LOCAL_STORAGE_DIR', 'local_storage/processed_pdfs'))
+# Indexes kept for directories outside the storage root
+MAX_OTHER_ROOTS = 4
+
+# inotify constants from <sys/inotify.h>
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+
+@dataclass
+class FolderEntry:
+    path: str
+    name: str
+    relative_path: str
+    depth: int
+
+
+class _Inotify:
+    """Thin ctypes wrapper around the Linux inotify API."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("inotify is not supported on this platform")
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def rm_watch(self, wd: int):
+        # Fails with EINVAL when the kernel already dropped the watch (directory deleted)
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def close(self):
+        os.close(self.fd)
+
+    def read_events(self):
+        """Block until events are available and yield (wd, mask, name) tuples."""
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            yield wd, mask, os.fsdecode(name)
+
+
+class FolderIndex:
+    """Index of all folders below a root directory, up to max_depth levels deep."""
+
+    def __init__(self, root: str, max_depth: int = DEFAULT_MAX_DEPTH, watch: bool = True):
+        self.root = os.path.abspath(root)
+        self.max_depth = max_depth
+        self._entries: Dict[str, FolderEntry] = {}
+        self._lock = threading.RLock()
+        self._inotify: Optional[_Inotify] = None
+        self._watches: Dict[int, str] = {}
+        self._last_scan = 0.0
+        self._wake_r = self._wake_w = None
+        if watch:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                self._inotify = None
+        self.rescan()
+        if self._inotify:
+            # close() writes to this pipe to stop the watcher thread
+            self._wake_r, self._wake_w = os.pipe()
+            threading.Thread(target=self._watch_loop, name=f"folder-index:{self.root}", daemon=True).start()
+
+    @property
+    def is_watching(self) -> bool:
+        return self._inotify is not None
+
+    def rescan(self):
+        """Rebuild the index from disk."""
+        with self._lock:
+            self._entries.clear()
+            self._scan(self.root, 0)
+            self._last_scan = time.monotonic()
+
+    def _scan(self, directory: str, depth: int):
+        # Watch every directory whose children are still within max_depth
+        if depth < self.max_depth:
+            self._watch(directory)
+        else:
+            return
+        try:
+            with os.scandir(directory) as it:
+                # DirEntry.is_dir uses the d_type from readdir, so no extra stat per entry
+                subdirs = [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            return
+        for path in subdirs:
+            self._add_entry(path, depth + 1)
+            self._scan(path, depth + 1)
+
+    def _watch(self, directory: str):
+        if not self._inotify:
+            return
+        try:
+            wd = self._inotify.add_watch(directory)
+            self._watches[wd] = directory
+        except OSError:
+            pass  # Directory vanished or watch limit reached; the TTL rescan still covers it
+
+    def _add_entry(self, path: str, depth: int):
+        self._entries[path] = FolderEntry(
+            path=path,
+            name=os.path.basename(path),
+            relative_path=os.path.relpath(path, self.root),
+            depth=depth,
+        )
+
+    def _depth_of(self, path: str) -> int:
+        relative = os.path.relpath(path, self.root)
+        return 0 if relative == '.' else relative.count(os.sep) + 1
+
+    def add_folder(self, path: str):
+        """Add a folder (and its subfolders) to the index, e.g. right after creating it."""
+        path = os.path.abspath(path)
+        if not path.startswith(self.root + os.sep):
+            return
+        depth = self._depth_of(path)
+        if depth > self.max_depth:
+            return
+        with self._lock:
+            self._add_entry(path, depth)
+            self._scan(path, depth)
+
+    def remove_folder(self, path: str):
+        """Remove a folder and everything below it from the index."""
+        path = os.path.abspath(path)
+        prefix = path + os.sep
+        with self._lock:
+            for entry_path in [p for p in self._entries if p == path or p.startswith(prefix)]:
+                del self._entries[entry_path]
+            for wd in [wd for wd, p in self._watches.items() if p == path or p.startswith(prefix)]:
+                del self._watches[wd]
+                # A folder moved away is still watched at its new place unless we drop the watch
+                if self._inotify:
+                    self._inotify.rm_watch(wd)
+
+    def close(self):
+        """Stop watching; the index then falls back to periodic rescans."""
+        with self._lock:
+            if self._wake_w is not None:
+                os.write(self._wake_w, b'x')
+                os.close(self._wake_w)
+                self._wake_w = None
+
+    def _watch_loop(self):
+        inotify = self._inotify
+        while True:
+            try:
+                readable, _, _ = select.select([inotify.fd, self._wake_r], [], [])
+                if self._wake_r in readable:
+                    break
+                events = list(inotify.read_events())
+            except OSError as e:
+                print(f"Folder index watcher for '{self.root}' stopped: {e}")
+                break
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped; only a full rescan can recover
+                    self.rescan()
+                    break
+                if mask & IN_IGNORED:
+                    with self._lock:
+                        self._watches.pop(wd, None)
+                    continue
+                parent = self._watches.get(wd)
+                if parent is None or not (mask & IN_ISDIR):
+                    continue
+                path = os.path.join(parent, name)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_folder(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.remove_folder(path)
+        with self._lock:
+            self._inotify = None
+            self._watches.clear()
+        inotify.close()
+        os.close(self._wake_r)
+
+    def _refresh_if_stale(self):
+        if not self._inotify and time.monotonic() - self._last_scan > FALLBACK_RESCAN_TTL:
+            self.rescan()
+
+    def _entries_below(self, base: Optional[str], max_depth: Optional[int]) -> List[Tuple[FolderEntry, int]]:
+        """Entries below base (default: the root) with their depth relative to it."""
+        base = self.root if base is None else os.path.abspath(base)
+        base_depth = self._depth_of(base)
+        prefix = base + os.sep
+        with self._lock:
+            entries = list(self._entries.values())
+        return [(entry, entry.depth - base_depth) for entry in entries
+                if entry.path.startswith(prefix) and (max_depth is None or entry.depth - base_depth <= max_depth)]
+
+    def list_folders(self, max_depth: Optional[int] = None, base: Optional[str] = None) -> List[str]:
+        """Indexed folder paths below base (default: the root), optionally limited to max_depth levels."""
+        self._refresh_if_stale()
+        return [entry.path for entry, _depth in self._entries_below(base, max_depth)]
+
+    def search(self, pattern: str, max_depth: Optional[int] = None, limit: int = 20,
+               base: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Find folders matching pattern, best matches first.
+
+        Exact names rank above prefix matches, which rank above substring matches,
+        followed by fuzzy matches. Shallower folders win ties.
+
+        Args:
+            pattern: Folder name (or 'Parent/Child' relative path) to look for
+            max_depth: Only consider folders at most this many levels below base
+            limit: Maximum number of results
+            base: Directory to search below (default: the root)
+
+        Returns:
+            List of (folder path, score) tuples
+        """
+        self._refresh_if_stale()
+        query = pattern.strip().lower()
+        if not query:
+            return []
+        match_path = os.sep in query or '/' in query
+        query = query.replace('/', os.sep)
+        base = self.root if base is None else os.path.abspath(base)
+
+        results = []
+        for entry, depth in self._entries_below(base, max_depth):
+            candidate = (os.path.relpath(entry.path, base) if match_path else entry.name).lower()
+            score = _match_score(query, candidate)
+            if score > 0:
+                results.append((entry.path, round(score - 0.01 * depth, 4)))
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:limit]
+
+
+def _match_score(query: str, candidate: str) -> float:
+    if candidate == query:
+        return 1.0
+    if candidate.startswith(query):
+        return 0.9
+    if query in candidate:
+        # Matches at a word boundary ('2024 Invoices' for 'invoices') beat mid-word ones
+        index = candidate.index(query)
+        return 0.8 if not candidate[index - 1].isalnum() else 0.7
+    ratio = difflib.SequenceMatcher(None, query, candidate).ratio()
+    return ratio * 0.6 if ratio >= 0.6 else 0.0
+
+
+_storage_index: Optional[FolderIndex] = None
+# Indexes of directories outside the storage root, least recently used first
+_indexes: "OrderedDict[str, FolderIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_folder_index(path: str) -> FolderIndex:
+    """Get the shared index covering a directory, building it on first use.
+
+    For the storage root and anything below it this is the storage root's index;
+    pass the directory as base= to its list_folders and search.
+    """
+    global _storage_index
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        if key == STORAGE_ROOT or key.startswith(STORAGE_ROOT + os.sep):
+            if _storage_index is None:
+                # Watching needs the root to exist before anything is filed into it
+                os.makedirs(STORAGE_ROOT, exist_ok=True)
+                _storage_index = FolderIndex(STORAGE_ROOT)
+            return _storage_index
+        index = _indexes.get(key)
+        if index is None:
+            index = FolderIndex(key)
+            _indexes[key] = index
+            while len(_indexes) > MAX_OTHER_ROOTS:
+                _root, evicted = _indexes.popitem(last=False)
+                evicted.close()
+        else:
+            _indexes.move_to_end(key)
+        return index
+
+
+def notify_folder_created(path: str):
+    """Record a newly created folder in every index covering it.
+
+    inotify picks this up too, but updating directly makes the folder searchable
+    immediately and keeps indexes without a watcher consistent.
+    """
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        indexes = list(_indexes.values()) + ([_storage_index] if _storage_index else [])
+    for index in indexes:
+        if path.startswith(index.root + os.sep):
+            index.add_folder(path)
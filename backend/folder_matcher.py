@@ -0,0 +1,315 @@
+"""
+Local semantic folder matcher for Scout App backend.
+
+Most documents belong in a folder we already have. The matcher keeps a
+compact hashed n-gram vector per folder, built from the folder name and the
+reader summaries of documents previously filed there, and scores a new
+document against all folders in one pass over their features. When the best
+match is confident enough the orchestrator uses it directly instead of
+asking the folder agent.
+
+The vectors are sparse (SparseRows): a folder costs memory for the features
+it actually has, not for all 2**14 hash buckets, and adding a folder doesn't
+copy the others.
+
+With several worker processes each worker learns in memory and keeps what it
+learned since its last save separately. Saving merges that into whatever is
+on disk under a file lock, and a worker reloads the file when another worker
+has saved since, so documents filed by one worker are matched by all.
+"""
+
+import os
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from shared_state import DebouncedSave, file_lock, file_version
+
+# Number of hashed feature dimensions per folder vector
+FEATURE_DIM = 2 ** 14
+# Minimum cosine similarity for a direct match
+MATCH_THRESHOLD = float(os.getenv('SCOUT_FOLDER_MATCH_THRESHOLD', '0.35'))
+# Minimum lead of the best folder over the runner-up
+MATCH_MARGIN = float(os.getenv('SCOUT_FOLDER_MATCH_MARGIN', '0.05'))
+# Folders need this many filed documents before they can be matched directly
+MIN_DOCUMENTS = int(os.getenv('SCOUT_FOLDER_MATCH_MIN_DOCUMENTS', '1'))
+# Weight of the folder name relative to one document summary
+NAME_WEIGHT = 3.0
+STATE_FILE = os.getenv('SCOUT_FOLDER_MATCHER_PATH', 'local_storage/folder_matcher.npz')
+
+WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+@dataclass
+class FolderMatch:
+    folder_name: str
+    folder_path: str
+    score: float
+    runner_up_score: float
+
+
+def hash_features(text: str, weight: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Count word unigrams, word bigrams and character trigrams into hashed buckets.
+
+    Returns the sparse vector as (sorted bucket indices, counts).
+    """
+    words = [word.lower() for word in WORD_RE.findall(text)]
+    features = list(words)
+    features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(f"~{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    if not features:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+    # crc32 is stable across processes, unlike hash(), so the saved state stays valid
+    buckets = np.fromiter((zlib.crc32(f.encode('utf-8')) % FEATURE_DIM for f in features),
+                          dtype=np.int32, count=len(features))
+    indices, counts = np.unique(buckets, return_counts=True)
+    return indices, counts.astype(np.float32) * np.float32(weight)
+
+
+def add_sparse(a: Tuple[np.ndarray, np.ndarray], b: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum of two sparse vectors in (sorted indices, values) form."""
+    indices, inverse = np.unique(np.concatenate([a[0], b[0]]), return_inverse=True)
+    values = np.zeros(len(indices), dtype=np.float32)
+    np.add.at(values, inverse, np.concatenate([a[1], b[1]]))
+    return indices.astype(np.int32), values
+
+
+def empty_sparse() -> Tuple[np.ndarray, np.ndarray]:
+    return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+
+class SparseRows:
+    """Rows of hashed feature counts, each stored as (sorted indices, values)."""
+
+    def __init__(self):
+        self.rows: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def append(self, row: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> int:
+        self.rows.append(row if row is not None else empty_sparse())
+        return len(self.rows) - 1
+
+    def add(self, row: int, vector: Tuple[np.ndarray, np.ndarray]):
+        self.rows[row] = add_sparse(self.rows[row], vector)
+
+    def lookup(self, row: int, indices: np.ndarray) -> np.ndarray:
+        """The row's values at the given bucket indices (0 where it has none)."""
+        row_indices, row_values = self.rows[row]
+        if not len(row_indices):
+            return np.zeros(len(indices), dtype=np.float32)
+        positions = np.minimum(np.searchsorted(row_indices, indices), len(row_indices) - 1)
+        return np.where(row_indices[positions] == indices, row_values[positions], 0).astype(np.float32)
+
+    def to_csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(row offsets, indices, values) of all rows, as saved and as scored."""
+        lengths = [len(indices) for indices, _ in self.rows]
+        indptr = np.zeros(len(self.rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.concatenate([indices for indices, _ in self.rows]) if self.rows else np.zeros(0, dtype=np.int32)
+        values = np.concatenate([values for _, values in self.rows]) if self.rows else np.zeros(0, dtype=np.float32)
+        return indptr, indices.astype(np.int32), values.astype(np.float32)
+
+    @classmethod
+    def from_csr(cls, indptr: np.ndarray, indices: np.ndarray, values: np.ndarray) -> 'SparseRows':
+        rows = cls()
+        for start, end in zip(indptr[:-1], indptr[1:]):
+            rows.rows.append((indices[start:end].astype(np.int32), values[start:end].astype(np.float32)))
+        return rows
+
+    @classmethod
+    def from_dense(cls, counts: np.ndarray) -> 'SparseRows':
+        """Rows of a dense matrix, as saved by earlier versions."""
+        rows = cls()
+        for row in counts:
+            nonzero = np.flatnonzero(row)
+            rows.rows.append((nonzero.astype(np.int32), row[nonzero].astype(np.float32)))
+        return rows
+
+
+def load_sparse_rows(state) -> Optional[SparseRows]:
+    """The rows of a saved state (CSR arrays, or the dense 'counts' of earlier versions); None if unusable."""
+    if 'indptr' in state:
+        if int(state['feature_dim']) != FEATURE_DIM:
+            return None
+        return SparseRows.from_csr(state['indptr'], state['indices'], state['values'])
+    counts = state['counts']
+    if counts.shape[1] != FEATURE_DIM:
+        return None
+    return SparseRows.from_dense(counts)
+
+
+def sparse_state(rows: SparseRows) -> Dict[str, np.ndarray]:
+    indptr, indices, values = rows.to_csr()
+    return {"indptr": indptr, "indices": indices, "values": values, "feature_dim": np.array(FEATURE_DIM)}
+
+
+class FolderMatcher:
+    """Hashed TF-IDF vectors for known folders, matched by cosine similarity."""
+
+    def __init__(self, state_file: str = STATE_FILE):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._paths: List[str] = []
+        self._row: Dict[str, int] = {}
+        self._doc_counts: List[int] = []
+        self._rows = SparseRows()
+        # Normalized TF-IDF weights of all rows: (row of each entry, bucket indices, weights)
+        self._weighted: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._idf: Optional[np.ndarray] = None
+        # What this process learned since it last saved: folder -> (feature counts, documents)
+        self._pending: Dict[str, Tuple[Tuple[np.ndarray, np.ndarray], int]] = {}
+        self._pending_folders: Set[str] = set()
+        self._version = None
+        self._saver = DebouncedSave(self.save, "folder matcher")
+        self._load()
+
+    def _load(self):
+        """Replace the in-memory state with the saved state plus what this process hasn't saved yet."""
+        self._version = file_version(self.state_file)
+        if self._version is None:
+            paths, rows, doc_counts = [], SparseRows(), []
+        else:
+            try:
+                with np.load(self.state_file, allow_pickle=False) as state:
+                    rows = load_sparse_rows(state)
+                    if rows is None:
+                        return  # Saved with a different feature size; start fresh
+                    paths = [str(path) for path in state['paths']]
+                    doc_counts = [int(n) for n in state['doc_counts']]
+            except Exception as e:
+                print(f"Could not load folder matcher state from {self.state_file}: {e}")
+                return
+        self._paths, self._rows, self._doc_counts = paths, rows, doc_counts
+        self._row = {path: i for i, path in enumerate(self._paths)}
+        self._weighted = None
+        for folder_path in self._pending_folders:
+            self._ensure_folder(folder_path)
+        for folder_path, (delta, documents) in self._pending.items():
+            row = self._ensure_folder(folder_path)
+            self._rows.add(row, delta)
+            self._doc_counts[row] += documents
+
+    def _reload_if_changed(self):
+        # Another worker saved since we last loaded or saved
+        if file_version(self.state_file) != self._version:
+            self._load()
+
+    def save(self):
+        """Merge what this process learned into the state file."""
+        with self._lock, file_lock(self.state_file):
+            self._reload_if_changed()
+            os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+            tmp_path = f"{self.state_file}.tmp.npz"
+            np.savez_compressed(tmp_path, paths=np.array(self._paths, dtype=str),
+                                doc_counts=np.array(self._doc_counts, dtype=np.int64),
+                                **sparse_state(self._rows))
+            os.replace(tmp_path, self.state_file)
+            self._pending.clear()
+            self._pending_folders.clear()
+            self._version = file_version(self.state_file)
+
+    def save_later(self):
+        """Save in the background shortly, together with whatever else is learned until then."""
+        self._saver.schedule()
+
+    def flush(self):
+        """Save now if a background save is pending."""
+        self._saver.flush()
+
+    def _ensure_folder(self, folder_path: str) -> int:
+        row = self._row.get(folder_path)
+        if row is None:
+            row = self._rows.append(hash_features(os.path.basename(folder_path), NAME_WEIGHT))
+            self._paths.append(folder_path)
+            self._doc_counts.append(0)
+            self._row[folder_path] = row
+            self._weighted = None
+        return row
+
+    def add_folders(self, folder_paths: Iterable[str]):
+        """Register folders by name only (e.g. existing folders nothing was filed into yet)."""
+        with self._lock:
+            for folder_path in folder_paths:
+                folder_path = os.path.abspath(folder_path)
+                if folder_path not in self._row:
+                    self._ensure_folder(folder_path)
+                    self._pending_folders.add(folder_path)
+
+    def learn(self, folder_path: str, summary: str):
+        """Add a filed document's reader summary to its folder's vector."""
+        folder_path = os.path.abspath(folder_path)
+        features = hash_features(summary)
+        with self._lock:
+            row = self._ensure_folder(folder_path)
+            self._rows.add(row, features)
+            self._doc_counts[row] += 1
+            self._weighted = None
+            delta, documents = self._pending.get(folder_path, (empty_sparse(), 0))
+            self._pending[folder_path] = (add_sparse(delta, features), documents + 1)
+
+    def _weighted_rows(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._weighted is None:
+            n_folders = len(self._rows)
+            indptr, indices, counts = self._rows.to_csr()
+            row_of = np.repeat(np.arange(n_folders), np.diff(indptr))
+            # Indices are unique within a row, so this counts the folders having each feature
+            document_frequency = np.bincount(indices, minlength=FEATURE_DIM)
+            self._idf = (np.log((1 + n_folders) / (1 + document_frequency)) + 1).astype(np.float32)
+            weights = np.log1p(counts) * self._idf[indices]
+            norms = np.sqrt(np.bincount(row_of, weights=weights * weights, minlength=n_folders))
+            self._weighted = (row_of, indices, (weights / np.maximum(norms[row_of], 1e-12)).astype(np.float32))
+        return self._weighted
+
+    def match(self, base_dir: str, text: str) -> Optional[FolderMatch]:
+        """Return the best folder under base_dir for text if the match is confident, else None."""
+        base_dir = os.path.abspath(base_dir)
+        query_indices, query_counts = hash_features(text)
+        with self._lock:
+            self._reload_if_changed()
+            if not self._paths or not text.strip():
+                return None
+            row_of, indices, weights = self._weighted_rows()
+            query = np.zeros(FEATURE_DIM, dtype=np.float32)
+            query[query_indices] = np.log1p(query_counts) * self._idf[query_indices]
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                return None
+            scores = np.bincount(row_of, weights=weights * query[indices] / norm, minlength=len(self._paths))
+
+            prefix = base_dir + os.sep
+            candidates = np.array([path.startswith(prefix) for path in self._paths])
+            scores = np.where(candidates, scores, -1.0)
+            order = np.argsort(scores)[::-1]
+            best = int(order[0])
+            best_score = float(scores[best])
+            runner_up = float(scores[order[1]]) if len(order) > 1 and scores[order[1]] >= 0 else 0.0
+            best_path = self._paths[best]
+            best_documents = self._doc_counts[best]
+
+        if best_score < MATCH_THRESHOLD or best_score - runner_up < MATCH_MARGIN:
+            return None
+        if best_documents < MIN_DOCUMENTS or not os.path.isdir(best_path):
+            return None
+        return FolderMatch(folder_name=os.path.basename(best_path), folder_path=best_path,
+                           score=best_score, runner_up_score=runner_up)
+
+
+_matcher: Optional[FolderMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def get_folder_matcher() -> FolderMatcher:
+    """Get the process-wide folder matcher, loading saved state on first use."""
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None:
+            _matcher = FolderMatcher()
+        return _matcher
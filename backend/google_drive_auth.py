@@ -1,10 +1,11 @@
+import datetime
 import os
-import json
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from google.auth.transport.requests import Request
+
+import credential_store
+from credential_store import DEFAULT_USER
+
+# The Google client libraries are imported where they're used: together they
+# take a noticeable part of a second to import, and most requests never need them
 
 # Define the scopes for Google Drive API access
 # https://developers.google.com/drive/api/guides/scopes
@@ -14,41 +15,78 @@ SCOPES = ['https://www.googleapis.com/auth/drive']
 CLIENT_SECRETS_FILE = os.path.join(os.path.dirname(__file__), 'credentials.json')
 
 # Path to store the user's access and refresh tokens
-TOKEN_FILE = os.path.join(os.path.dirname(__file__), 'token.json')
+TOKEN_FILE = credential_store.TOKEN_FILE
 
 # Always use localhost for OAuth redirect - this works with ASWebAuthenticationSession
 # regardless of where the backend server is running
 REDIRECT_URI = 'http://localhost:8000/auth/google/callback'
 
-def get_drive_service():
-    """Gets an authorized Google Drive API service instance."""
-    creds = None
+def expires_within(creds, seconds: float) -> bool:
+    """True if the credentials have no usable access token for the next `seconds` seconds."""
+    if not creds.valid:
+        return True  # Includes google-auth's own margin before the expiry
+    if creds.expiry is None:
+        return False
+    # google-auth keeps expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return creds.expiry - datetime.timedelta(seconds=seconds) <= now
+
+def get_drive_credentials(user_id: str = DEFAULT_USER, min_valid_seconds: float = 0):
+    """Loads the stored user credentials, refreshing them if they have expired.
+    Returns a valid Credentials object, or None if the user needs to authenticate.
+
+    With min_valid_seconds, a token that expires sooner than that is refreshed
+    ahead of time. The token files are shared by all worker processes; see
+    credential_store.
+    """
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first time.
-    if os.path.exists(TOKEN_FILE):
-        try:
-            with open(TOKEN_FILE, 'r') as token:
-                creds_data = json.load(token)
-                creds = Credentials.from_authorized_user_info(creds_data, SCOPES)
-        except json.JSONDecodeError:
-            creds = None # Invalid token file
+    creds_data = credential_store.load_token(user_id)
+    creds = Credentials.from_authorized_user_info(creds_data, SCOPES) if creds_data else None
+    if creds and not expires_within(creds, min_valid_seconds):
+        return creds
 
     # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                # Save the refreshed credentials
-                with open(TOKEN_FILE, 'w') as token:
-                    token.write(creds.to_json())
-            except Exception as e:
-                # Refresh failed, need to re-authenticate
-                print(f"Failed to refresh token: {e}")
-                return None # Indicate that auth is needed
-        else:
-            # No token or no refresh token, need to initiate full auth flow
-            return None # Indicate that auth is needed
-    
+    if not creds or not creds.refresh_token:
+        # No token or no refresh token, need to initiate full auth flow
+        return None # Indicate that auth is needed
+
+    def is_stale(info):
+        return expires_within(Credentials.from_authorized_user_info(info, SCOPES), min_valid_seconds)
+
+    def refresh(info):
+        stale = Credentials.from_authorized_user_info(info, SCOPES)
+        stale.refresh(Request())
+        return stale.to_json()
+
+    try:
+        # Refresh and save the refreshed credentials, unless another worker just did
+        creds_data = credential_store.refresh_token(is_stale, refresh, user_id)
+    except Exception as e:
+        # Refresh failed, need to re-authenticate
+        print(f"Failed to refresh token for user {user_id}: {e}")
+        return None # Indicate that auth is needed
+    return Credentials.from_authorized_user_info(creds_data, SCOPES) if creds_data else None
+
+def get_drive_service(user_id: str = DEFAULT_USER):
+    """Gets an authorized Google Drive API service instance.
+
+    This loads the credentials and builds the service on every call; request
+    handlers should use the cached one from drive_pool instead.
+    """
+    creds = get_drive_credentials(user_id)
+    if not creds:
+        return None # Indicate that auth is needed
+    return build_drive_service(creds)
+
+def build_drive_service(creds):
+    """Builds a Drive API service instance for the given credentials."""
+    from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
+
     try:
         service = build('drive', 'v3', credentials=creds)
         return service
@@ -59,8 +97,15 @@ def get_drive_service():
         print(f'An unexpected error occurred: {e}')
         return None
 
-def get_authorization_url():
-    """Generates the Google OAuth2 authorization URL."""
+def get_authorization_url(user_id: str = DEFAULT_USER):
+    """Generates the Google OAuth2 authorization URL for connecting user_id's Drive.
+
+    The OAuth state is random and recorded server-side with the user (see
+    auth_sessions); the callback must consume it before saving any token.
+    """
+    from google_auth_oauthlib.flow import Flow
+    from auth_sessions import create_oauth_state
+
     flow = Flow.from_client_secrets_file(
         CLIENT_SECRETS_FILE,
         scopes=SCOPES,
@@ -68,17 +113,17 @@ def get_authorization_url():
     )
     authorization_url, state = flow.authorization_url(
         access_type='offline',
-        prompt='consent'  # Force prompt for consent to get a refresh token every time
+        prompt='consent',  # Force prompt for consent to get a refresh token every time
+        state=create_oauth_state(user_id)
     )
-    # Store the state in session or a temporary store to verify in callback
-    # For simplicity, we're not doing that here, but it's recommended for security.
-    # For example, you could store `state` in the FastAPI session.
     return authorization_url
 
-def exchange_code_for_token(authorization_code: str):
-    """Exchanges an authorization code for credentials and saves them.
+def exchange_code_for_token(authorization_code: str, user_id: str = DEFAULT_USER):
+    """Exchanges an authorization code for credentials and saves them as the user's token.
     Returns the credentials object on success, None on failure.
     """
+    from google_auth_oauthlib.flow import Flow
+
     flow = Flow.from_client_secrets_file(
         CLIENT_SECRETS_FILE,
         scopes=SCOPES,
@@ -87,8 +132,7 @@ def exchange_code_for_token(authorization_code: str):
     try:
         flow.fetch_token(code=authorization_code)
         credentials = flow.credentials
-        with open(TOKEN_FILE, 'w') as token_file:
-            token_file.write(credentials.to_json()) # Save to token.json for future server use
+        credential_store.save_token(credentials.to_json(), user_id) # Save for future server use
         return credentials # Return the full credentials object
     except Exception as e:
         print(f"Error fetching token: {e}")
@@ -0,0 +1,349 @@
+"""
+Local response cache for model calls in Scout App backend.
+
+Re-processing a document after a downstream failure, or the same template
+document arriving from different customers, produces identical prompts.
+Their responses are served from a local SQLite store instead of calling the
+model again:
+
+- Agent runs are cached per model turn (CachingModel wraps the configured
+  model provider). A cached turn replays the same tool calls, and the runner
+  executes them as usual, so the side effects of rename/move/create tools
+  still happen; only the model call is skipped. The key covers the agent's
+  model, instructions, tools, output schema, settings and the normalized
+  input.
+- Direct chat completions (the vision calls) go through
+  cached_chat_completion(), keyed by the complete request.
+
+Request-specific values that end up in prompts, like the timestamped path
+of the uploaded working copy, are registered with set_request_aliases().
+They are replaced by placeholders in cache keys and stored responses, and
+swapped back in on a hit, so a re-upload of the same document shares the
+cached turns and the replayed tool calls act on the current file.
+
+Entries expire after SCOUT_LLM_CACHE_TTL seconds; when the store grows past
+SCOUT_LLM_CACHE_MAX_MB, the least recently used entries are evicted. All
+workers share the store, so its size is kept in the database itself (a
+running total maintained by triggers) and checked and trimmed inside the
+write transaction that stores an entry.
+Set SCOUT_LLM_CACHE=false to disable caching (e.g. for load tests that
+should exercise every call).
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from agents.items import ModelResponse
+from agents.models.interface import Model, ModelProvider
+from agents.usage import Usage
+from openai.types.chat import ChatCompletion
+from openai.types.responses import ResponseOutputItem
+from pydantic import TypeAdapter
+
+from model_governor import governed_chat_completion
+
+LLM_CACHE_ENABLED = os.getenv('SCOUT_LLM_CACHE', 'true').lower() == 'true'
+LLM_CACHE_DB = os.getenv('SCOUT_LLM_CACHE_DB', 'local_storage/llm_cache.sqlite3')
+LLM_CACHE_TTL = float(os.getenv('SCOUT_LLM_CACHE_TTL', str(7 * 86400)))
+LLM_CACHE_MAX_BYTES = int(float(os.getenv('SCOUT_LLM_CACHE_MAX_MB', '256')) * 1024 * 1024)
+# Eviction trims the store to this fraction of the size limit so it doesn't run on every put
+EVICTION_TARGET = 0.9
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)",
+    "CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses(created_at)",
+    # Total size of all entries, shared by every worker using the store
+    "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO cache_size (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM responses",
+    """CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses
+       BEGIN UPDATE cache_size SET bytes = bytes + NEW.size WHERE id = 0; END""",
+    """CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses
+       BEGIN UPDATE cache_size SET bytes = bytes + NEW.size - OLD.size WHERE id = 0; END""",
+    """CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses
+       BEGIN UPDATE cache_size SET bytes = bytes - OLD.size WHERE id = 0; END""",
+]
+
+_WHITESPACE = re.compile(r'\s+')
+_output_items = TypeAdapter(List[ResponseOutputItem])
+
+_request_aliases: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar('llm_cache_aliases', default={})
+
+
+def set_request_aliases(**aliases: str):
+    """Register request-specific values to be replaced by placeholders in cache keys and entries."""
+    _request_aliases.set({name: value for name, value in aliases.items() if value})
+
+
+def _json_fragment(value: str) -> str:
+    return json.dumps(value)[1:-1]
+
+
+def _to_placeholders(text: str) -> str:
+    """Replace the current request's aliased values in JSON text with their placeholders."""
+    # Longest first, so a path is replaced before the file name it contains
+    for name, value in sorted(_request_aliases.get().items(), key=lambda item: -len(item[1])):
+        text = text.replace(_json_fragment(value), '{{scout:%s}}' % name)
+    return text
+
+
+def _from_placeholders(text: str) -> str:
+    for name, value in _request_aliases.get().items():
+        text = text.replace('{{scout:%s}}' % name, _json_fragment(value))
+    return text
+
+
+def make_key(*parts: Any) -> str:
+    """Stable hash of JSON-serializable key parts, with request aliases replaced."""
+    text = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(_to_placeholders(text).encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed response store with TTL and size-based LRU eviction."""
+
+    def __init__(self, db_path: str = LLM_CACHE_DB, ttl: float = LLM_CACHE_TTL, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # In one transaction, so no worker stores an entry between counting and the triggers
+        with self._write_transaction():
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+        self.expirations = 0
+
+    @contextlib.contextmanager
+    def _write_transaction(self) -> Iterator[None]:
+        """Hold the database's write lock, which all workers share, for the block."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.rollback()
+            raise
+        self._conn.commit()
+
+    def _size(self) -> int:
+        return self._conn.execute("SELECT bytes FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def _count(self, kind: str, outcome: str):
+        entry = self._stats.setdefault(kind, {"hits": 0, "misses": 0})
+        entry[outcome] += 1
+
+    def get(self, kind: str, key: str) -> Optional[str]:
+        try:
+            return self._get(kind, key)
+        except sqlite3.Error as e:
+            # A broken cache must never fail the request; treat it as a miss
+            print(f"LLM cache lookup failed: {e}")
+            return None
+
+    def _get(self, kind: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[2] > self.ttl:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expirations += 1
+                row = None
+            if row is None:
+                self._count(kind, "misses")
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._count(kind, "hits")
+            return row[0]
+
+    def put(self, kind: str, key: str, value: str):
+        try:
+            self._put(kind, key, value)
+        except sqlite3.Error as e:
+            print(f"LLM cache store failed: {e}")
+
+    def _put(self, kind: str, key: str, value: str):
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes * EVICTION_TARGET:
+            return  # Would evict everything else
+        with self._lock, self._write_transaction():
+            # An upsert, not INSERT OR REPLACE: REPLACE's implicit delete doesn't fire the size trigger
+            self._conn.execute(
+                "INSERT INTO responses (key, kind, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET kind = excluded.kind, value = excluded.value, size = excluded.size, "
+                "created_at = excluded.created_at, last_access = excluded.last_access, hits = 0",
+                (key, kind, value, size, now, now),
+            )
+            if self._size() > self.max_bytes:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until below the target size.
+
+        Runs inside the write transaction of _put, so the size is every worker's total.
+        """
+        expired = self._conn.execute("DELETE FROM responses WHERE created_at < ? RETURNING size", (now - self.ttl,)).fetchall()
+        self.expirations += len(expired)
+        total = self._size()
+        target = self.max_bytes * EVICTION_TARGET
+        if total <= target:
+            return
+        victims = []
+        freed = 0
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= target:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total_bytes = self._size()
+            by_kind = {}
+            for kind, counts in self._stats.items():
+                lookups = counts["hits"] + counts["misses"]
+                by_kind[kind] = dict(counts, hit_ratio=round(counts["hits"] / lookups, 4) if lookups else None)
+            hits = sum(c["hits"] for c in self._stats.values())
+            lookups = hits + sum(c["misses"] for c in self._stats.values())
+            return {
+                "entries": entries,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+                "hit_ratio": round(hits / lookups, 4) if lookups else None,
+                "by_kind": by_kind,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def _normalize_input(input: Any) -> Any:
+    """Make equivalent inputs compare equal: collapse whitespace and drop per-response item ids."""
+    if isinstance(input, str):
+        return _WHITESPACE.sub(' ', input).strip()
+    if isinstance(input, list):
+        return [_normalize_input(item) for item in input]
+    if isinstance(input, dict):
+        return {key: _normalize_input(value) for key, value in input.items() if key not in ('id', 'status')}
+    return input
+
+
+class CachingModel(Model):
+    """Serves repeated model turns from the cache."""
+
+    def __init__(self, model: Model, model_name: Optional[str], cache: "LLMCache"):
+        self._model = model
+        self._model_name = model_name
+        self._cache = cache
+
+    def _key(self, system_instructions, input, model_settings, tools, output_schema, handoffs) -> str:
+        return make_key(
+            'agent',
+            self._model_name,
+            _normalize_input(system_instructions or ''),
+            _normalize_input(input),
+            dataclasses.asdict(model_settings) if dataclasses.is_dataclass(model_settings) else str(model_settings),
+            [(getattr(tool, 'name', None), getattr(tool, 'params_json_schema', None)) for tool in tools],
+            output_schema.json_schema() if output_schema and not output_schema.is_plain_text() else None,
+            [getattr(handoff, 'tool_name', None) for handoff in handoffs],
+        )
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs,
+                           tracing, *, previous_response_id) -> ModelResponse:
+        key = self._key(system_instructions, input, model_settings, tools, output_schema, handoffs)
+        cached = await asyncio.to_thread(self._cache.get, 'agent', key)
+        if cached is not None:
+            # No usage: nothing was sent to the model
+            output = _output_items.validate_json(_from_placeholders(cached))
+            return ModelResponse(output=output, usage=Usage(), response_id=None)
+
+        response = await self._model.get_response(
+            system_instructions, input, model_settings, tools, output_schema, handoffs, tracing,
+            previous_response_id=previous_response_id,
+        )
+        if response.output:
+            value = _to_placeholders(_output_items.dump_json(response.output).decode('utf-8'))
+            await asyncio.to_thread(self._cache.put, 'agent', key, value)
+        return response
+
+    def stream_response(self, *args, **kwargs) -> AsyncIterator:
+        # Streaming is passed through uncached
+        return self._model.stream_response(*args, **kwargs)
+
+
+class CachingModelProvider(ModelProvider):
+    """Wraps every model of another provider in a CachingModel."""
+
+    def __init__(self, provider: ModelProvider, cache: "LLMCache"):
+        self._provider = provider
+        self._cache = cache
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        return CachingModel(self._provider.get_model(model_name), model_name, self._cache)
+
+
+async def cached_chat_completion(client, **kwargs) -> ChatCompletion:
+    """client.chat.completions.create(**kwargs), served from the cache when an identical request was made before.
+
+    Cached responses carry no usage, since no tokens were spent on them. Requests
+    that do go out are sent through the model governor.
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return await governed_chat_completion(client, **kwargs)
+    key = make_key('chat', kwargs)
+    cached = await asyncio.to_thread(cache.get, 'completion', key)
+    if cached is not None:
+        response = ChatCompletion.model_validate_json(cached)
+        response.usage = None
+        return response
+    response = await governed_chat_completion(client, **kwargs)
+    await asyncio.to_thread(cache.put, 'completion', key, response.model_dump_json())
+    return response
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Get the shared response cache, or None when caching is disabled."""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache()
+        return _llm_cache
@@ -0,0 +1,95 @@
+"""
+Per-request memory budgeting for Scout App backend.
+
+Rendering a long scanned document can take far more memory than the rest of
+the pipeline together. Each request gets a MemoryBudget that records the
+process's resident set size (RSS) when the request started and the peak it
+reached while pages were rendered. Before rendering a page, the renderer
+asks the budget whether the page's estimated working set still fits under
+SCOUT_REQUEST_MEMORY_CAP_MB of growth over that baseline. If it doesn't,
+the page is rendered at a lower resolution, or skipped.
+
+RSS is process-wide, so concurrent requests count against each other's
+growth. That makes the cap conservative rather than exact. RSS is read from
+/proc/self/statm. Where that file isn't available, usage is not tracked and
+the cap is not enforced.
+"""
+
+import contextvars
+import os
+from typing import Any, Dict, List, Optional
+
+# Most the process may grow (RSS, in MB) while one request renders pages; 0 disables the cap
+REQUEST_MEMORY_CAP = int(float(os.getenv('SCOUT_REQUEST_MEMORY_CAP_MB', '1024')) * 2 ** 20)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None where it can't be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return round(value / 2 ** 20, 1) if value is not None else None
+
+
+class MemoryBudget:
+    """Per-request record of RSS growth against the memory cap."""
+
+    def __init__(self, cap: int = REQUEST_MEMORY_CAP):
+        self.cap = cap
+        self.baseline = rss_bytes()
+        self.peak = self.baseline
+        self.events: List[str] = []
+
+    def sample(self) -> Optional[int]:
+        """Read RSS now and update the request's peak."""
+        rss = rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return rss
+
+    def remaining(self) -> Optional[int]:
+        """Bytes the request may still grow by, or None when the cap is off or RSS is unknown."""
+        if not self.cap or self.baseline is None:
+            return None
+        rss = self.sample()
+        return self.cap - (rss - self.baseline) if rss is not None else None
+
+    def fits(self, estimated_bytes: int) -> bool:
+        remaining = self.remaining()
+        return remaining is None or estimated_bytes <= remaining
+
+    def note(self, event: str):
+        """Record a degradation (lower resolution, skipped pages) for the report."""
+        self.events.append(event)
+
+    def report(self) -> Dict[str, Any]:
+        self.sample()
+        return {
+            "cap_mb": _mb(self.cap) if self.cap else None,
+            "baseline_rss_mb": _mb(self.baseline),
+            "peak_rss_mb": _mb(self.peak),
+            "peak_growth_mb": _mb(self.peak - self.baseline) if self.baseline is not None else None,
+            "degraded": self.events,
+        }
+
+
+_current_memory: contextvars.ContextVar[Optional[MemoryBudget]] = contextvars.ContextVar('memory_budget', default=None)
+
+
+def start_request_memory() -> MemoryBudget:
+    """Create the memory budget for the current request (and the threads it hands work to)."""
+    budget = MemoryBudget()
+    _current_memory.set(budget)
+    return budget
+
+
+def current_memory() -> MemoryBudget:
+    """The current request's memory budget, or a standalone one when called outside a request."""
+    return _current_memory.get() or MemoryBudget()
@@ -0,0 +1,364 @@
+"""
+SQLite metadata index for processed documents.
+
+Replaces the per-upload *_metadata.json files: every /process-local-pdf run
+is recorded as one row in an indexed SQLite database (WAL mode, so queries
+never block the writer). Writes are queued and committed in batches by a
+background thread, which keeps commit/fsync costs flat under load. A row
+becomes visible to queries at most BATCH_INTERVAL seconds after record().
+
+Every row belongs to the Drive user whose request processed the document
+(see drive_pool), and queries only ever see the rows of one user. Rows
+recorded before there were several users, and imported JSON files, belong
+to the 'default' user.
+
+Existing metadata JSON files are imported once, either automatically on
+startup or manually with:
+
+    python metadata_store.py import [directory]
+"""
+
+import glob
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from credential_store import DEFAULT_USER
+
+METADATA_DB = os.getenv('SCOUT_METADATA_DB', 'local_storage/scout_metadata.sqlite3')
+LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', 'local_storage/processed_pdfs')
+# Maximum rows per commit and maximum seconds a row waits for its commit
+BATCH_SIZE = int(os.getenv('SCOUT_METADATA_BATCH_SIZE', '100'))
+BATCH_INTERVAL = float(os.getenv('SCOUT_METADATA_BATCH_INTERVAL', '0.5'))
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL DEFAULT 'default',
+        content_hash TEXT,
+        original_filename TEXT NOT NULL,
+        renamed_file TEXT,
+        target_folder TEXT,
+        final_path TEXT,
+        local_path TEXT,
+        status TEXT NOT NULL,
+        error_message TEXT,
+        processed_at TEXT NOT NULL,
+        duration_ms REAL,
+        source TEXT NOT NULL DEFAULT 'api',
+        import_key TEXT UNIQUE,
+        details_json TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_documents_user_processed_at ON documents(user_id, processed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_documents_target_folder ON documents(user_id, target_folder, processed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(user_id, status, processed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_documents_original_filename ON documents(original_filename)",
+    "CREATE INDEX IF NOT EXISTS idx_documents_renamed_file ON documents(renamed_file)",
+    "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)",
+    # Full-text index over everything we learned about a document; rowid = documents.id
+    """CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+        renamed_file, original_filename, target_folder, summary, vision_analysis, extracted_text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+]
+
+DOCUMENT_COLUMNS = [
+    "user_id", "content_hash", "original_filename", "renamed_file", "target_folder", "final_path", "local_path",
+    "status", "error_message", "processed_at", "duration_ms", "source", "import_key", "details_json",
+]
+
+# Searchable text accepted by record() but only stored in the full-text index
+SEARCH_FIELDS = ["summary", "vision_analysis", "extracted_text"]
+# bm25 column weights, in documents_fts column order: names and summary count most
+SEARCH_WEIGHTS = (4.0, 2.0, 2.0, 3.0, 1.0, 0.5)
+
+_STOP = object()
+
+
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class MetadataStore:
+    """Indexed document metadata with batched background writes."""
+
+    def __init__(self, db_path: str = METADATA_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(SCHEMA[0])
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+            if "user_id" not in columns:
+                # Databases from before there were several users; their rows are the default user's
+                try:
+                    conn.execute("ALTER TABLE documents ADD COLUMN user_id TEXT NOT NULL DEFAULT 'default'")
+                except sqlite3.OperationalError:
+                    pass  # Another worker just added it
+                else:
+                    # Recreated below with user_id leading
+                    for index in ("idx_documents_processed_at", "idx_documents_target_folder", "idx_documents_status"):
+                        conn.execute(f"DROP INDEX IF EXISTS {index}")
+            for statement in SCHEMA[1:]:
+                conn.execute(statement)
+            # Rows recorded before the search index existed are at least searchable by name
+            conn.execute(
+                "INSERT INTO documents_fts (rowid, renamed_file, original_filename, target_folder) "
+                "SELECT id, renamed_file, original_filename, target_folder FROM documents "
+                "WHERE id NOT IN (SELECT rowid FROM documents_fts)"
+            )
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="metadata-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Per-thread connection; WAL lets readers run while the writer commits."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, document: Dict[str, Any]):
+        """Queue a processed document for the next batched commit."""
+        row = {column: document.get(column) for column in DOCUMENT_COLUMNS + SEARCH_FIELDS}
+        row["user_id"] = row["user_id"] or DEFAULT_USER
+        row["processed_at"] = row["processed_at"] or utc_now_iso()
+        row["source"] = row["source"] or "api"
+        row["status"] = row["status"] or ("error" if row["error_message"] else "success")
+        if isinstance(row["details_json"], (dict, list)):
+            row["details_json"] = json.dumps(row["details_json"])
+        self._queue.put(row)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until everything queued so far has been committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join(timeout=5)
+
+    def _write_loop(self):
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in DOCUMENT_COLUMNS)
+        insert_sql = f"INSERT OR IGNORE INTO documents ({', '.join(DOCUMENT_COLUMNS)}) VALUES ({placeholders})"
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + BATCH_INTERVAL
+            # Collect whatever else arrives within the batch window
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()) if batch else 0)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with conn:
+                        for row in batch:
+                            cursor = conn.execute(insert_sql, [row[c] for c in DOCUMENT_COLUMNS])
+                            if cursor.rowcount:  # Not an already-imported duplicate
+                                conn.execute(
+                                    "INSERT INTO documents_fts (rowid, renamed_file, original_filename, target_folder, "
+                                    "summary, vision_analysis, extracted_text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (cursor.lastrowid, row["renamed_file"], row["original_filename"], row["target_folder"],
+                                     row["summary"], row["vision_analysis"], row["extracted_text"]),
+                                )
+                except sqlite3.Error as e:
+                    print(f"Failed to commit {len(batch)} metadata record(s): {e}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def query_documents(self, user_id: str, since: Optional[str] = None, until: Optional[str] = None,
+                        status: Optional[str] = None, folder: Optional[str] = None,
+                        filename: Optional[str] = None, content_hash: Optional[str] = None,
+                        limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """Filter the user's processed documents, newest first.
+
+        Args:
+            user_id: Whose documents to list
+            since / until: ISO-8601 bounds on processed_at (UTC), e.g. '2026-10-18'
+            status: 'success' or 'error'
+            folder: Exact target folder name
+            filename: Substring of the original or renamed filename
+            content_hash: SHA-256 of the uploaded file
+            limit / offset: Pagination
+
+        Returns:
+            Dictionary with 'total' matching rows and the requested page of 'items'
+        """
+        clauses, params = ["user_id = ?"], [user_id]
+        if since:
+            clauses.append("processed_at >= ?")
+            params.append(since)
+        if until:
+            clauses.append("processed_at < ?")
+            params.append(until)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if folder:
+            clauses.append("target_folder = ?")
+            params.append(folder)
+        if filename:
+            clauses.append("(original_filename LIKE ? OR renamed_file LIKE ?)")
+            params.extend([f"%{filename}%", f"%{filename}%"])
+        if content_hash:
+            clauses.append("content_hash = ?")
+            params.append(content_hash)
+        where = f"WHERE {' AND '.join(clauses)}"
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM documents {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM documents {where} ORDER BY processed_at DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return {"total": total, "limit": limit, "offset": offset, "items": [self._row_to_dict(row) for row in rows]}
+
+    def search_documents(self, user_id: str, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Full-text search over the names, reader summaries, vision analyses and extracted text of the user's documents.
+
+        Every word in query must match (as a prefix). Results are ranked by bm25 and
+        come with a highlighted snippet from the best-matching column.
+        """
+        match = _fts_query(query)
+        if not match:
+            return {"query": query, "limit": limit, "offset": offset, "items": []}
+        weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+        rows = self._connect().execute(
+            f"""SELECT d.id, d.original_filename, d.renamed_file, d.target_folder, d.final_path,
+                       d.status, d.processed_at, d.content_hash,
+                       snippet(documents_fts, -1, '<b>', '</b>', '…', 16) AS snippet,
+                       bm25(documents_fts, {weights}) AS score
+                FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+                WHERE documents_fts MATCH ? AND d.user_id = ?
+                ORDER BY score LIMIT ? OFFSET ?""",
+            (match, user_id, limit, offset),
+        ).fetchall()
+        return {"query": query, "limit": limit, "offset": offset, "items": [dict(row) for row in rows]}
+
+    def get_document(self, user_id: str, document_id: int) -> Optional[Dict[str, Any]]:
+        """The document with this ID, or None when there is none or it is another user's."""
+        row = self._connect().execute("SELECT * FROM documents WHERE id = ? AND user_id = ?",
+                                      (document_id, user_id)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        document = dict(row)
+        document.pop("user_id", None)
+        details = document.pop("details_json", None)
+        document.pop("import_key", None)
+        document["details"] = json.loads(details) if details else None
+        return document
+
+    def import_json_metadata(self, directory: str = LOCAL_STORAGE_DIR, force: bool = False) -> int:
+        """Import legacy *_metadata.json files once. Returns the number of files queued."""
+        conn = self._connect()
+        if not force and conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_import_done'").fetchone():
+            return 0
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(directory, "**", "*_metadata.json"), recursive=True)):
+            try:
+                with open(path, 'r') as f:
+                    metadata = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping unreadable metadata file {path}: {e}")
+                continue
+            self.record({
+                "content_hash": metadata.get("content_hash"),
+                "original_filename": metadata.get("original_filename") or metadata.get("original_file") or os.path.basename(path),
+                "renamed_file": metadata.get("renamed_file"),
+                "target_folder": metadata.get("target_folder"),
+                "final_path": metadata.get("final_path_suggestion"),
+                "local_path": metadata.get("local_path"),
+                "error_message": metadata.get("error_message"),
+                "processed_at": _legacy_timestamp_to_iso(metadata.get("processing_timestamp")) or _mtime_iso(path),
+                "source": "json_import",
+                # Re-running the import never duplicates rows
+                "import_key": os.path.abspath(path),
+                "details_json": metadata,
+                "summary": metadata.get("extracted_content") or _summary_from_status_updates(metadata.get("status_updates")),
+            })
+            imported += 1
+        self.flush()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('json_import_done', ?)", (utc_now_iso(),))
+        print(f"Imported {imported} legacy metadata file(s) from {directory}")
+        return imported
+
+
+def _fts_query(query: str) -> str:
+    """Turn free text into a safe FTS5 query: every word quoted, matched as a prefix."""
+    words = re.findall(r"\w+", query, re.UNICODE)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _summary_from_status_updates(status_updates: List[str]) -> Optional[str]:
+    """Recover the reader summary that legacy metadata files only kept in their status log."""
+    prefix = "Reader agent processed. Output content: "
+    for update in status_updates or []:
+        if isinstance(update, str) and update.startswith(prefix):
+            return update[len(prefix):]
+    return None
+
+
+def _legacy_timestamp_to_iso(timestamp: Optional[str]) -> Optional[str]:
+    """Convert the old local-time '%Y%m%d_%H%M%S' stamps to UTC ISO-8601."""
+    if not timestamp:
+        return None
+    try:
+        local_time = datetime.strptime(timestamp, "%Y%m%d_%H%M%S").astimezone()
+    except ValueError:
+        return None
+    return local_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _mtime_iso(path: str) -> str:
+    return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+_metadata_store: Optional[MetadataStore] = None
+_metadata_store_lock = threading.Lock()
+
+
+def get_metadata_store() -> MetadataStore:
+    """Get the shared metadata store, opening the database on first use."""
+    global _metadata_store
+    with _metadata_store_lock:
+        if _metadata_store is None:
+            _metadata_store = MetadataStore()
+        return _metadata_store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "import":
+        store = get_metadata_store()
+        store.import_json_metadata(sys.argv[2] if len(sys.argv) > 2 else LOCAL_STORAGE_DIR, force=True)
+        store.close()
+    else:
+        print("Usage: python metadata_store.py import [directory]")
@@ -0,0 +1,360 @@
+"""
+Stage timing and metrics for Scout App backend.
+
+Every pipeline stage, tool function and OpenAI/Drive request runs inside a
+span():
+
+    with span("reader_agent"):
+        ...
+
+    @timed("tool.read_local_pdf")
+    def read_local_pdf(...): ...
+
+Each span updates the process-wide metrics for its stage - a latency
+histogram, a window of recent latencies for p50/p95/p99, an in-flight gauge
+and an error counter - which /metrics exposes in the Prometheus text format.
+During an orchestrator run the spans are also collected into the request's
+trace (start_trace()), with their nesting and offsets, so a single run shows
+where its time went.
+
+With several worker processes (SCOUT_WORKERS > 1) each worker writes its
+metrics to a file under SCOUT_METRICS_DIR every SCOUT_METRICS_EXPORT_INTERVAL
+seconds, and /metrics adds up the files of all workers of the server (like
+prometheus_client's multiprocess mode): histograms, sums and error counts
+are summed, the quantiles cover the recent runs of all workers, and in-flight
+gauges only count workers that are still alive.
+"""
+
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+from shared_state import WORKERS, atomic_write
+
+# Recent latencies per stage used for the quantiles
+LATENCY_WINDOW = int(os.getenv('SCOUT_METRICS_WINDOW', '1024'))
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+METRICS_DIR = os.getenv('SCOUT_METRICS_DIR', 'local_storage/metrics')
+# Seconds between exports of a worker's metrics for the other workers' /metrics
+EXPORT_INTERVAL = float(os.getenv('SCOUT_METRICS_EXPORT_INTERVAL', '5'))
+
+
+class _StageMetrics:
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.in_flight = 0
+        self.recent: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def observe(self, seconds: float, error: bool):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"buckets": self.bucket_counts, "count": self.count, "total": self.total,
+                "errors": self.errors, "in_flight": self.in_flight, "recent": list(self.recent)}
+
+    def merge(self, exported: Dict[str, Any], alive: bool):
+        """Add another worker's exported metrics to these."""
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, exported["buckets"])]
+        self.count += exported["count"]
+        self.total += exported["total"]
+        self.errors += exported["errors"]
+        if alive:
+            self.in_flight += exported["in_flight"]
+        # Keeps any number of recent latencies, so the quantiles weigh every worker's runs
+        self.recent = deque(self.recent, maxlen=None)
+        self.recent.extend(exported["recent"])
+
+    def quantiles(self) -> Dict[float, Optional[float]]:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {q: None for q in QUANTILES}
+        # Nearest-rank quantiles
+        return {q: ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    """Per-stage latency, in-flight and error metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _StageMetrics] = {}
+
+    def _stage(self, stage: str) -> _StageMetrics:
+        metrics = self._stages.get(stage)
+        if metrics is None:
+            metrics = self._stages[stage] = _StageMetrics()
+        return metrics
+
+    def start(self, stage: str):
+        with self._lock:
+            self._stage(stage).in_flight += 1
+
+    def finish(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            metrics = self._stage(stage)
+            metrics.in_flight -= 1
+            metrics.observe(seconds, error)
+
+    def export(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {stage: metrics.to_dict() for stage, metrics in self._stages.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-stage summary (count, errors, in flight, mean and quantiles in ms)."""
+        with self._lock:
+            result = {}
+            for stage, metrics in sorted(self._stages.items()):
+                quantiles = metrics.quantiles()
+                result[stage] = {
+                    "count": metrics.count,
+                    "errors": metrics.errors,
+                    "in_flight": metrics.in_flight,
+                    "mean_ms": round(metrics.total / metrics.count * 1000, 2) if metrics.count else None,
+                    **{f"p{round(q * 100)}_ms": round(v * 1000, 2) if v is not None else None for q, v in quantiles.items()},
+                }
+            return result
+
+    def _all_workers(self) -> Dict[str, _StageMetrics]:
+        """This worker's metrics plus the latest export of every other worker of the server."""
+        merged: Dict[str, _StageMetrics] = {}
+        exports = [(self.export(), True)] + list(_other_worker_exports())
+        for stages, alive in exports:
+            for stage, exported in stages.items():
+                merged.setdefault(stage, _StageMetrics()).merge(exported, alive)
+        return merged
+
+    def render_prometheus(self) -> str:
+        """All stage metrics (of all workers) in the Prometheus text exposition format."""
+        if WORKERS > 1:
+            return _render_prometheus(sorted(self._all_workers().items()))
+        with self._lock:
+            return _render_prometheus(sorted(self._stages.items()))
+
+
+def _render_prometheus(stages: Iterable) -> str:
+    stages = list(stages)
+    lines = [
+        "# HELP scout_stage_duration_seconds Duration of pipeline stages, tool calls and API requests.",
+        "# TYPE scout_stage_duration_seconds histogram",
+    ]
+    for stage, metrics in stages:
+        label = _escape(stage)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, metrics.bucket_counts):
+            cumulative += count
+            lines.append(f'scout_stage_duration_seconds_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'scout_stage_duration_seconds_bucket{{stage="{label}",le="+Inf"}} {metrics.count}')
+        lines.append(f'scout_stage_duration_seconds_sum{{stage="{label}"}} {metrics.total:.6f}')
+        lines.append(f'scout_stage_duration_seconds_count{{stage="{label}"}} {metrics.count}')
+
+    lines += [
+        f"# HELP scout_stage_latency_seconds Latency quantiles of each stage over the last {LATENCY_WINDOW} runs of every worker, taken together.",
+        "# TYPE scout_stage_latency_seconds summary",
+    ]
+    for stage, metrics in stages:
+        label = _escape(stage)
+        for q, value in metrics.quantiles().items():
+            rendered = f"{value:.6f}" if value is not None else "NaN"
+            lines.append(f'scout_stage_latency_seconds{{stage="{label}",quantile="{q}"}} {rendered}')
+        lines.append(f'scout_stage_latency_seconds_sum{{stage="{label}"}} {metrics.total:.6f}')
+        lines.append(f'scout_stage_latency_seconds_count{{stage="{label}"}} {metrics.count}')
+
+    lines += ["# HELP scout_stage_in_flight Stage executions currently running.",
+              "# TYPE scout_stage_in_flight gauge"]
+    lines += [f'scout_stage_in_flight{{stage="{_escape(stage)}"}} {metrics.in_flight}' for stage, metrics in stages]
+
+    lines += ["# HELP scout_stage_errors_total Stage executions that raised an error.",
+              "# TYPE scout_stage_errors_total counter"]
+    lines += [f'scout_stage_errors_total{{stage="{_escape(stage)}"}} {metrics.errors}' for stage, metrics in stages]
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _server_dir() -> str:
+    # Workers are children of the server process, so this groups the workers of one server run
+    return os.path.join(METRICS_DIR, str(os.getppid()))
+
+
+def _other_worker_exports() -> Iterable:
+    """(exported stages, whether the worker is alive) of the server's other workers."""
+    directory = _server_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        pid = int(name[:-5]) if name.endswith('.json') and name[:-5].isdigit() else None
+        if pid is None or pid == os.getpid():
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                stages = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # A dead worker's counts stay in the totals (they are counters), its in-flight gauges don't
+        yield stages, _pid_alive(pid)
+
+
+def _export_loop():
+    path = os.path.join(_server_dir(), f"{os.getpid()}.json")
+    while True:
+        try:
+            atomic_write(path, json.dumps(_registry.export()), mode=0o644)
+        except OSError as e:
+            print(f"Could not export metrics to {path}: {e}")
+        time.sleep(EXPORT_INTERVAL)
+
+
+def start_worker_export():
+    """With several workers, export this worker's metrics for the others' /metrics (called on app startup)."""
+    if WORKERS <= 1:
+        return
+    # Directories of earlier server runs
+    if os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            if name.isdigit() and not _pid_alive(int(name)):
+                shutil.rmtree(os.path.join(METRICS_DIR, name), ignore_errors=True)
+    threading.Thread(target=_export_loop, name="metrics-export", daemon=True).start()
+
+
+class RequestTrace:
+    """Spans recorded during one orchestrator run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, span_id: int, parent_id: Optional[int], stage: str, started: float, seconds: float,
+            error: Optional[str], attributes: Dict[str, Any]):
+        entry = {
+            "id": span_id,
+            "parent_id": parent_id,
+            "stage": stage,
+            "start_ms": round((started - self.started) * 1000, 2),
+            "duration_ms": round(seconds * 1000, 2),
+        }
+        if error:
+            entry["error"] = error
+        if attributes:
+            entry["attributes"] = attributes
+        with self._lock:
+            self.spans.append(entry)
+
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(self.spans, key=lambda s: (s["start_ms"], s["id"]))
+
+
+class SpanHandle:
+    """Yielded by span(); fail() marks the span as an error without raising."""
+
+    def __init__(self):
+        self.error: Optional[str] = None
+
+    def fail(self, reason: str):
+        self.error = reason
+
+
+_registry = MetricsRegistry()
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('request_trace', default=None)
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('current_span', default=None)
+
+
+def start_trace() -> RequestTrace:
+    """Collect the spans of the current request (and the tasks and threads it starts)."""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(stage: str, **attributes: Any):
+    """Time the block as stage: update its metrics and add it to the current request's trace."""
+    trace = _current_trace.get()
+    span_id = parent_id = token = None
+    if trace is not None:
+        span_id = trace.next_id()
+        parent_id = _current_span.get()
+        token = _current_span.set(span_id)
+    _registry.start(stage)
+    started = time.perf_counter()
+    handle = SpanHandle()
+    error = None
+    try:
+        yield handle
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        error = error or handle.error
+        _registry.finish(stage, seconds, error is not None)
+        if token is not None:
+            _current_span.reset(token)
+        if trace is not None:
+            trace.add(span_id, parent_id, stage, started, seconds, error, attributes)
+
+
+def timed(stage: str) -> Callable:
+    """Decorator running each call of a sync or async function inside span(stage)."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the process-wide metrics registry."""
+    return _registry
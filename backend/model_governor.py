@@ -0,0 +1,469 @@
+"""
+Process-wide governor for model calls in Scout App backend.
+
+Vision calls, agent turns and concurrent requests all draw from the same
+OpenAI rate limits, so every model call goes through one ModelGovernor:
+
+- Two token buckets, one for requests and one for tokens per minute. A call
+  reserves one request and its estimated tokens (prompt plus output limit)
+  and waits until the buckets cover them; the estimate is reconciled with
+  the reported usage afterwards. A call that fails uses no tokens, and one
+  cancelled before it was sent gives back its request too.
+- A cap on calls in flight.
+- Retries with full-jitter exponential backoff. A Retry-After header is
+  honoured, and a 429 pauses the request bucket for everyone, so waiting
+  callers don't all hit the limit again at once. The OpenAI client's own
+  retries are turned off while the governor is enabled.
+- A circuit breaker: after SCOUT_GOVERNOR_BREAKER_FAILURES consecutive
+  server errors or timeouts, calls fail immediately with
+  ModelUnavailableError for SCOUT_GOVERNOR_BREAKER_COOLDOWN seconds, then a
+  single probe call decides whether to close it again. Calls that would
+  wait longer than SCOUT_GOVERNOR_MAX_WAIT for their rate budget are shed
+  the same way.
+
+Agent turns are governed by wrapping the configured model provider
+(GovernedModelProvider); direct chat completions use
+governed_chat_completion(). Responses served from the local response cache
+never reach the governor. Set SCOUT_GOVERNOR=false to disable it.
+
+The limits are for the whole server. With several worker processes each
+worker governs its own share (the limits divided by SCOUT_WORKERS), so the
+workers together stay under them without talking to each other.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import openai
+from agents.items import ModelResponse
+from agents.models.interface import Model, ModelProvider
+
+from metrics import span
+from shared_state import worker_share
+from token_budget import count_tokens
+
+GOVERNOR_ENABLED = os.getenv('SCOUT_GOVERNOR', 'true').lower() == 'true'
+# Rate limits to stay under (set to the account's limits for the models in use),
+# split evenly between worker processes
+REQUESTS_PER_MINUTE = worker_share(float(os.getenv('SCOUT_GOVERNOR_RPM', '500')))
+TOKENS_PER_MINUTE = worker_share(float(os.getenv('SCOUT_GOVERNOR_TPM', '200000')))
+MAX_CONCURRENCY = int(worker_share(int(os.getenv('SCOUT_GOVERNOR_MAX_CONCURRENCY', '16'))))
+# Longest a call may wait for rate budget before it is shed, in seconds
+MAX_WAIT = float(os.getenv('SCOUT_GOVERNOR_MAX_WAIT', '60'))
+# Retries after the first attempt, and the backoff range in seconds
+MAX_RETRIES = int(os.getenv('SCOUT_GOVERNOR_MAX_RETRIES', '4'))
+BACKOFF_BASE = float(os.getenv('SCOUT_GOVERNOR_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('SCOUT_GOVERNOR_BACKOFF_MAX', '30'))
+# Consecutive failures that open the circuit, and how long it stays open in seconds
+BREAKER_FAILURES = int(os.getenv('SCOUT_GOVERNOR_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('SCOUT_GOVERNOR_BREAKER_COOLDOWN', '30'))
+
+# Output tokens reserved for a call that sets no limit, and prompt tokens per image
+DEFAULT_OUTPUT_TOKENS = 500
+IMAGE_TOKENS = 850
+
+T = TypeVar('T')
+
+
+class ModelUnavailableError(Exception):
+    """A model call was refused without being sent (circuit open or rate budget exhausted)."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    """Reservation-based token bucket; callers sleep off their share of any deficit."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self._level = per_minute
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, max_wait: float) -> float:
+        """Take amount from the bucket and return the seconds to wait before using it.
+
+        Raises ModelUnavailableError, taking nothing, when the wait would exceed max_wait.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (amount - self._level) / self.rate, self._paused_until - now)
+            if wait > max_wait:
+                raise ModelUnavailableError(f"Rate budget exhausted (would wait {wait:.1f}s)", retry_after=wait)
+            self._level -= amount
+            return wait
+
+    def refund(self, amount: float):
+        """Give back (or, if negative, take) tokens after the real cost of a call is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+    def pause(self, seconds: float):
+        """Hold back all reservations for the next seconds (after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class _Slots:
+    """Concurrency cap that works across event loops (unlike asyncio.Semaphore)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # The slot was handed over just as we were cancelled; pass it on
+            self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                # The slot moves to the waiter; in_flight stays the same
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_wake, future)
+                    return
+            self.in_flight -= 1
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _CircuitBreaker:
+    """closed -> open after consecutive failures -> half_open after the cooldown -> closed on a good probe."""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise ModelUnavailableError("Model provider circuit is open", retry_after=max(0.0, remaining))
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == 'half_open' or (self.state == 'closed' and self.consecutive_failures >= self.failure_threshold):
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def release_probe(self):
+        """Let another call probe a half-open circuit (this one ended without a verdict)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open'
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds requested by the error response's retry-after-ms / retry-after header, if any."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _classify(error: Exception) -> Optional[str]:
+    """'rate_limited' or 'server_error' for errors worth retrying, None otherwise."""
+    if isinstance(error, openai.RateLimitError):
+        return 'rate_limited'
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+        return 'server_error'
+    if isinstance(error, openai.APIStatusError) and error.status_code in (408, 409):
+        return 'server_error'
+    return None
+
+
+class ModelGovernor:
+    """Rate limits, concurrency cap, retries and circuit breaker shared by all model calls."""
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, tokens_per_minute: float = TOKENS_PER_MINUTE,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES, max_wait: float = MAX_WAIT):
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._slots = _Slots(max_concurrency)
+        self._breaker = _CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN)
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "attempts": 0, "succeeded": 0, "failed": 0, "retries": 0,
+                          "rate_limited": 0, "server_errors": 0, "shed": 0}
+        self._waited_s = 0.0
+        self._backoff_s = 0.0
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    async def _reserve(self, estimated_tokens: int):
+        requests_wait = self._requests.reserve(1, self.max_wait)
+        try:
+            tokens_wait = self._tokens.reserve(estimated_tokens, self.max_wait)
+        except ModelUnavailableError:
+            self._requests.refund(1)
+            raise
+        wait = max(requests_wait, tokens_wait)
+        if wait > 0:
+            with self._lock:
+                self._waited_s += wait
+            try:
+                with span("governor.wait"):
+                    await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled before sending: nothing was used
+                self._requests.refund(1)
+                self._tokens.refund(estimated_tokens)
+                raise
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(BACKOFF_MAX, retry_after) + self._random.uniform(0, BACKOFF_BASE)
+        # Full jitter keeps retries from concurrent callers apart
+        return self._random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Awaitable[T]], estimated_tokens: int = 0,
+                   used_tokens: Optional[Callable[[T], Optional[int]]] = None) -> T:
+        """Run fn (one model request) under the rate limits, retrying transient failures.
+
+        used_tokens extracts the real token count from the result to correct the estimate.
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                self._breaker.before_call()
+            except ModelUnavailableError:
+                self._count("shed")
+                raise
+            error = None
+            try:
+                await self._reserve(estimated_tokens)
+                self._count("attempts")
+                try:
+                    await self._slots.acquire()
+                except BaseException:
+                    self._requests.refund(1)
+                    self._tokens.refund(estimated_tokens)
+                    raise
+                # Tokens the attempt really used; None (unknown, or cancelled in flight) keeps the estimate
+                used: Optional[int] = None
+                try:
+                    result = await fn()
+                except Exception as e:
+                    error = e
+                    # Rate limited, failed or rejected requests don't use tokens
+                    used = 0
+                else:
+                    used = used_tokens(result) if used_tokens else None
+                finally:
+                    self._slots.release()
+                    if used is not None:
+                        self._tokens.refund(estimated_tokens - used)
+            except ModelUnavailableError:
+                self._breaker.release_probe()
+                self._count("shed")
+                raise
+            except BaseException:
+                # Cancelled while waiting or in flight
+                self._breaker.release_probe()
+                raise
+
+            if error is None:
+                self._breaker.record_success()
+                self._count("succeeded")
+                return result
+
+            kind = _classify(error)
+            if kind is None:
+                # The provider answered (e.g. a 400); that says nothing about its health
+                self._breaker.record_success()
+                self._count("failed")
+                raise error
+            self._count('rate_limited' if kind == 'rate_limited' else 'server_errors')
+            if kind == 'rate_limited':
+                retry_after = _retry_after(error)
+                self._requests.pause(retry_after if retry_after is not None else BACKOFF_BASE * 2 ** attempt)
+                self._breaker.release_probe()
+            else:
+                self._breaker.record_failure()
+            if attempt >= self.max_retries or self._breaker.is_open:
+                self._count("failed")
+                raise error
+            delay = self._backoff(attempt, error)
+            attempt += 1
+            self._count("retries")
+            with self._lock:
+                self._backoff_s += delay
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            waited, backoff = self._waited_s, self._backoff_s
+        return {
+            **counters,
+            "in_flight": self._slots.in_flight,
+            "circuit": self._breaker.state,
+            "circuit_opened": self._breaker.times_opened,
+            "rate_limit_wait_s": round(waited, 3),
+            "backoff_s": round(backoff, 3),
+            "limits": {
+                "requests_per_minute": self._requests.capacity,
+                "tokens_per_minute": self._tokens.capacity,
+                "max_concurrency": self._slots.limit,
+            },
+        }
+
+
+def _estimate_tokens(text: str, images: int = 0, max_output_tokens: Optional[int] = None) -> int:
+    return count_tokens(text) + images * IMAGE_TOKENS + (max_output_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+class GovernedModel(Model):
+    """Sends every model turn through the governor."""
+
+    def __init__(self, model: Model, governor: ModelGovernor):
+        self._model = model
+        self._governor = governor
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs,
+                           tracing, *, previous_response_id) -> ModelResponse:
+        prompt = (system_instructions or '') + (input if isinstance(input, str) else json.dumps(input, default=str))
+        estimated = _estimate_tokens(prompt, max_output_tokens=getattr(model_settings, 'max_tokens', None))
+        return await self._governor.call(
+            lambda: self._model.get_response(
+                system_instructions, input, model_settings, tools, output_schema, handoffs, tracing,
+                previous_response_id=previous_response_id,
+            ),
+            estimated,
+            lambda response: response.usage.total_tokens or None,
+        )
+
+    def stream_response(self, *args, **kwargs) -> AsyncIterator:
+        # Streaming is passed through ungoverned
+        return self._model.stream_response(*args, **kwargs)
+
+
+class GovernedModelProvider(ModelProvider):
+    """Wraps every model of another provider in a GovernedModel."""
+
+    def __init__(self, provider: ModelProvider, governor: ModelGovernor):
+        self._provider = provider
+        self._governor = governor
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        return GovernedModel(self._provider.get_model(model_name), self._governor)
+
+
+async def governed_chat_completion(client, **kwargs):
+    """client.chat.completions.create(**kwargs) through the governor (directly when it's disabled)."""
+    governor = get_model_governor()
+    if governor is None:
+        return await client.chat.completions.create(**kwargs)
+    texts, images = [], 0
+    for message in kwargs.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                texts.append(part.get('text', ''))
+            elif part.get('type') == 'image_url':
+                images += 1
+    estimated = _estimate_tokens('\n'.join(texts), images, kwargs.get('max_tokens'))
+    return await governor.call(
+        lambda: client.chat.completions.create(**kwargs),
+        estimated,
+        lambda response: response.usage.total_tokens if response.usage else None,
+    )
+
+
+_governor: Optional[ModelGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_model_governor() -> Optional[ModelGovernor]:
+    """Get the process-wide governor, or None when it is disabled."""
+    global _governor
+    if not GOVERNOR_ENABLED:
+        return None
+    with _governor_lock:
+        if _governor is None:
+            _governor = ModelGovernor()
+        return _governor
@@ -0,0 +1,65 @@
+"""
+Model selection for Scout App backend.
+
+Agents and the vision tool look their model up here instead of naming one
+directly. SCOUT_MODEL_PROVIDER selects the backend:
+
+- 'openai' (default): the real OpenAI models through the shared client.
+- 'fake': a local, deterministic stand-in (see fake_model.py) that makes the
+  expected tool calls and returns schema-valid outputs with configurable
+  latency and errors, for load tests and benchmarks without network access.
+"""
+
+import os
+import threading
+from typing import Optional
+
+from agents import RunConfig, set_tracing_disabled
+from agents.models.interface import ModelProvider
+from agents.models.multi_provider import MultiProvider
+
+MODEL_PROVIDER = os.getenv('SCOUT_MODEL_PROVIDER', 'openai').lower()
+# Model used by all agents, and by the per-page vision calls unless overridden
+AGENT_MODEL = os.getenv('SCOUT_AGENT_MODEL', 'gpt-4o-mini')
+VISION_MODEL = os.getenv('SCOUT_VISION_MODEL', AGENT_MODEL)
+
+_provider: Optional[ModelProvider] = None
+_provider_lock = threading.Lock()
+
+
+def use_fake_models() -> bool:
+    return MODEL_PROVIDER == 'fake'
+
+
+def get_model_provider() -> ModelProvider:
+    """Get the configured model provider."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if MODEL_PROVIDER == 'openai':
+                # Resolves model names against the default client registered by openai_client
+                _provider = MultiProvider()
+            elif MODEL_PROVIDER == 'fake':
+                from fake_model import FakeModelProvider
+                _provider = FakeModelProvider()
+                # Nothing to report traces to when running offline
+                set_tracing_disabled(True)
+            else:
+                raise ValueError(f"Unknown SCOUT_MODEL_PROVIDER '{MODEL_PROVIDER}' (expected 'openai' or 'fake')")
+            from model_governor import GovernedModelProvider, get_model_governor
+            governor = get_model_governor()
+            if governor is not None:
+                # Rate limits, retries and the circuit breaker apply to every model turn
+                _provider = GovernedModelProvider(_provider, governor)
+            from llm_cache import CachingModelProvider, get_llm_cache
+            cache = get_llm_cache()
+            if cache is not None:
+                # Identical model turns are answered from the local response cache,
+                # in front of the governor so cache hits don't use up rate budget
+                _provider = CachingModelProvider(_provider, cache)
+        return _provider
+
+
+def get_run_config() -> RunConfig:
+    """RunConfig to pass to every Runner.run so agents use the configured provider."""
+    return RunConfig(model_provider=get_model_provider(), tracing_disabled=use_fake_models())
@@ -1,12 +1,123 @@
 """
 Network utilities for Scout App backend
+
+Discovery is lazy and cached: nothing touches the network when this module is
+imported, and addresses are looked up on first use and then reused for
+SCOUT_NETWORK_CACHE_TTL seconds. On Linux the interface addresses come from
+ioctl(SIOCGIFADDR) and the default route from /proc/net/route, so no process
+is spawned and no packet or DNS query is sent. Other platforms fall back to a
+connected UDP socket (which sends nothing) and a short ifconfig call.
 """
 
+import functools
+import os
 import socket
+import struct
 import subprocess
 import platform
 import re
-from typing import List, Optional, Dict, Any
+import threading
+import time
+from typing import Callable, List, Optional, Dict, Any
+
+# Seconds that discovered addresses are reused before they are looked up again
+NETWORK_CACHE_TTL = float(os.getenv('SCOUT_NETWORK_CACHE_TTL', '60'))
+SIOCGIFADDR = 0x8915
+# Flag in /proc/net/route for routes that are up
+RTF_UP = 0x1
+
+
+def _cached(func: Callable) -> Callable:
+    """Cache a no-argument function's result for NETWORK_CACHE_TTL seconds."""
+    lock = threading.Lock()
+    entry: Dict[str, Any] = {}
+
+    @functools.wraps(func)
+    def wrapper():
+        with lock:
+            if 'value' not in entry or time.monotonic() - entry['at'] > NETWORK_CACHE_TTL:
+                entry['value'] = func()
+                entry['at'] = time.monotonic()
+            return entry['value']
+    wrapper.cache_clear = entry.clear
+    return wrapper
+
+
+def _linux_interfaces() -> Dict[str, str]:
+    """IPv4 address per interface via ioctl, without spawning ifconfig."""
+    import fcntl
+
+    interfaces = {}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for _index, name in socket.if_nameindex():
+            try:
+                packed = fcntl.ioctl(s.fileno(), SIOCGIFADDR, struct.pack('256s', name[:15].encode()))
+            except OSError:
+                continue  # Interface without an IPv4 address
+            interfaces[name] = socket.inet_ntoa(packed[20:24])
+    return interfaces
+
+
+def _linux_default_interface() -> Optional[str]:
+    """Interface of the default route, from /proc/net/route."""
+    try:
+        with open('/proc/net/route') as f:
+            next(f)  # Header
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 4 and fields[1] == '00000000' and int(fields[3], 16) & RTF_UP:
+                    return fields[0]
+    except (OSError, StopIteration, ValueError):
+        pass
+    return None
+
+
+@_cached
+def _discover_interfaces() -> Dict[str, str]:
+    interfaces = {}
+    try:
+        if platform.system() == 'Linux':
+            interfaces = _linux_interfaces()
+        elif platform.system() == 'Darwin':
+            # Use ifconfig command
+            result = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=2)
+            if result.returncode == 0:
+                current_interface = None
+                for line in result.stdout.split('\n'):
+                    # Check for interface name
+                    if line and not line.startswith('\t') and not line.startswith(' '):
+                        interface_match = re.match(r'^(\w+\d*)', line)
+                        if interface_match:
+                            current_interface = interface_match.group(1)
+                    
+                    # Check for inet address
+                    elif current_interface and 'inet ' in line:
+                        ip_match = re.search(r'inet (\d+\.\d+\.\d+\.\d+)', line)
+                        if ip_match:
+                            interfaces[current_interface] = ip_match.group(1)
+    except Exception:
+        pass
+    return {name: ip for name, ip in interfaces.items() if not ip.startswith('127.')}
+
+
+@_cached
+def _discover_local_ip() -> Optional[str]:
+    if platform.system() == 'Linux':
+        interfaces = _discover_interfaces()
+        default_interface = _linux_default_interface()
+        if default_interface in interfaces:
+            return interfaces[default_interface]
+        # No default route (e.g. an isolated LAN): any non-loopback address will do
+        return next(iter(interfaces.values()), None)
+    try:
+        # Connecting a UDP socket only selects the outgoing address; nothing is sent
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.settimeout(0.1)
+            s.connect(('8.8.8.8', 80))
+            return s.getsockname()[0]
+    except Exception:
+        return next(iter(_discover_interfaces().values()), None)
+
 
 class NetworkUtils:
     """Utility class for network operations and IP detection"""
@@ -14,79 +125,24 @@ class NetworkUtils:
     @staticmethod
     def get_local_ip() -> Optional[str]:
         """
-        Get the local network IP address using socket connection method
-        This is the most reliable method across platforms
+        Get the local network IP address: the address of the interface
+        carrying the default route (cached)
         """
-        try:
-            # Connect to a remote host to get local IP
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.settimeout(0.1)
-            s.connect(('8.8.8.8', 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            return local_ip
-        except Exception:
-            return None
+        return _discover_local_ip()
     
     @staticmethod
     def get_all_local_ips() -> List[str]:
-        """Get all local IP addresses on this machine"""
-        ips = []
-        
-        try:
-            hostname = socket.gethostname()
-            # Get all IP addresses for this hostname
-            for info in socket.getaddrinfo(hostname, None):
-                ip = info[4][0]
-                if ':' not in ip and ip != '127.0.0.1':  # IPv4 only, exclude localhost
-                    ips.append(ip)
-        except Exception:
-            pass
-        
-        # Try alternative method using socket
-        try:
-            # Create a UDP socket
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            if ip not in ips:
-                ips.append(ip)
-        except Exception:
-            pass
-        
-        return list(set(ips))  # Remove duplicates
+        """Get all local IPv4 addresses on this machine, excluding loopback (cached)"""
+        ips = set(_discover_interfaces().values())
+        local_ip = _discover_local_ip()
+        if local_ip:
+            ips.add(local_ip)
+        return sorted(ips)
     
     @staticmethod
     def get_network_interfaces() -> Dict[str, str]:
-        """Get network interfaces and their IP addresses (Unix-like systems)"""
-        interfaces = {}
-        
-        try:
-            if platform.system() in ['Darwin', 'Linux']:
-                # Use ifconfig command
-                result = subprocess.run(['ifconfig'], capture_output=True, text=True)
-                if result.returncode == 0:
-                    current_interface = None
-                    for line in result.stdout.split('\n'):
-                        # Check for interface name
-                        if line and not line.startswith('\t') and not line.startswith(' '):
-                            interface_match = re.match(r'^(\w+\d*)', line)
-                            if interface_match:
-                                current_interface = interface_match.group(1)
-                        
-                        # Check for inet address
-                        elif current_interface and 'inet ' in line:
-                            ip_match = re.search(r'inet (\d+\.\d+\.\d+\.\d+)', line)
-                            if ip_match:
-                                ip = ip_match.group(1)
-                                if ip != '127.0.0.1':  # Exclude localhost
-                                    interfaces[current_interface] = ip
-            
-        except Exception:
-            pass
-        
-        return interfaces
+        """Get network interfaces and their IPv4 addresses (cached)"""
+        return dict(_discover_interfaces())
     
     @staticmethod
     def is_port_available(host: str = 'localhost', port: int = 8000) -> bool:
@@ -150,6 +206,3 @@ class NetworkUtils:
                 return True
         
         return False
-
-# Import struct for IP range checking
-import struct
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Shared OpenAI client for Scout App backend.
+
+One AsyncOpenAI client with a tuned httpx connection pool is created per
+process and used by every tool and agent run, so the many per-page vision
+calls reuse warm keep-alive connections instead of paying a new TCP/TLS
+handshake each. Connection reuse is counted from httpcore trace events and
+reported by get_openai_client_stats().
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+from agents import set_default_openai_client
+from model_provider import use_fake_models
+from model_governor import GOVERNOR_ENABLED
+from metrics import span
+
+# Seconds to wait for a whole request / for establishing a connection
+OPENAI_TIMEOUT = float(os.getenv('SCOUT_OPENAI_TIMEOUT', '120'))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('SCOUT_OPENAI_CONNECT_TIMEOUT', '10'))
+# Connection pool sizing; keep-alive connections idle longer than the expiry are closed
+OPENAI_MAX_CONNECTIONS = int(os.getenv('SCOUT_OPENAI_MAX_CONNECTIONS', '50'))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('SCOUT_OPENAI_MAX_KEEPALIVE', '20'))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('SCOUT_OPENAI_KEEPALIVE_EXPIRY', '90'))
+
+
+class _ConnectionStats:
+    """Counts requests against newly opened connections to show pool reuse."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    async def on_request(self, request: httpx.Request):
+        with self._lock:
+            self.requests += 1
+        # httpcore reports connection lifecycle events through the 'trace' extension
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused_connection_requests": reused,
+                "connection_reuse_ratio": round(reused / self.requests, 4) if self.requests else None,
+            }
+
+
+class _TimedTransport(httpx.AsyncBaseTransport):
+    """Records every OpenAI API request as an 'openai.<endpoint>' span."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.split('/v1/', 1)[-1].strip('/').replace('/', '.') or 'root'
+        with span(f"openai.{endpoint}") as current:
+            response = await self._transport.handle_async_request(request)
+            if response.status_code >= 400:
+                current.fail(f"HTTP {response.status_code}")
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+_stats = _ConnectionStats()
+_client: Optional[AsyncOpenAI] = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Get the process-wide AsyncOpenAI client, creating it and registering it with the agents SDK on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # With the fake model provider, chat completions are answered locally
+            limits = httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            )
+            if use_fake_models():
+                from fake_model import fake_chat_transport
+                transport = fake_chat_transport()
+            else:
+                transport = httpx.AsyncHTTPTransport(limits=limits)
+            http_client = httpx.AsyncClient(
+                transport=_TimedTransport(transport),
+                limits=limits,
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                event_hooks={"request": [_stats.on_request]},
+            )
+            _client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY") or ("fake" if use_fake_models() else None),
+                http_client=http_client,
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                # The model governor retries with shared backoff; retries in the client would multiply them
+                max_retries=0 if GOVERNOR_ENABLED else 2,
+            )
+            # Every Runner.run uses this client instead of creating its own
+            set_default_openai_client(_client, use_for_tracing=True)
+        return _client
+
+
+def get_openai_client_stats() -> Dict[str, Any]:
+    """Request and connection counters for the shared client."""
+    return _stats.snapshot()
+
+
+async def close_openai_client():
+    """Close the shared client's connection pool (called on app shutdown)."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
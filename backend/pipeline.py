@@ -0,0 +1,196 @@
+"""
+Declarative stage pipeline for Scout App backend.
+
+A pipeline is a list of Stages. Each one names the values it reads (inputs)
+and the values it produces (outputs); a stage runs once every stage producing
+one of its inputs has finished, so stages that don't depend on each other run
+concurrently. The orchestrator's flow is expressed this way (see
+scout_orchestrator.PIPELINE):
+
+    Stage('text', extract_text, inputs=('pdf_path',), outputs=('pdf_text',), optional=True)
+
+For every stage the engine also handles:
+
+- skipping: when `when(**inputs)` is false the stage doesn't run and its
+  outputs are None;
+- caching: with a run checkpoint (run_checkpoints.RunCheckpoint), a stage the
+  run already completed is restored instead of run again, and every stage
+  that runs is checkpointed as it finishes;
+- timeouts: `timeout` seconds, or SCOUT_STAGE_TIMEOUTS ("reader=180,vision=120");
+  a stage that runs in a worker thread keeps running there after it times out,
+  but the pipeline no longer waits for it;
+- timings: each run is a `stage.<name>` span, and the pipeline's report lists
+  per stage whether it ran, was restored, skipped or failed, and how long it took;
+- failures: an optional stage that fails or times out yields None outputs and
+  the pipeline carries on; any other failure cancels the stages in flight and
+  raises StageError.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from metrics import span
+from profiling import awaiting_subtasks
+
+
+def _parse_timeouts(spec: str) -> Dict[str, float]:
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, seconds = item.partition('=')
+        timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+# Per-stage timeouts in seconds, overriding the ones the stages declare
+STAGE_TIMEOUTS = _parse_timeouts(os.getenv('SCOUT_STAGE_TIMEOUTS', ''))
+
+
+class StageError(Exception):
+    """A required stage failed; values holds what the pipeline had produced by then."""
+
+    def __init__(self, stage: str, error: BaseException, values: Dict[str, Any]):
+        super().__init__(str(error) or type(error).__name__)
+        self.stage = stage
+        self.error = error
+        self.values = values
+
+
+@dataclass
+class Stage:
+    """One step of a pipeline.
+
+    run(context, **inputs) returns a dict with exactly the stage's outputs.
+    encode(outputs) makes them JSON-serializable for the checkpoint, and
+    restore(context, saved) turns a checkpoint back into outputs, or returns None
+    when it can't be reused. For stages that move the document, file_path(outputs)
+    is where it is afterwards.
+    """
+    name: str
+    run: Callable[..., Awaitable[Dict[str, Any]]]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    when: Optional[Callable[..., bool]] = None
+    optional: bool = False
+    timeout: Optional[float] = None
+    checkpoint: bool = True
+    encode: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    restore: Optional[Callable[[Any, Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+    file_path: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None
+
+
+class Pipeline:
+    """A DAG of stages over named values; `inputs` are the values the caller provides."""
+
+    def __init__(self, stages: Sequence[Stage], inputs: Sequence[str] = ()):
+        self.stages = list(stages)
+        self.inputs = tuple(inputs)
+        self._producers: Dict[str, str] = {name: None for name in self.inputs}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self._producers:
+                    raise ValueError(f"Value {output!r} of stage {stage.name!r} is already produced elsewhere")
+                self._producers[output] = stage.name
+        self._dependencies: Dict[str, set] = {}
+        for stage in self.stages:
+            missing = [name for name in stage.inputs if name not in self._producers]
+            if missing:
+                raise ValueError(f"Stage {stage.name!r} reads {', '.join(missing)}, which nothing produces")
+            self._dependencies[stage.name] = {self._producers[name] for name in stage.inputs} - {None}
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, done = [], set()
+        remaining = [stage.name for stage in self.stages]
+        while remaining:
+            ready = [name for name in remaining if self._dependencies[name] <= done]
+            if not ready:
+                raise ValueError(f"Stages {', '.join(remaining)} depend on each other")
+            order += ready
+            done.update(ready)
+            remaining = [name for name in remaining if name not in done]
+        return order
+
+    async def run(self, values: Dict[str, Any], context: Any = None, checkpoint=None,
+                  report: Optional[Dict[str, Dict[str, Any]]] = None,
+                  status: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Run the stages and return all values. Raises StageError when a required stage fails."""
+        missing = [name for name in self.inputs if name not in values]
+        if missing:
+            raise ValueError(f"Pipeline inputs missing: {', '.join(missing)}")
+        values = dict(values)
+        report = {} if report is None else report
+        status = status or (lambda message: None)
+        stages = {stage.name: stage for stage in self.stages}
+        pending = list(self.order)
+        finished = set()
+        running: Dict[asyncio.Task, Stage] = {}
+        try:
+            while pending or running:
+                for name in [name for name in pending if self._dependencies[name] <= finished]:
+                    pending.remove(name)
+                    stage = stages[name]
+                    task = asyncio.create_task(self._run_stage(stage, values, context, checkpoint, report, status),
+                                               name=f"stage:{name}")
+                    running[task] = stage
+                # The profiler follows the request's awaits into the running stages
+                with awaiting_subtasks(running):
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    try:
+                        values.update(task.result())
+                    except Exception as e:
+                        raise StageError(stage.name, e, values) from e
+                    finished.add(stage.name)
+        finally:
+            # Don't leave stages running after a failure (or a cancelled request)
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return values
+
+    async def _run_stage(self, stage: Stage, values: Dict[str, Any], context: Any, checkpoint,
+                         report: Dict[str, Dict[str, Any]], status: Callable[[str], None]) -> Dict[str, Any]:
+        inputs = {name: values[name] for name in stage.inputs}
+        if stage.when is not None and not stage.when(**inputs):
+            report[stage.name] = {"status": "skipped"}
+            return dict.fromkeys(stage.outputs)
+
+        if checkpoint is not None and stage.checkpoint:
+            saved = checkpoint.completed(stage.name)
+            if saved is not None:
+                outputs = stage.restore(context, saved) if stage.restore else saved
+                if outputs is not None:
+                    report[stage.name] = {"status": "restored"}
+                    status(f"Stage '{stage.name}' restored from checkpoint")
+                    return outputs
+
+        timeout = STAGE_TIMEOUTS.get(stage.name, stage.timeout)
+        started = time.perf_counter()
+        try:
+            with span(f"stage.{stage.name}"):
+                # wait_for runs the stage in a task of its own; name it for the profiler
+                run = asyncio.create_task(stage.run(context, **inputs), name=f"stage:{stage.name}:run")
+                with awaiting_subtasks((run,)):
+                    outputs = await asyncio.wait_for(run, timeout)
+            if set(outputs) != set(stage.outputs):
+                raise TypeError(f"Stage {stage.name!r} returned {sorted(outputs)}, expected {sorted(stage.outputs)}")
+        except Exception as e:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"Stage '{stage.name}' timed out after {timeout:g} s")
+            report[stage.name] = {"status": "failed", "ms": elapsed_ms, "error": str(e)}
+            if not stage.optional:
+                raise e
+            status(f"Stage '{stage.name}' failed, continuing without it: {e}")
+            return dict.fromkeys(stage.outputs)
+        report[stage.name] = {"status": "ran", "ms": round((time.perf_counter() - started) * 1000, 2)}
+
+        if checkpoint is not None and stage.checkpoint:
+            saved = stage.encode(outputs) if stage.encode else outputs
+            file_path = stage.file_path(outputs) if stage.file_path else None
+            checkpoint.complete(stage.name, saved, file_path=file_path)
+        return outputs
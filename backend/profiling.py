@@ -0,0 +1,296 @@
+"""
+On-demand request profiling for Scout App backend.
+
+With SCOUT_PROFILING_ENABLED=true, a request to a processing endpoint that
+carries the 'X-Scout-Profile: 1' header (or '?profile=1') runs its
+orchestration under a sampling profiler:
+
+- A background thread samples the stacks of all threads every
+  SCOUT_PROFILING_INTERVAL_MS via sys._current_frames(). Samples are
+  grouped under three roots:
+    'event-loop'  Python code running on the event loop thread (it blocks
+                  every other request while it runs)
+    'awaiting'    the loop is idle and the request's task is suspended;
+                  the stack is the task's chain of awaits, i.e. where it
+                  waits for the network, a thread or a subprocess. The
+                  chain continues into the tasks registered with
+                  awaiting_subtasks() (like the pipeline's stages), one
+                  stack per running subtask
+    'thread:...'  executor threads running work handed off with
+                  asyncio.to_thread, such as pdf2image rasterization or
+                  PyPDF2 text extraction
+- A loop-lag monitor measures how late the event loop wakes up a sleeping
+  coroutine, which is how long it was blocked.
+
+The folded stacks (one 'frame;frame;frame count' line per stack, the input
+format of flamegraph.pl and speedscope) and a JSON summary are written to
+SCOUT_PROFILES_DIR. Samples cover the whole process, so concurrent requests
+show up in the same profile. When profiling isn't requested, the only cost
+is a header lookup.
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+PROFILING_ENABLED = os.getenv('SCOUT_PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_HEADER = 'X-Scout-Profile'
+PROFILE_QUERY_PARAM = 'profile'
+SAMPLE_INTERVAL = float(os.getenv('SCOUT_PROFILING_INTERVAL_MS', '5')) / 1000
+PROFILES_DIR = os.getenv('SCOUT_PROFILES_DIR', 'local_storage/profiles')
+# The loop-lag probe wakes up this often; lateness beyond the threshold counts as blocked
+LOOP_LAG_INTERVAL = 0.01
+LOOP_LAG_THRESHOLD = 0.005
+MAX_STACK_DEPTH = 128
+TOP_FRAMES = 25
+
+_PROFILE_ID = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$')
+_TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+
+def profiling_requested(request) -> bool:
+    """Whether request asked for a profile (and profiling is enabled at all)."""
+    if not PROFILING_ENABLED:
+        return False
+    value = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY_PARAM) or ''
+    return value.lower() in _TRUE_VALUES
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}".replace(';', ',')
+
+
+def _thread_stack(frame) -> List:
+    """Stack of frame, outermost first."""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(frame)
+        frame = frame.f_back
+    return stack[::-1]
+
+
+# Tasks that a task waits on without awaiting them directly (asyncio.wait, or
+# wait_for's waiter), so the sampler can follow its await chain into them
+_subtasks: Dict[asyncio.Task, Iterable[asyncio.Task]] = {}
+
+
+@contextmanager
+def awaiting_subtasks(tasks: Iterable[asyncio.Task]):
+    """Declare that the current task is waiting on tasks (a live collection) within the block."""
+    task = asyncio.current_task()
+    _subtasks[task] = tasks
+    try:
+        yield
+    finally:
+        _subtasks.pop(task, None)
+
+
+def _await_chains(task: asyncio.Task, prefix: List[str] = ()) -> List[List[str]]:
+    """Where task is suspended: its coroutine and everything it awaits, outermost first.
+
+    Returns one chain per running subtask it waits on, or a single chain.
+    """
+    labels = list(prefix)
+    awaitable = task.get_coro()
+    while awaitable is not None and len(labels) < MAX_STACK_DEPTH:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+        if frame is None:
+            # A future (or the C iterator of one): the end of this task's chain
+            try:
+                # Sampled from another thread; the collection may change meanwhile
+                subtasks = [subtask for subtask in _subtasks.get(task, ()) if not subtask.done()]
+            except RuntimeError:
+                subtasks = []
+            if subtasks:
+                return [chain for subtask in subtasks
+                        for chain in _await_chains(subtask, labels + [f"task:{subtask.get_name()}"])]
+            labels.append(f"<{type(awaitable).__name__}>")
+            break
+        labels.append(_frame_label(frame))
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+    return [labels]
+
+
+class SamplingProfiler:
+    """Samples all thread stacks from a background thread."""
+
+    def __init__(self, loop_thread_id: int, task: Optional[asyncio.Task], interval: float = SAMPLE_INTERVAL):
+        self.loop_thread_id = loop_thread_id
+        self.task = task
+        self.interval = interval
+        self.folded: Counter = Counter()
+        self.own_time: Counter = Counter()
+        self.categories: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='scout-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(thread_id, names.get(thread_id, str(thread_id)), frame)
+            self.samples += 1
+
+    def _sample(self, thread_id: int, thread_name: str, frame):
+        stack = _thread_stack(frame)
+        if not stack:
+            return
+        leaf = stack[-1]
+        leaf_key = (leaf.f_globals.get('__name__'), leaf.f_code.co_name)
+        if thread_id == self.loop_thread_id:
+            if leaf_key == ('selectors', 'select'):
+                # The loop has nothing to run; see what the request is waiting for
+                if self.task is None or self.task.done():
+                    return
+                # Concurrent subtasks (pipeline stages) each count the sample, like threads do
+                for chain in _await_chains(self.task, ['awaiting']):
+                    self._record(chain, 'awaiting')
+                return
+            else:
+                labels = ['event-loop'] + [_frame_label(f) for f in stack]
+                category = 'event-loop'
+        else:
+            # Only executor threads running a work item (asyncio.to_thread); long-lived
+            # background threads such as the folder watcher spend their time blocked
+            running_work_item = any(f.f_code.co_name == 'run' and f.f_globals.get('__name__') == 'concurrent.futures.thread'
+                                    for f in stack)
+            if not running_work_item:
+                return
+            labels = [f"thread:{thread_name}"] + [_frame_label(f) for f in stack]
+            category = 'threads'
+        self._record(labels, category)
+
+    def _record(self, labels: List[str], category: str):
+        self.folded[';'.join(labels)] += 1
+        self.own_time[labels[-1]] += 1
+        self.categories[category] += 1
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a periodically sleeping coroutine."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.lags:
+            return {"probes": 0}
+        blocked = [lag for lag in self.lags if lag > LOOP_LAG_THRESHOLD]
+        return {
+            "probes": len(self.lags),
+            "max_ms": round(max(self.lags) * 1000, 2),
+            "mean_ms": round(sum(self.lags) / len(self.lags) * 1000, 3),
+            "blocked_probes": len(blocked),
+            "blocked_ms": round(sum(blocked) * 1000, 2),
+        }
+
+
+class RequestProfile:
+    """One profiled request: its sampler, loop-lag monitor and the files it produced."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.profiler: Optional[SamplingProfiler] = None
+        self.loop_lag = LoopLagMonitor()
+        self.started = 0.0
+        self.duration = 0.0
+        self.summary: Dict[str, Any] = {}
+
+    def _write(self):
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        folded_path = os.path.join(PROFILES_DIR, f"{self.profile_id}.folded")
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.profiler.folded.items()):
+                f.write(f"{stack} {count}\n")
+        interval_ms = self.profiler.interval * 1000
+        self.summary = {
+            "profile_id": self.profile_id,
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 2),
+            "interval_ms": interval_ms,
+            "samples": self.profiler.samples,
+            # Approximate wall time per category, from the sample counts
+            "sampled_ms": {category: round(count * interval_ms, 1)
+                           for category, count in self.profiler.categories.most_common()},
+            "loop_lag": self.loop_lag.summary(),
+            "top_frames_ms": {frame: round(count * interval_ms, 1)
+                              for frame, count in self.profiler.own_time.most_common(TOP_FRAMES)},
+            "folded_path": folded_path,
+        }
+        with open(os.path.join(PROFILES_DIR, f"{self.profile_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.summary, f, indent=2)
+
+
+@asynccontextmanager
+async def profile_request(name: str, enabled: bool):
+    """Profile the block when enabled; yields the RequestProfile, or None when not profiling."""
+    if not enabled:
+        yield None
+        return
+    profile = RequestProfile(name)
+    profile.profiler = SamplingProfiler(threading.get_ident(), asyncio.current_task())
+    profile.started = time.perf_counter()
+    profile.profiler.start()
+    profile.loop_lag.start()
+    try:
+        yield profile
+    finally:
+        await profile.loop_lag.stop()
+        profile.profiler.stop()
+        profile.duration = time.perf_counter() - profile.started
+        try:
+            await asyncio.to_thread(profile._write)
+        except OSError as e:
+            print(f"Could not write profile {profile.profile_id}: {e}")
+
+
+def read_profile(profile_id: str) -> Optional[str]:
+    """Folded stacks of a stored profile, or None if there is no such profile."""
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(PROFILES_DIR, f"{profile_id}.folded")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read()
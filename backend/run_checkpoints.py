@@ -0,0 +1,233 @@
+"""
+Stage checkpoints for orchestrator runs in Scout App backend.
+
+Every run of the orchestrator gets a run ID and a checkpoint file,
+<SCOUT_RUNS_DIR>/<run_id>.json. As each stage finishes, its output is
+written there (see pipeline.py): the triage decision, the rendered pages (the
+page file is kept next to the checkpoint, with its SHA-256), the vision
+analysis, the reader's content, the classifier's decision, the new name, the
+target folder and the move. Vision analyses are also appended per page to
+<run_id>.vision.jsonl as they arrive, keyed by the page file's hash, so a run
+that fails halfway through vision keeps the pages it already paid for.
+
+Running again with the same run ID (POST /runs/{run_id}/resume, or
+/process-local-pdf?run_id=...) restores the completed stages and starts at
+the first incomplete one. A run ID the server hasn't seen starts a new run
+under that ID, so clients can choose their own. A run that already
+completed returns its stored result. While a run is being processed its
+checkpoint is locked, so a second resume of the same run is refused instead
+of filing the document twice.
+
+The page file of a completed run is deleted; checkpoints are removed after
+SCOUT_RUN_RETENTION_HOURS.
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from credential_store import DEFAULT_USER
+from shared_state import acquire_lock, atomic_write, release_lock
+
+RUNS_DIR = os.getenv('SCOUT_RUNS_DIR', 'local_storage/runs')
+RUN_RETENTION = float(os.getenv('SCOUT_RUN_RETENTION_HOURS', '72')) * 3600
+
+# In pipeline order
+STAGES = ('triage', 'images', 'vision', 'reader', 'classification', 'placement', 'rename', 'folder', 'move', 'learn')
+
+_RUN_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+class RunInProgressError(Exception):
+    """The run is being processed by another request."""
+
+
+def valid_run_id(run_id: str) -> bool:
+    return bool(_RUN_ID.fullmatch(run_id or ''))
+
+
+def _run_path(run_id: str, suffix: str = '.json') -> str:
+    if not valid_run_id(run_id):
+        raise ValueError(f"Invalid run ID: {run_id!r}")
+    return os.path.join(RUNS_DIR, f"{run_id}{suffix}")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RunCheckpoint:
+    """Checkpointed stage outputs of one orchestrator run."""
+
+    def __init__(self, run_id: str, state: Dict[str, Any]):
+        self.run_id = run_id
+        self.state = state
+        self.path = _run_path(run_id)
+        # Rendered pages for the vision tool, and the vision analyses of those pages
+        self.pages_path = _run_path(run_id, '.pages.jsonl')
+        self.vision_path = _run_path(run_id, '.vision.jsonl')
+        self._lock = threading.Lock()
+        self._claim = None
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.state["stages"])
+
+    @property
+    def status(self) -> str:
+        return self.state["status"]
+
+    @property
+    def user_id(self) -> str:
+        """The Drive user whose request started the run; only they may see or resume it."""
+        return self.state.get("user_id", DEFAULT_USER)
+
+    def claim(self):
+        """Lock the run for this process; raises RunInProgressError if it is already being processed."""
+        self._claim = acquire_lock(self.path, blocking=False)
+        if self._claim is None:
+            raise RunInProgressError(f"Run {self.run_id} is already being processed")
+
+    def release(self):
+        if self._claim is not None:
+            release_lock(self._claim)
+            self._claim = None
+
+    def _save(self):
+        self.state["updated"] = time.time()
+        atomic_write(self.path, json.dumps(self.state), mode=0o644)
+
+    def completed(self, stage: str) -> Optional[Dict[str, Any]]:
+        """The stage's checkpointed output, or None if it hasn't completed."""
+        return self.state["stages"].get(stage)
+
+    def complete(self, stage: str, output: Dict[str, Any], file_path: Optional[str] = None):
+        """Checkpoint a stage's output, and where the document is now if the stage moved it."""
+        with self._lock:
+            self.state["stages"][stage] = output
+            if file_path:
+                self.state["file_path"] = file_path
+            self._save()
+
+    def vision_pages(self, images_sha256: str) -> Dict[int, str]:
+        """Analyses recorded for pages of the page file with this hash."""
+        pages: Dict[int, str] = {}
+        if not os.path.exists(self.vision_path):
+            return pages
+        with open(self.vision_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash
+                if entry.get("images") == images_sha256:
+                    pages[int(entry["page"])] = entry["analysis"]
+        return pages
+
+    def record_vision_pages(self, images_sha256: str, analyses: Dict[int, str]):
+        lines = "".join(json.dumps({"images": images_sha256, "page": page, "analysis": analysis}) + "\n"
+                        for page, analysis in analyses.items())
+        with self._lock, open(self.vision_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+    def fail(self, error: str):
+        with self._lock:
+            self.state.update(status="failed", error=error)
+            self._save()
+
+    def finish(self, result: Dict[str, Any]):
+        """Store the run's result; the page file is no longer needed."""
+        with self._lock:
+            self.state.update(status="completed", error=None, result=result)
+            self._save()
+        for path in (self.pages_path, self.vision_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _next_stage(self) -> Optional[str]:
+        # The stage after the last completed one: stages a tier skips (placement is bypass-only) aren't pending
+        done = [STAGES.index(stage) for stage in self.state["stages"] if stage in STAGES]
+        following = STAGES[max(done) + 1:] if done else STAGES
+        return following[0] if following else None
+
+    def summary(self) -> Dict[str, Any]:
+        """What GET /runs/{run_id} shows: status and completed stages, without their outputs."""
+        return {
+            "run_id": self.run_id,
+            "status": self.status,
+            "original_file_name": self.state.get("original_file_name"),
+            "file_path": self.state.get("file_path"),
+            "completed_stages": [stage for stage in STAGES if stage in self.state["stages"]],
+            "next_stage": self._next_stage(),
+            "attempts": self.state["attempts"],
+            "error": self.state.get("error"),
+            "created": self.state["created"],
+            "updated": self.state.get("updated"),
+        }
+
+
+def load_run(run_id: str) -> Optional[RunCheckpoint]:
+    """The run's checkpoint, or None when there is no such run."""
+    path = _run_path(run_id)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return RunCheckpoint(run_id, json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read run checkpoint {path}: {e}")
+        return None
+
+
+_current_run: contextvars.ContextVar[Optional[RunCheckpoint]] = contextvars.ContextVar('run_checkpoint', default=None)
+
+
+def start_run(run_id: Optional[str], file_path: str, original_file_name: str,
+              content_hash: Optional[str] = None, user_id: Optional[str] = None) -> RunCheckpoint:
+    """Claim the checkpoint of run_id (a new run of user_id when None or unknown) for the current request."""
+    run = load_run(run_id) if run_id else None
+    if run is None:
+        prune_runs()
+        run = RunCheckpoint(run_id or uuid.uuid4().hex, {
+            "status": "running", "user_id": user_id or DEFAULT_USER, "file_path": file_path, "original_file_name": original_file_name,
+            "content_hash": content_hash, "stages": {}, "attempts": 0, "error": None, "created": time.time(),
+        })
+    run.claim()
+    # Another worker may have finished a stage between loading and claiming
+    claimed = load_run(run.run_id)
+    if claimed is not None:
+        run.state = claimed.state
+    if run.status != "completed":
+        run.state.update(status="running", attempts=run.state["attempts"] + 1)
+        run._save()
+    _current_run.set(run)
+    return run
+
+
+def current_run() -> Optional[RunCheckpoint]:
+    """The checkpoint of the run the current request is processing, if any."""
+    return _current_run.get()
+
+
+def prune_runs(max_age: float = RUN_RETENTION):
+    """Remove checkpoints and page files of runs not updated for max_age seconds."""
+    if not os.path.isdir(RUNS_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(RUNS_DIR):
+        path = os.path.join(RUNS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # Removed concurrently
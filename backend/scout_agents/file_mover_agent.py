@@ -4,6 +4,7 @@ import os
 import asyncio
 from tools.move_local_file import move_local_file
 from pydantic import BaseModel
+from model_provider import AGENT_MODEL
 
 load_dotenv()
 
@@ -30,7 +31,7 @@ file_mover_agent = Agent(
         "Extract the source file path and target folder path from the task prompt and provide them to the tool. "
         "Your final output MUST be the confirmation returned by the 'move_local_file' tool, matching the FileMoveConfirmation model."
     ),
-    model="gpt-4o-mini",
+    model=AGENT_MODEL,
     tools=[move_local_file],
     output_type=FileMoveConfirmation
 )
@@ -5,6 +5,7 @@ import asyncio
 from tools.search_local_folders import search_local_folders
 from tools.create_local_folder import create_local_folder
 from pydantic import BaseModel
+from model_provider import AGENT_MODEL
 
 load_dotenv()
 
@@ -33,7 +34,7 @@ folder_agent = Agent(
         "6. Your final output MUST be the 'folder_name' and 'folder_path' of the selected or newly created folder, matching the LocalFolderOutput model."
         "   The folder_path should be the full absolute path to the folder."
     ),
-    model="gpt-4o-mini",
+    model=AGENT_MODEL,
     tools=[search_local_folders, create_local_folder],
     output_type=LocalFolderOutput
 )
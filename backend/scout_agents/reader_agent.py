@@ -5,6 +5,7 @@ import asyncio
 from tools.read_local_pdf import read_local_pdf
 from tools.analyze_pdf_images import analyze_pdf_images
 from pydantic import BaseModel
+from model_provider import AGENT_MODEL
 
 load_dotenv()
 
@@ -34,7 +35,7 @@ reader_agent = Agent(
         "Be thorough but concise, focusing on the most important aspects for organizing and categorizing the file. "
         "For scanned documents, emphasize what you can see in the images over limited text extraction results."
     ),
-    model="gpt-4o-mini", 
+    model=AGENT_MODEL,
     tools=[read_local_pdf, analyze_pdf_images],
     output_type=ExtractedContent 
 )
@@ -4,6 +4,7 @@ from tools.rename_local_file import rename_local_file
 import os
 import asyncio
 from pydantic import BaseModel
+from model_provider import AGENT_MODEL
 
 load_dotenv()
 
@@ -26,7 +27,7 @@ rename_agent = Agent(
         "Your final output MUST be ONLY the new filename that the file was successfully renamed to, in the 'filename' field of the output model. "
         "Do not add any other description, explanation, or text."
     ),
-    model="gpt-4o-mini", 
+    model=AGENT_MODEL,
     tools=[rename_local_file],
     output_type=RenameFileOutput
 )
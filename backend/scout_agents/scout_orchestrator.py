@@ -1,52 +1,160 @@
 from agents import Agent, Runner, set_default_openai_key, trace, ItemHelpers
+from agents.items import ToolCallItem, ToolCallOutputItem
 from dotenv import load_dotenv
-from openai import OpenAI
 import os
 import asyncio
+import time
 import base64
+import contextlib
+import json
+import re
+import tempfile
 from io import BytesIO
-from pdf2image import convert_from_bytes
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import pypdfium2 as pdfium
+from pdf2image import convert_from_path
+from PIL import Image
 from scout_agents.reader_agent import reader_agent
 from scout_agents.rename_agent import rename_agent
-from scout_agents.file_mover_agent import file_mover_agent
+from scout_agents.file_mover_agent import FileMoveConfirmation, file_mover_agent
 from scout_agents.folder_agent import folder_agent
+from scout_agents.triage_agent import TEXT_TIER_MODEL, TriageDecision, record_tier_latency, triage_document
+from folder_index import get_folder_index
+from folder_matcher import get_folder_matcher
+from document_classifier import DocumentPrediction, get_document_classifier
+from file_placement import place_file
+from tools.analyze_pdf_images import analyze_page_images
+from tools.read_local_pdf import extract_pdf_text, read_local_pdf
+from openai_client import get_openai_client
+from model_provider import get_run_config
+from token_budget import start_request_budget
+from llm_cache import set_request_aliases
+from metrics import span, start_trace, timed
+from memory_budget import MemoryBudget, current_memory, start_request_memory
+from run_checkpoints import RunCheckpoint, file_sha256, start_run
+from pipeline import Pipeline, Stage, StageError
 
 load_dotenv()
 
 # Set the default OpenAI key
 set_default_openai_key(os.getenv("OPENAI_API_KEY"))
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Reader for documents whose text layer tells the whole story (triage 'text' tier)
+text_reader_agent = reader_agent.clone(
+    name="Local PDF Text Reader Agent",
+    instructions=(
+        "You are an agent that processes local PDF files for organization purposes. "
+        "Use the 'read_local_pdf' tool to extract the document's text. "
+        "Identify document type, main topics, key information, and suitable organizational categories. "
+        "OUTPUT: Provide comprehensive information about the document content in the 'content' field, suitable for file organization and categorization. "
+        "Be thorough but concise."
+    ),
+    model=TEXT_TIER_MODEL,
+    tools=[read_local_pdf],
+)
 
-def extract_pdf_images(pdf_path: str) -> dict:
+# Resolution pages are rendered at for vision, and the lower ones used when a page
+# wouldn't fit the request's memory cap
+VISION_DPI = int(os.getenv('SCOUT_VISION_DPI', '200'))
+FALLBACK_DPIS = tuple(dpi for dpi in (150, 100, 72) if dpi < VISION_DPI)
+# Pages rendered per pdftoppm call; each is loaded and released one at a time
+RENDER_CHUNK_PAGES = int(os.getenv('SCOUT_RENDER_CHUNK_PAGES', '8'))
+# Working set per rendered pixel while a page is converted: the RGB image,
+# its PNG encoding and the base64 string of that
+RENDER_BYTES_PER_PIXEL = 5
+
+def _render_dpi(memory: MemoryBudget, width_pt: float, height_pt: float) -> Optional[int]:
+    """Highest resolution at which a page of this size fits the memory budget, or None."""
+    for dpi in (VISION_DPI,) + FALLBACK_DPIS:
+        if memory.fits(int(width_pt * dpi / 72 * height_pt * dpi / 72 * RENDER_BYTES_PER_PIXEL)):
+            return dpi
+    return None
+
+@timed("pdf.rasterize")
+def extract_pdf_images(pdf_path: str, pages: list = None, output_path: str = None) -> dict:
     """
     Convert PDF to base64-encoded images for vision processing.
     Returns extracted images while keeping original PDF untouched.
+    Only the given (1-based) page numbers are rendered when pages is set.
+
+    Pages are rendered a few at a time into a scratch directory and converted one
+    by one, releasing each page's buffers before the next. With output_path, each
+    page is appended to that file as a JSON line ({"page", "base64_image"}) and the
+    result carries the file's path instead of the images, so memory use doesn't
+    grow with the page count. Pages that would exceed the request's memory cap are
+    rendered at a lower resolution, or skipped when even the lowest one won't fit.
     """
+    memory = current_memory()
     try:
-        # Read PDF into memory
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_bytes = pdf_file.read()
-        
-        # Convert PDF pages to images in memory
-        images = convert_from_bytes(pdf_bytes, dpi=200)
-        
-        # Convert images to base64
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            page_sizes = [pdf.get_page_size(index) for index in range(len(pdf))]
+        finally:
+            pdf.close()
+        wanted = [page for page in (pages or range(1, len(page_sizes) + 1)) if 1 <= page <= len(page_sizes)]
+
         image_data = []
-        for i, image in enumerate(images):
-            buffered = BytesIO()
-            image.save(buffered, format="PNG")
-            base64_image = base64.b64encode(buffered.getvalue()).decode()
-            image_data.append({
-                "page": i + 1,
-                "base64_image": base64_image
-            })
-        
-        return {
+        rendered, skipped, degraded = [], [], []
+        pending = list(wanted)
+        with contextlib.ExitStack() as stack:
+            output = stack.enter_context(open(output_path, 'w')) if output_path else None
+            scratch_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='scout-render-'))
+            while pending:
+                # The resolution is chosen against the memory in use right before each chunk
+                page_size = page_sizes[pending[0] - 1]
+                dpi = _render_dpi(memory, *page_size)
+                if dpi is None:
+                    skipped.append(pending.pop(0))
+                    continue
+                # Consecutive pages of the same size share one pdftoppm call
+                chunk = [pending[0]]
+                while (len(chunk) < min(RENDER_CHUNK_PAGES, len(pending)) and pending[len(chunk)] == chunk[-1] + 1
+                       and page_sizes[pending[len(chunk)] - 1] == page_size):
+                    chunk.append(pending[len(chunk)])
+                del pending[:len(chunk)]
+                if dpi != VISION_DPI:
+                    degraded += chunk
+                paths = convert_from_path(pdf_path, dpi=dpi, first_page=chunk[0], last_page=chunk[-1],
+                                          output_folder=scratch_dir, paths_only=True)
+                for page, path in zip(chunk, sorted(paths)):
+                    with Image.open(path) as image:
+                        buffered = BytesIO()
+                        image.save(buffered, format="PNG")
+                    os.remove(path)
+                    entry = {"page": page, "base64_image": base64.b64encode(buffered.getbuffer()).decode()}
+                    del buffered
+                    memory.sample()
+                    if output is not None:
+                        output.write(json.dumps(entry) + "\n")
+                    else:
+                        image_data.append(entry)
+                    del entry
+                    rendered.append(page)
+
+        if degraded:
+            memory.note(f"rendered pages {_page_ranges(degraded)} below {VISION_DPI} dpi to stay within the memory cap")
+        if skipped:
+            memory.note(f"skipped pages {_page_ranges(skipped)}: they would exceed the memory cap")
+        if wanted and not rendered:
+            return {
+                "success": False,
+                "error": "Not enough memory to render any page within the request's memory cap",
+                "images": []
+            }
+
+        result = {
             "success": True,
-            "page_count": len(images),
-            "images": image_data
+            "page_count": len(rendered),
+            "pages": rendered,
+            "skipped_pages": skipped,
+            "degraded_pages": degraded
         }
+        if output_path:
+            result["images_path"] = output_path
+        else:
+            result["images"] = image_data
+        return result
         
     except Exception as e:
         return {
@@ -55,51 +163,131 @@ def extract_pdf_images(pdf_path: str) -> dict:
             "images": []
         }
 
-# Run with python -m backend.agents.scout_orchestrator
-async def main(pdf_file_path: str, original_file_name: str, use_local_processing: bool = True):
-    status_updates = []
-    error_message = None
-    current_file_path = pdf_file_path
-    current_file_name = original_file_name if original_file_name else "unknown_file" # Fallback if not provided
-    final_renamed_name = current_file_name # Initialize with original or fallback name
-    final_target_folder_name = None
-    final_target_folder_path = None # Local folder path instead of ID
-    final_moved_path_info = None # Local file path after move
-
-    # Extract PDF images for vision processing
-    image_extraction_result = extract_pdf_images(current_file_path)
-    if not image_extraction_result["success"]:
-        status_updates.append(f"Image extraction failed: {image_extraction_result['error']}")
+def _page_ranges(pages: list) -> str:
+    """'1-3, 7' for [1, 2, 3, 7]."""
+    ranges = []
+    for page in pages:
+        if ranges and ranges[-1][1] == page - 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+def collect_tool_outputs(run_result) -> dict:
+    """Map tool name -> list of string outputs from an agent run's items."""
+    tool_names = {}
+    outputs = {}
+    for item in getattr(run_result, 'new_items', []):
+        if isinstance(item, ToolCallItem):
+            call_id = getattr(item.raw_item, 'call_id', None)
+            tool_names[call_id] = getattr(item.raw_item, 'name', None)
+        elif isinstance(item, ToolCallOutputItem):
+            raw_item = item.raw_item
+            call_id = raw_item.get('call_id') if isinstance(raw_item, dict) else getattr(raw_item, 'call_id', None)
+            tool_name = tool_names.get(call_id, 'unknown')
+            outputs.setdefault(tool_name, []).append(str(item.output))
+    return outputs
+
+# Pages analyze_pdf_images couldn't analyze, e.g. 'Page 3: Error analyzing page - ...'
+_FAILED_PAGE = re.compile(r'^Page (\S+): Error analyzing page', re.MULTILINE)
+
+def _pages_available(images_checkpoint: dict, images_path: str) -> bool:
+    """Whether the checkpointed extraction can be reused: nothing was rendered, or the page file is intact."""
+    if not images_checkpoint.get("success"):
+        return True
+    return os.path.exists(images_path) and os.path.getsize(images_path) == images_checkpoint.get("pages_bytes")
+
+def _classifier_text(file_name: str, content: str, extracted_text: Optional[str]) -> str:
+    return f"{file_name}\n{content}\n{extracted_text or ''}"
+
+def _agent_path(prediction: Optional[DocumentPrediction]) -> bool:
+    """Whether the document goes through the Rename, Folder and File Mover Agents."""
+    return prediction is None or not prediction.confident
+
+@dataclass
+class StageContext:
+    """Per-request state shared by the pipeline stages of one run."""
+    run: RunCheckpoint
+    run_config: Any
+    token_budget: Any
+    memory_budget: MemoryBudget
+    status_updates: List[str] = field(default_factory=list)
+    # Filled by the pipeline: status and duration of each stage
+    stage_report: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def images_path(self) -> str:
+        # Rendered pages are streamed to the run's own file for the vision tool; it is kept
+        # until the run completes, so a resumed run doesn't render them again
+        return self.run.pages_path
+
+    def status(self, message: str):
+        self.status_updates.append(message)
+
+async def _triage(ctx: StageContext, pdf_path: str, file_name: str) -> dict:
+    # Route the document to the cheapest pipeline tier that can handle it
+    triage = await asyncio.to_thread(triage_document, pdf_path, file_name)
+    ctx.status(f"Triage: '{triage.tier}' tier ({triage.reason}; {triage.elapsed_ms} ms)")
+    return {"triage": triage}
+
+async def _extract_images(ctx: StageContext, pdf_path: str, triage: TriageDecision) -> dict:
+    if triage.tier == 'text':
+        ctx.status("Image extraction skipped: the text layer covers the document")
+        return {"images": {"success": False, "skipped": True, "images": []}}
+    result = await asyncio.to_thread(extract_pdf_images, pdf_path, triage.vision_pages or None, ctx.images_path)
+    if not result["success"]:
+        ctx.status(f"Image extraction failed: {result['error']}")
         # Continue with text-only processing
+    elif result.get('page_count', 0) == 0:
+        ctx.status("Image extraction succeeded but no pages found")
+        result["success"] = False
     else:
-        page_count = image_extraction_result.get('page_count', 0)
-        if page_count == 0:
-            status_updates.append("Image extraction succeeded but no pages found")
-            image_extraction_result["success"] = False
-        else:
-            status_updates.append(f"Image extraction completed for {page_count} pages")
-            # Validate that images actually contain data
-            images = image_extraction_result.get('images', [])
-            if not images or not all(img.get('base64_image') for img in images):
-                status_updates.append("Warning: Some extracted images are empty or invalid")
-                # Filter out invalid images
-                valid_images = [img for img in images if img.get('base64_image')]
-                image_extraction_result['images'] = valid_images
-                image_extraction_result['page_count'] = len(valid_images)
-                if len(valid_images) == 0:
-                    image_extraction_result["success"] = False
+        ctx.status(f"Image extraction completed for {result['page_count']} pages")
+        if result.get('degraded_pages') or result.get('skipped_pages'):
+            ctx.status(f"Warning: memory cap reached while rendering: {'; '.join(ctx.memory_budget.events)}")
+        # The vision tool keys its per-page checkpoints by the page file's hash
+        result["pages_bytes"] = os.path.getsize(ctx.images_path)
+        result["sha256"] = await asyncio.to_thread(file_sha256, ctx.images_path)
+    return {"images": result}
 
-    try:
-        with trace("Scout Orchestrator Local PDF Trace"):
-            status_updates.append(f"Starting local PDF orchestration for file: {current_file_path}, original name: {current_file_name}")
+async def _extract_text(ctx: StageContext, pdf_path: str) -> dict:
+    # For the classifier and the search index; the reader's read_local_pdf call reuses it
+    return {"pdf_text": await asyncio.to_thread(extract_pdf_text, pdf_path)}
 
-            # Process local PDF file with both text extraction and vision analysis
-            try:
-                status_updates.append(f"Running Reader Agent for file: {current_file_path}")
-                
-                # Prepare task prompt - simplified approach
-                if image_extraction_result["success"]:
-                    task_prompt = f"""Analyze the PDF file '{current_file_path}' (original name: '{current_file_name}') for organization purposes.
+async def _analyze_vision(ctx: StageContext, images: dict) -> dict:
+    # Runs as soon as the pages are rendered, and the reader gets its analysis
+    analysis = await analyze_page_images(file_path=ctx.images_path)
+    if analysis.startswith("Error"):
+        raise ValueError(analysis)
+    failed_pages = _FAILED_PAGE.findall(analysis)
+    if failed_pages:
+        # Fail the (optional) stage so it isn't checkpointed: the reader's analyze_pdf_images
+        # call then retries these pages and takes the others from the run's vision checkpoint
+        raise ValueError(f"Vision analysis failed for page(s) {', '.join(failed_pages)}")
+    return {"vision_analysis": analysis}
+
+async def _read(ctx: StageContext, pdf_path: str, file_name: str, triage: TriageDecision, images: dict,
+                vision_analysis: Optional[str], pdf_text: Optional[str]) -> dict:
+    ctx.status(f"Running Reader Agent for file: {pdf_path}")
+
+    # Prepare task prompt - simplified approach
+    if images["success"] and vision_analysis:
+        # The vision stage already analyzed every page
+        task_prompt = f"""Analyze the PDF file '{pdf_path}' (original name: '{file_name}') for organization purposes.
+
+                        INSTRUCTIONS:
+                        1. The extracted page images were already analyzed; the vision analysis is below, so don't call analyze_pdf_images
+                        2. Use read_local_pdf tool to extract any available text content
+                        3. Combine both analyses to provide comprehensive understanding
+                        4. Focus on: document type, main topics, key information, and organizational categories
+                        5. For scanned documents, prioritize vision analysis as text extraction may be minimal
+
+                        File path: {pdf_path}"""
+        if triage.tier == 'selective_vision':
+            task_prompt += f"\nOnly pages {', '.join(map(str, triage.vision_pages))} of {triage.page_count} were analyzed as images; the other pages have a good text layer."
+        task_prompt += f"\n\n{vision_analysis}"
+    elif images["success"]:
+        task_prompt = f"""Analyze the PDF file '{pdf_path}' (original name: '{file_name}') for organization purposes.
 
                         INSTRUCTIONS:
                         1. First use analyze_pdf_images tool with the extracted image data to get visual understanding
@@ -108,162 +296,336 @@ async def main(pdf_file_path: str, original_file_name: str, use_local_processing
                         4. Focus on: document type, main topics, key information, and organizational categories
                         5. For scanned documents, prioritize vision analysis as text extraction may be minimal
 
-                        File path: {current_file_path}
-                        Extracted {image_extraction_result['page_count']} pages as images for analysis."""
-                else:
-                    # Fallback if image extraction failed
-                    task_prompt = f"Read the content of local PDF file '{current_file_path}' (original name: '{current_file_name}') and extract key information for organization. Image extraction failed: {image_extraction_result.get('error', 'Unknown error')}, so rely on text extraction only."
-                
-                # Store image data globally for tools to access
-                if image_extraction_result["success"]:
-                    # Store image data in a way tools can access it
-                    import json
-                    global_images_file = "/tmp/pdf_images_data.json"
-                    with open(global_images_file, 'w') as f:
-                        json.dump(image_extraction_result["images"], f)
-                    
-                    # Add instruction to task prompt
-                    task_prompt += f"\n\nNOTE: Image data is available. Use analyze_pdf_images tool with file_path='{global_images_file}' to access the extracted images."
-                
-                read_file_run = await Runner.run(
-                    reader_agent, 
-                    task_prompt
-                )
-                extracted_content_model = read_file_run.final_output
-                status_updates.append(f"Reader agent processed. Output content: {getattr(extracted_content_model, 'content', 'N/A')}")
-                context_for_agents = getattr(extracted_content_model, 'content', '') # Use .content attribute
-            except Exception as e:
-                error_message = str(e)
-                status_updates.append(f"Error during Reader Agent execution: {error_message}")
-                raise
-
-            # 2. Rename Agent
-            try:
-                status_updates.append(f"Running Rename Agent for file: {current_file_name}")
-                rename_payload = {
-                    "file_path": current_file_path,
-                    "current_file_name": current_file_name,
-                    "context": context_for_agents,
-                    "task_prompt": f"Based on the context ('{context_for_agents[:200]}...') and current name, suggest a new, concise, and descriptive filename for the local PDF file '{current_file_name}' at '{current_file_path}'. Output only the new filename."
-                }
-                rename_file_run = await Runner.run(
-                    rename_agent, 
-                    rename_payload["task_prompt"]
-                )
-                renamed_file_info = rename_file_run.final_output
-                # Extract new filename from rename_agent's output (RenameFileOutput(filename: str))
-                if hasattr(renamed_file_info, 'filename') and isinstance(renamed_file_info.filename, str) and renamed_file_info.filename.strip():
-                    final_renamed_name = renamed_file_info.filename.strip()
-                    status_updates.append(f"Rename agent suggested new name: '{final_renamed_name}'")
-                else:
-                    status_updates.append(f"Rename agent did not return a valid new filename (got: {renamed_file_info}), using current name: {current_file_name}")
-                # Note: actual rename operation happens within the agent. File path may change.
-                # Update the current file path if rename was successful
-                if final_renamed_name != current_file_name:
-                    import os
-                    current_file_dir = os.path.dirname(current_file_path)
-                    current_file_path = os.path.join(current_file_dir, final_renamed_name)
-                current_file_name = final_renamed_name # Update current name for subsequent agents
-            except Exception as e:
-                error_message = str(e)
-                status_updates.append(f"Error during Rename Agent execution: {error_message}")
-                raise
-
-            # 3. Folder Agent
-            folder_payload = {
-                "file_path": current_file_path, 
-                "file_name": current_file_name, 
-                "context": context_for_agents, # Pass the extracted string content
-                "task_prompt": f"Based on the content and name ('{current_file_name}') of local PDF file '{current_file_path}', determine a suitable local folder structure. If a relevant folder like 'Project Reports' or 'Invoices' exists, use it. Otherwise, create a new folder with an appropriate name. Output the folder name and path."
-            }
-            try:
-                status_updates.append(f"Running Folder Agent for file: {current_file_name}")
-                folder_suggestion_run = await Runner.run(
-                    folder_agent, 
-                    folder_payload["task_prompt"]
-                )
-                folder_info = folder_suggestion_run.final_output
-                # Extract folder_name and folder_path from folder_agent's output (LocalFolderOutput(folder_name: str, folder_path: str))
-                if hasattr(folder_info, 'folder_name') and hasattr(folder_info, 'folder_path'):
-                    final_target_folder_name = getattr(folder_info, 'folder_name', None)
-                    final_target_folder_path = getattr(folder_info, 'folder_path', None)
-                    if not final_target_folder_name or not final_target_folder_path:
-                        status_updates.append(f"Folder agent returned incomplete data: Name='{final_target_folder_name}', Path='{final_target_folder_path}'. Cannot proceed with move.")
-                        raise ValueError(f"Folder agent did not return a valid folder name and path. Got: Name='{final_target_folder_name}', Path='{final_target_folder_path}'")
-                else:
-                    status_updates.append(f"Folder agent did not return expected LocalFolderOutput. Got: {folder_info}. Cannot proceed with move.")
-                    raise ValueError(f"Folder agent did not return expected LocalFolderOutput. Got: {folder_info}")
-                status_updates.append(f"File '{current_file_name}' at '{current_file_path}' to be organized in folder: '{final_target_folder_name}' (Path: {final_target_folder_path}) ")
-            except Exception as e:
-                error_message = str(e)
-                status_updates.append(f"Error during Folder Agent execution: {error_message}")
-                raise
-
-            # 4. File Mover Agent
-            # Ensure final_target_folder_path is valid before attempting move
-            if not final_target_folder_path:
-                status_updates.append(f"Cannot move file: Target folder path is missing. Skipping move operation.")
-                final_moved_path_info = {"status": "skipped", "reason": "Missing target folder path"}
-            else:
-                mover_payload = {
-                    "file_path": current_file_path,
-                    "file_name": current_file_name,
-                    "target_folder_name": final_target_folder_name,
-                    "target_folder_path": final_target_folder_path, 
-                    "task_prompt": f"Move the local PDF file '{current_file_name}' from '{current_file_path}' into the local folder named '{final_target_folder_name}' (Path: '{final_target_folder_path}'). Confirm success or report issues."
-                }
-                try:
-                    status_updates.append(f"Running File Mover Agent for file: {current_file_name} to folder: {final_target_folder_name}")
-                    move_file_run = await Runner.run(
-                        file_mover_agent, 
-                        mover_payload["task_prompt"]
-                    )
-                    final_moved_path_info = move_file_run.final_output
-                    status_updates.append(f"File move processed. Mover output: {final_moved_path_info}")
-                except Exception as e:
-                    error_message = str(e)
-                    status_updates.append(f"Error during File Mover Agent execution: {error_message}")
-                    raise
-            
-            status_updates.append("Local PDF orchestration completed.")
+                        File path: {pdf_path}
+                        Extracted {images['page_count']} pages as images for analysis."""
+        if triage.tier == 'selective_vision':
+            task_prompt += f"\nOnly pages {', '.join(map(str, triage.vision_pages))} of {triage.page_count} were extracted as images; the other pages have a good text layer."
+    elif images.get("skipped"):
+        task_prompt = f"Read the content of local PDF file '{pdf_path}' (original name: '{file_name}') using the read_local_pdf tool and extract key information for organization."
+    else:
+        # Fallback if image extraction failed
+        task_prompt = f"Read the content of local PDF file '{pdf_path}' (original name: '{file_name}') and extract key information for organization. Image extraction failed: {images.get('error', 'Unknown error')}, so rely on text extraction only."
+
+    # The extracted pages were streamed to images_path for the tool to read
+    if images["success"] and not vision_analysis:
+        task_prompt += f"\n\nNOTE: Image data is available. Use analyze_pdf_images tool with file_path='{ctx.images_path}' to access the extracted images."
+
+    with span("agent.reader"):
+        read_file_run = await Runner.run(
+            text_reader_agent if triage.tier == 'text' else reader_agent,
+            task_prompt,
+            run_config=ctx.run_config
+        )
+    ctx.token_budget.record_run('reader', read_file_run)
+    extracted_content_model = read_file_run.final_output
+    ctx.status(f"Reader agent processed. Output content: {getattr(extracted_content_model, 'content', 'N/A')}")
+    # Use .content attribute, condensed so later stages don't carry an oversized summary
+    content = ctx.token_budget.fit('context', getattr(extracted_content_model, 'content', ''))
+    # Keep the raw tool results so the document can be searched later without re-reading it
+    reader_tool_outputs = collect_tool_outputs(read_file_run)
+    tool_vision_analysis = None
+    if reader_tool_outputs.get('analyze_pdf_images'):
+        tool_vision_analysis = "\n\n".join(reader_tool_outputs['analyze_pdf_images'])
+    extracted_text = pdf_text
+    if reader_tool_outputs.get('read_local_pdf') and not ctx.token_budget.was_condensed('pdf_text'):
+        extracted_text = "\n\n".join(reader_tool_outputs['read_local_pdf'])
+    return {"content": content, "extracted_text": extracted_text, "tool_vision_analysis": tool_vision_analysis}
+
+async def _classify(ctx: StageContext, pdf_path: str, file_name: str, content: str,
+                    extracted_text: Optional[str]) -> dict:
+    # Documents of a type the agents filed often enough before go straight to their folder
+    classifier = get_document_classifier()
+    if classifier is None:
+        return {"prediction": None}
+    base_dir = os.path.dirname(os.path.abspath(pdf_path))
+    with span("classifier.predict"):
+        prediction = classifier.predict(base_dir, _classifier_text(file_name, content, extracted_text))
+    if prediction is not None and not prediction.confident:
+        ctx.status(f"Document classifier not used: {prediction.reason}")
+    return {"prediction": prediction}
+
+async def _place(ctx: StageContext, pdf_path: str, prediction: DocumentPrediction) -> dict:
+    # Rename and move in one placement, without the Rename, Folder and File Mover Agents
+    started = time.perf_counter()
+    with span("classifier.place_file"):
+        new_file_path = await asyncio.to_thread(place_file, pdf_path, prediction.folder_path, prediction.filename)
+    get_document_classifier().record_bypass(time.perf_counter() - started)
+    ctx.status(f"Document classifier filed '{os.path.basename(new_file_path)}' in '{prediction.folder_name}' ({prediction.reason}); skipping Rename, Folder and File Mover Agents")
+    return {"placement": FileMoveConfirmation(
+        source_file_path=pdf_path,
+        target_folder_path=prediction.folder_path,
+        new_file_path=new_file_path,
+        status='success'
+    )}
 
+async def _rename(ctx: StageContext, pdf_path: str, file_name: str, content: str,
+                  prediction: Optional[DocumentPrediction]) -> dict:
+    ctx.status(f"Running Rename Agent for file: {file_name}")
+    task_prompt = f"Based on the context ('{ctx.token_budget.fit('rename', content)}...') and current name, suggest a new, concise, and descriptive filename for the local PDF file '{file_name}' at '{pdf_path}'. Output only the new filename."
+    with span("agent.rename"):
+        rename_file_run = await Runner.run(
+            rename_agent,
+            task_prompt,
+            run_config=ctx.run_config
+        )
+    ctx.token_budget.record_run('rename', rename_file_run)
+    renamed_file_info = rename_file_run.final_output
+    renamed_name = file_name
+    # Extract new filename from rename_agent's output (RenameFileOutput(filename: str))
+    if hasattr(renamed_file_info, 'filename') and isinstance(renamed_file_info.filename, str) and renamed_file_info.filename.strip():
+        renamed_name = renamed_file_info.filename.strip()
+        ctx.status(f"Rename agent suggested new name: '{renamed_name}'")
+    else:
+        ctx.status(f"Rename agent did not return a valid new filename (got: {renamed_file_info}), using current name: {file_name}")
+    # The agent renames the file with its tool, which picks a free name ('name (1).pdf' when
+    # the name is taken), so the file is where the tool says, not necessarily at the suggestion
+    renamed_paths = [path for path in collect_tool_outputs(rename_file_run).get('rename_local_file', [])
+                     if os.path.isfile(path)]
+    renamed_path = pdf_path
+    if renamed_paths:
+        renamed_path = renamed_paths[-1]
+        renamed_name = os.path.basename(renamed_path)
+    elif renamed_name != file_name:
+        ctx.status(f"Rename agent did not rename the file; it stays at '{pdf_path}'")
+    return {"renamed_name": renamed_name, "renamed_path": renamed_path}
+
+async def _choose_folder(ctx: StageContext, renamed_path: str, renamed_name: str, content: str,
+                         prediction: Optional[DocumentPrediction]) -> dict:
+    # Try the local folder matcher first; only ambiguous documents need the Folder Agent
+    folder_match = None
+    try:
+        base_dir = os.path.dirname(os.path.abspath(renamed_path))
+        folder_matcher = get_folder_matcher()
+        folder_matcher.add_folders(get_folder_index(base_dir).list_folders(max_depth=1, base=base_dir))
+        with span("folder_matcher"):
+            folder_match = folder_matcher.match(base_dir, f"{renamed_name}\n{content}")
     except Exception as e:
+        ctx.status(f"Local folder matcher unavailable: {e}")
+    if folder_match:
+        ctx.status(f"Local folder matcher selected '{folder_match.folder_name}' (score {folder_match.score:.2f}, runner-up {folder_match.runner_up_score:.2f}); skipping Folder Agent")
+        return {"folder_name": folder_match.folder_name, "folder_path": folder_match.folder_path}
+
+    ctx.status(f"Running Folder Agent for file: {renamed_name}")
+    task_prompt = f"Based on the content and name ('{renamed_name}') of local PDF file '{renamed_path}', determine a suitable local folder structure. If a relevant folder like 'Project Reports' or 'Invoices' exists, use it. Otherwise, create a new folder with an appropriate name. Output the folder name and path."
+    with span("agent.folder"):
+        folder_suggestion_run = await Runner.run(
+            folder_agent,
+            task_prompt,
+            run_config=ctx.run_config
+        )
+    ctx.token_budget.record_run('folder', folder_suggestion_run)
+    folder_info = folder_suggestion_run.final_output
+    # Extract folder_name and folder_path from folder_agent's output (LocalFolderOutput(folder_name: str, folder_path: str))
+    if not (hasattr(folder_info, 'folder_name') and hasattr(folder_info, 'folder_path')):
+        ctx.status(f"Folder agent did not return expected LocalFolderOutput. Got: {folder_info}. Cannot proceed with move.")
+        raise ValueError(f"Folder agent did not return expected LocalFolderOutput. Got: {folder_info}")
+    folder_name = getattr(folder_info, 'folder_name', None)
+    folder_path = getattr(folder_info, 'folder_path', None)
+    if not folder_name or not folder_path:
+        ctx.status(f"Folder agent returned incomplete data: Name='{folder_name}', Path='{folder_path}'. Cannot proceed with move.")
+        raise ValueError(f"Folder agent did not return a valid folder name and path. Got: Name='{folder_name}', Path='{folder_path}'")
+    ctx.status(f"File '{renamed_name}' at '{renamed_path}' to be organized in folder: '{folder_name}' (Path: {folder_path}) ")
+    return {"folder_name": folder_name, "folder_path": folder_path}
+
+async def _move(ctx: StageContext, renamed_path: str, renamed_name: str, folder_name: str, folder_path: str,
+                prediction: Optional[DocumentPrediction]) -> dict:
+    ctx.status(f"Running File Mover Agent for file: {renamed_name} to folder: {folder_name}")
+    task_prompt = f"Move the local PDF file '{renamed_name}' from '{renamed_path}' into the local folder named '{folder_name}' (Path: '{folder_path}'). Confirm success or report issues."
+    with span("agent.mover"):
+        move_file_run = await Runner.run(
+            file_mover_agent,
+            task_prompt,
+            run_config=ctx.run_config
+        )
+    ctx.token_budget.record_run('move', move_file_run)
+    move = move_file_run.final_output
+    ctx.status(f"File move processed. Mover output: {move}")
+    return {"move": move}
+
+async def _learn(ctx: StageContext, move: FileMoveConfirmation, renamed_name: str, folder_path: str,
+                 file_name: str, content: str, extracted_text: Optional[str]) -> dict:
+    # Learn the name and folder the document actually ended up with
+    renamed_name, _, folder_path = _filed_as(move, renamed_name, None, folder_path)
+    # Teach the local folder matcher where this kind of document was filed
+    try:
+        folder_matcher = get_folder_matcher()
+        await asyncio.to_thread(folder_matcher.learn, folder_path, f"{renamed_name}\n{content}")
+        folder_matcher.save_later()
+    except Exception as e:
+        print(f"Could not update folder matcher: {e}")
+    # Teach the document classifier this document's type
+    classifier = get_document_classifier()
+    if classifier is not None:
+        try:
+            agent_path_ms = sum(ctx.stage_report.get(stage, {}).get("ms", 0) for stage in ('rename', 'folder', 'move'))
+            classifier.record_agent_path(agent_path_ms / 1000)
+            await asyncio.to_thread(classifier.learn, folder_path, renamed_name,
+                                    _classifier_text(file_name, content, extracted_text))
+            classifier.save_later()
+        except Exception as e:
+            print(f"Could not update document classifier: {e}")
+    return {}
+
+def _filed_as(move: Optional[FileMoveConfirmation], renamed_name: Optional[str], folder_name: Optional[str],
+              folder_path: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(file name, folder name, folder path) of the document after a successful move, else as given.
+
+    The move tool picks a free name ('name (1).pdf') when the renamed one is taken in the target folder.
+    """
+    new_file_path = getattr(move, 'new_file_path', None) if getattr(move, 'status', None) == 'success' else None
+    if not new_file_path:
+        return renamed_name, folder_name, folder_path
+    new_folder_path = os.path.dirname(new_file_path)
+    return os.path.basename(new_file_path), os.path.basename(new_folder_path), new_folder_path
+
+def _move_file_path(outputs: dict) -> Optional[str]:
+    move = outputs.get("move") or outputs.get("placement")
+    return move.new_file_path if getattr(move, 'status', None) == 'success' else None
+
+def _restore_move(key: str) -> Callable:
+    return lambda ctx, saved: {key: FileMoveConfirmation(**saved[key]) if saved[key] else None}
+
+def _encode_move(key: str) -> Callable:
+    return lambda outputs: {key: outputs[key].model_dump() if outputs[key] is not None else None}
+
+# The orchestrator's stages. Text extraction runs alongside triage, image
+# extraction and vision; the confident classifier placement and the three
+# agent stages exclude each other.
+PIPELINE = Pipeline([
+    Stage('triage', _triage, inputs=('pdf_path', 'file_name'), outputs=('triage',),
+          encode=lambda outputs: outputs["triage"].to_dict(),
+          restore=lambda ctx, saved: {"triage": TriageDecision(**saved)}),
+    Stage('images', _extract_images, inputs=('pdf_path', 'triage'), outputs=('images',),
+          restore=lambda ctx, saved: saved if _pages_available(saved["images"], ctx.images_path) else None),
+    Stage('text', _extract_text, inputs=('pdf_path',), outputs=('pdf_text',), optional=True, checkpoint=False),
+    Stage('vision', _analyze_vision, inputs=('images',), outputs=('vision_analysis',),
+          when=lambda images: images["success"], optional=True, timeout=300),
+    Stage('reader', _read, inputs=('pdf_path', 'file_name', 'triage', 'images', 'vision_analysis', 'pdf_text'),
+          outputs=('content', 'extracted_text', 'tool_vision_analysis'), timeout=300),
+    Stage('classification', _classify, inputs=('pdf_path', 'file_name', 'content', 'extracted_text'),
+          outputs=('prediction',), optional=True,
+          # Keep the earlier decision on resume, even if the classifier has learned since
+          encode=lambda outputs: {"prediction": outputs["prediction"].to_dict() if outputs["prediction"] else None},
+          restore=lambda ctx, saved: {"prediction": DocumentPrediction(**saved["prediction"]) if saved["prediction"] else None}),
+    Stage('placement', _place, inputs=('pdf_path', 'prediction'), outputs=('placement',),
+          when=lambda prediction, **_: not _agent_path(prediction),
+          encode=_encode_move('placement'), restore=_restore_move('placement'), file_path=_move_file_path),
+    Stage('rename', _rename, inputs=('pdf_path', 'file_name', 'content', 'prediction'),
+          outputs=('renamed_name', 'renamed_path'), when=lambda prediction, **_: _agent_path(prediction),
+          timeout=180, file_path=lambda outputs: outputs["renamed_path"]),
+    Stage('folder', _choose_folder, inputs=('renamed_path', 'renamed_name', 'content', 'prediction'),
+          outputs=('folder_name', 'folder_path'), when=lambda prediction, **_: _agent_path(prediction), timeout=180),
+    Stage('move', _move, inputs=('renamed_path', 'renamed_name', 'folder_name', 'folder_path', 'prediction'),
+          outputs=('move',), when=lambda prediction, folder_path, **_: _agent_path(prediction) and bool(folder_path),
+          timeout=180, encode=_encode_move('move'), restore=_restore_move('move'), file_path=_move_file_path),
+    Stage('learn', _learn, inputs=('move', 'renamed_name', 'folder_path', 'file_name', 'content', 'extracted_text'),
+          outputs=(), when=lambda move, **_: getattr(move, 'status', None) == 'success', optional=True),
+], inputs=('pdf_path', 'file_name'))
+
+# Run with python -m backend.agents.scout_orchestrator
+@timed("orchestrator")
+async def main(pdf_file_path: str, original_file_name: str, use_local_processing: bool = True,
+               run_id: Optional[str] = None, content_hash: Optional[str] = None,
+               user_id: Optional[str] = None):
+    """Organize the PDF at pdf_file_path. Every stage is checkpointed under the run's ID.
+
+    With the ID of an earlier run (and pdf_file_path where that run left the
+    document), the completed stages are restored and processing starts at the
+    first incomplete one. Raises RunInProgressError when that run is being
+    processed by another request. A new run belongs to user_id (default: the
+    'default' user).
+    """
+    run = start_run(run_id, pdf_file_path, original_file_name, content_hash, user_id)
+    try:
+        if run.status == "completed":
+            result = dict(run.state["result"])
+            result["status_updates"] = result["status_updates"] + [f"Run {run.run_id} had already completed; returning its result"]
+            return result
+        result = await _orchestrate(run, pdf_file_path, original_file_name)
+        result["run_id"] = run.run_id
+        if result["error_message"]:
+            # Completed stages stay checkpointed for a resume
+            run.fail(result["error_message"])
+        else:
+            run.finish(result)
+        return result
+    finally:
+        run.release()
+
+async def _orchestrate(run: RunCheckpoint, pdf_file_path: str, original_file_name: str):
+    # Make sure every agent run below goes through the shared, pooled client
+    get_openai_client()
+    ctx = StageContext(
+        run=run,
+        run_config=get_run_config(),
+        # Per-request token accounting; the tools record into it as well
+        token_budget=start_request_budget(),
+        # Per-request memory accounting for page rendering
+        memory_budget=start_request_memory(),
+    )
+    # Per-request stage timings; the pipeline, tools and API clients add their spans to it
+    request_trace = start_trace()
+    # The working copy's timestamped name and the page file differ per upload; keep them out of response cache keys
+    set_request_aliases(upload_path=pdf_file_path, upload_name=os.path.basename(pdf_file_path), images_path=ctx.images_path)
+    file_name = original_file_name if original_file_name else "unknown_file" # Fallback if not provided
+    values = {"pdf_path": pdf_file_path, "file_name": file_name}
+    error_message = None
+
+    started = time.perf_counter()
+    if run.resumed:
+        ctx.status(f"Resuming run {run.run_id}; restoring completed stages: {', '.join(run.state['stages'])}")
+    try:
+        with trace("Scout Orchestrator Local PDF Trace"):
+            ctx.status(f"Starting local PDF orchestration for file: {pdf_file_path}, original name: {file_name}")
+            values = await PIPELINE.run(values, ctx, checkpoint=run, report=ctx.stage_report, status=ctx.status)
+        ctx.status("Local PDF orchestration completed.")
+    except StageError as e:
+        values = e.values
         error_message = str(e)
-        status_updates.append(f"Error during orchestration: {error_message}")
+        ctx.status(f"Error during orchestration ({e.stage} stage): {error_message}")
         # Log full traceback for server-side debugging
         import traceback
-        print(f"Orchestrator Error: {error_message}\n{traceback.format_exc()}")
+        print(f"Orchestrator Error in stage '{e.stage}': {error_message}\n{''.join(traceback.format_exception(e.error))}")
+
+    triage = values.get("triage")
+    prediction = values.get("prediction")
+    placement = values.get("placement")
+    if placement is not None:
+        final_move = placement
+        final_renamed_name = os.path.basename(placement.new_file_path)
+        final_target_folder_name = prediction.folder_name
+    else:
+        final_move = values.get("move")
+        final_renamed_name, final_target_folder_name, _ = _filed_as(
+            final_move, values.get("renamed_name") or file_name, values.get("folder_name"), values.get("folder_path"))
 
     # Prepare final_path_suggestion string
     final_path_suggestion_str = None
-    if final_moved_path_info:
-        if isinstance(final_moved_path_info, dict):
-            fmpi_status = final_moved_path_info.get('status', 'unknown')
-            fmpi_detail = str(final_moved_path_info)
-        elif hasattr(final_moved_path_info, 'status'): # Assuming it's an object
-            fmpi_status = getattr(final_moved_path_info, 'status', 'unknown')
-            fmpi_detail = str(final_moved_path_info) # Or format specific attributes
-        else:
-            fmpi_status = 'unknown'
-            fmpi_detail = str(final_moved_path_info)
-        
-        final_path_suggestion_str = f"Move status: {fmpi_status}. Details: {fmpi_detail}"
+    if final_move:
+        final_path_suggestion_str = f"Move status: {getattr(final_move, 'status', 'unknown')}. Details: {final_move}"
 
-    # Cleanup temporary files
-    try:
-        global_images_file = "/tmp/pdf_images_data.json"
-        if os.path.exists(global_images_file):
-            os.remove(global_images_file)
-    except Exception:
-        pass  # Ignore cleanup errors
-    
+    if triage is not None:
+        record_tier_latency(triage.tier, time.perf_counter() - started)
+
+    # The page file is removed when the run completes, and kept for a resume if it failed
     return {
         "original_file": original_file_name or os.path.basename(pdf_file_path), # String
         "renamed_file": final_renamed_name, # String
         "target_folder": final_target_folder_name, # String (can be None)
         "final_path_suggestion": final_path_suggestion_str, # String (can be None)
-        "status_updates": status_updates,
-        "error_message": error_message
+        "status_updates": ctx.status_updates,
+        "error_message": error_message,
+        # Not part of the API response; used to populate the full-text search index
+        "extracted_content": values.get("content") or "",
+        # What the reader worked from: its own tool call's analysis, else the vision stage's
+        "vision_analysis": values.get("tool_vision_analysis") or values.get("vision_analysis"),
+        "extracted_text": values.get("extracted_text") or values.get("pdf_text"),
+        "token_usage": ctx.token_budget.report(),
+        "triage": triage.to_dict() if triage else None,
+        "classification": prediction.to_dict() if prediction else None,
+        "memory": ctx.memory_budget.report(),
+        "stages": ctx.stage_report,
+        "spans": request_trace.to_list()
     }
 
 # if __name__ == "__main__":
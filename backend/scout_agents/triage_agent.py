@@ -1,23 +1,184 @@
-from agents import Agent, Runner, set_default_openai_key
-from dotenv import load_dotenv
+"""
+Local document triage for the Scout orchestrator.
+
+Decides, without any model call, how much work a document needs:
+
+- 'text': the text layer covers the document; skip image extraction and run
+  the reader on the text alone, with SCOUT_TEXT_TIER_MODEL.
+- 'selective_vision': a mostly digital document with some scanned or
+  image-heavy pages; only those pages are rendered and analyzed.
+- 'full_vision': a scanned document; every page goes to vision analysis.
+
+The decision uses page count, text-layer density per page, file size per page
+and keyword rules on the file name and first page. Decisions and the end-to-end
+latency per tier are recorded and reported by get_triage_stats().
+"""
+
 import os
-import asyncio
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import pypdfium2 as pdfium
+
+from metrics import timed
+from model_provider import AGENT_MODEL
+
+# Model for the reader on the text tier
+TEXT_TIER_MODEL = os.getenv('SCOUT_TEXT_TIER_MODEL', AGENT_MODEL)
+# A page with fewer extractable characters than this counts as scanned
+MIN_TEXT_CHARS_PER_PAGE = int(os.getenv('SCOUT_TRIAGE_MIN_TEXT_CHARS', '200'))
+# Fraction of text pages at or above which a document is routed to the text tier,
+# and below which it counts as scanned
+TEXT_TIER_COVERAGE = float(os.getenv('SCOUT_TRIAGE_TEXT_COVERAGE', '0.9'))
+SCANNED_COVERAGE = float(os.getenv('SCOUT_TRIAGE_SCANNED_COVERAGE', '0.2'))
+# Pages inspected for their text layer; longer documents are judged on this sample
+MAX_INSPECTED_PAGES = int(os.getenv('SCOUT_TRIAGE_MAX_INSPECTED_PAGES', '50'))
+# Most pages rendered on the selective tier, and on the full tier (0 = all)
+SELECTIVE_VISION_MAX_PAGES = int(os.getenv('SCOUT_TRIAGE_SELECTIVE_MAX_PAGES', '4'))
+FULL_VISION_MAX_PAGES = int(os.getenv('SCOUT_TRIAGE_FULL_MAX_PAGES', '0'))
+# Text documents this large per page carry embedded images worth a look at the first page
+IMAGE_HEAVY_BYTES_PER_PAGE = int(os.getenv('SCOUT_TRIAGE_IMAGE_HEAVY_BYTES_PER_PAGE', str(400 * 1024)))
+
+# Content that the text layer alone doesn't capture well
+VISUAL_KEYWORDS = re.compile(
+    r'\b(diagram|chart|graph|floor ?plan|drawing|sketch|photo|photograph|screenshot|map|'
+    r'grundriss|zeichnung|skizze|foto|lageplan)\b', re.IGNORECASE)
+# Routine paperwork that the text layer describes completely
+ROUTINE_KEYWORDS = re.compile(
+    r'\b(invoice|receipt|bill|statement|quote|order confirmation|payslip|'
+    r'rechnung|quittung|beleg|kontoauszug|angebot|gehaltsabrechnung)\b', re.IGNORECASE)
+
+
+@dataclass
+class TriageDecision:
+    tier: str
+    reason: str
+    page_count: int
+    inspected_pages: int
+    text_pages: int
+    text_coverage: float
+    file_size: int
+    vision_pages: List[int] = field(default_factory=list)
+    model: Optional[str] = None
+    elapsed_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _page_text_lengths(pdf_path: str, max_pages: int):
+    """(page count, characters of text on each of the first max_pages pages, first page text)."""
+    document = pdfium.PdfDocument(pdf_path)
+    try:
+        page_count = len(document)
+        lengths = []
+        first_page_text = ''
+        for index in range(min(page_count, max_pages)):
+            page = document[index]
+            textpage = page.get_textpage()
+            text = textpage.get_text_bounded()
+            if index == 0:
+                first_page_text = text
+            lengths.append(len(text.strip()))
+            textpage.close()
+            page.close()
+        return page_count, lengths, first_page_text
+    finally:
+        document.close()
+
+
+@timed("triage")
+def triage_document(pdf_path: str, original_file_name: str = '') -> TriageDecision:
+    """Pick the pipeline tier for a local PDF."""
+    started = time.perf_counter()
+    file_size = os.path.getsize(pdf_path)
+    try:
+        page_count, lengths, first_page_text = _page_text_lengths(pdf_path, MAX_INSPECTED_PAGES)
+    except Exception as e:
+        # Unreadable text layer; vision is the only chance to learn anything
+        decision = TriageDecision('full_vision', f"Could not inspect text layer: {e}", 0, 0, 0, 0.0, file_size)
+        decision.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        return decision
+
+    text_pages = [i + 1 for i, length in enumerate(lengths) if length >= MIN_TEXT_CHARS_PER_PAGE]
+    scanned_pages = [i + 1 for i, length in enumerate(lengths) if length < MIN_TEXT_CHARS_PER_PAGE]
+    coverage = len(text_pages) / len(lengths) if lengths else 0.0
+    keywords_text = f"{original_file_name}\n{first_page_text[:4000]}"
+    visual = VISUAL_KEYWORDS.search(keywords_text)
+    routine = ROUTINE_KEYWORDS.search(keywords_text)
+    image_heavy = page_count and file_size / page_count > IMAGE_HEAVY_BYTES_PER_PAGE
+
+    decision = TriageDecision('text', '', page_count, len(lengths), len(text_pages), round(coverage, 3), file_size)
+    if page_count == 0 or coverage < SCANNED_COVERAGE:
+        decision.tier = 'full_vision'
+        decision.reason = f"Scanned document: {len(text_pages)} of {len(lengths)} inspected pages have a text layer"
+        last_page = page_count if not FULL_VISION_MAX_PAGES else min(page_count, FULL_VISION_MAX_PAGES)
+        decision.vision_pages = list(range(1, last_page + 1))
+    elif coverage >= TEXT_TIER_COVERAGE and (routine or not (visual or image_heavy)):
+        decision.tier = 'text'
+        decision.reason = (f"Text layer on {len(text_pages)} of {len(lengths)} inspected pages"
+                           + (f"; routine document ('{routine.group(0)}')" if routine else ""))
+        decision.model = TEXT_TIER_MODEL
+    else:
+        decision.tier = 'selective_vision'
+        pages = scanned_pages
+        if visual or image_heavy or not pages:
+            # Visual content is usually announced on (or sits on) the first page
+            pages = [1] + [page for page in pages if page != 1]
+        decision.vision_pages = pages[:SELECTIVE_VISION_MAX_PAGES]
+        reasons = []
+        if scanned_pages:
+            reasons.append(f"{len(scanned_pages)} page(s) without text layer")
+        if visual:
+            reasons.append(f"visual content keyword '{visual.group(0)}'")
+        if image_heavy:
+            reasons.append(f"{file_size // max(1, page_count) // 1024} KB per page suggests embedded images")
+        decision.reason = "; ".join(reasons) or "Partial text layer"
+    decision.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    return decision
+
+
+class _TriageStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, float]] = {}
+
+    def record(self, tier: str, seconds: float):
+        with self._lock:
+            entry = self._tiers.setdefault(tier, {"documents": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            entry["documents"] += 1
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                tier: {
+                    "documents": int(entry["documents"]),
+                    "mean_seconds": round(entry["total_seconds"] / entry["documents"], 3),
+                    "max_seconds": round(entry["max_seconds"], 3),
+                }
+                for tier, entry in self._tiers.items()
+            }
+
+
+_stats = _TriageStats()
+
 
-load_dotenv()
+def record_tier_latency(tier: str, seconds: float):
+    """Record how long a document routed to tier took end to end."""
+    _stats.record(tier, seconds)
 
-# Set the default OpenAI key
-set_default_openai_key(os.getenv("OPENAI_API_KEY"))
 
-# Create the agent
-agent = Agent(
-    name="Triage Agent",
-    instructions="You decide to which agent you handoff the task.",
-    model="gpt-4o-mini",
-)
+def get_triage_stats() -> Dict[str, Any]:
+    """Documents and latency per tier since startup."""
+    return _stats.snapshot()
 
-async def main():
-    test_run = await Runner.run(agent, "Why is the sky blue?")
-    print(test_run.final_output)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    import sys
+    for path in sys.argv[1:]:
+        print(path, triage_document(path, os.path.basename(path)).to_dict())
@@ -0,0 +1,135 @@
+"""
+State shared between worker processes of Scout App backend.
+
+In production the app runs as SCOUT_WORKERS uvicorn worker processes (see
+app.py). The SQLite stores (metadata, response cache) already handle
+concurrent writers. The files here need help: OAuth tokens, and the learned
+folder matcher and document classifier state. Those are read and written
+under an advisory lock on a sidecar `<file>.lock` (fcntl.flock, so it is
+released when a worker dies) and replaced atomically, so readers never see a
+half-written file.
+
+Limits that are meant for the whole server, like the model governor's rate
+limits, are divided between the workers with worker_share().
+
+Learned state is saved with DebouncedSave: learning schedules a save a few
+seconds out (SCOUT_LEARN_SAVE_DELAY) on a timer thread, so a burst of filed
+documents costs one merge and write instead of one per document.
+"""
+
+import contextlib
+import os
+import tempfile
+import threading
+from typing import IO, Callable, Iterator, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks; fine for a single worker
+    fcntl = None
+
+# Number of worker processes serving the app; set by app.py when it starts them
+WORKERS = max(1, int(os.getenv('SCOUT_WORKERS', '1')))
+# Seconds between learning something and saving it (and everything learned meanwhile)
+LEARN_SAVE_DELAY = float(os.getenv('SCOUT_LEARN_SAVE_DELAY', '5'))
+
+
+def worker_share(limit: float, minimum: float = 1) -> float:
+    """This worker's part of a limit that applies to the whole server."""
+    return max(minimum, limit / WORKERS)
+
+
+def acquire_lock(path: str, shared: bool = False, blocking: bool = True) -> Optional[IO]:
+    """Take an advisory lock on path; returns the handle to pass to release_lock.
+
+    Non-blocking, returns None when another process (or handle) holds the lock.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    lock_file = open(f"{path}.lock", 'a')
+    if fcntl is None:
+        return lock_file
+    flags = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB)
+    try:
+        fcntl.flock(lock_file, flags)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def release_lock(lock_file: IO):
+    # Closing the file releases the flock
+    lock_file.close()
+
+
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """Hold an advisory lock on path across processes (shared for readers, exclusive for writers)."""
+    lock_file = acquire_lock(path, shared)
+    try:
+        yield
+    finally:
+        release_lock(lock_file)
+
+
+def atomic_write(path: str, data: Union[str, bytes], mode: int = 0o600):
+    """Write data to a temporary file next to path and rename it over path."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data.encode('utf-8') if isinstance(data, str) else data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def file_version(path: str) -> Optional[Tuple[int, int]]:
+    """Identifies the current contents of a file written by atomic_write; None when it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    # Every atomic write is a new inode, so this changes even within one mtime tick
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class DebouncedSave:
+    """Calls save on a background thread once, delay seconds after the first of any number of schedule() calls."""
+
+    def __init__(self, save: Callable[[], None], name: str, delay: float = LEARN_SAVE_DELAY):
+        self._save = save
+        self._name = name
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def schedule(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self._delay, self._run)
+                self._timer.name = f"{self._name}-save"
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self._save()
+        except Exception as e:
+            print(f"Could not save {self._name}: {e}")
+
+    def flush(self):
+        """Save now if a save is scheduled (e.g. on shutdown)."""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+            self._run()
@@ -0,0 +1,81 @@
+"""
+Startup timing for Scout App backend.
+
+app.py imports this module before anything else and marks the end of its own
+imports and of the startup hooks. The report adds how long the process had
+been running at each mark, which includes interpreter and uvicorn start-up,
+and lists which heavy dependencies are loaded so far.
+
+The agents SDK, OpenAI client, pdf2image and the Google client libraries are
+imported on first use rather than when the app is imported. With
+SCOUT_PRELOAD=true (the default), the orchestrator is imported on a
+background thread right after startup. The server can take requests
+immediately, and the first document usually doesn't pay for the imports.
+Turn preloading off for reload-heavy development.
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+IMPORT_STARTED = time.perf_counter()
+PRELOAD_ENABLED = os.getenv('SCOUT_PRELOAD', 'true').lower() == 'true'
+# Modules whose import dominates cold start when loaded eagerly
+HEAVY_MODULES = ('agents', 'openai', 'pdf2image', 'PyPDF2', 'pypdfium2', 'numpy',
+                 'googleapiclient', 'google_auth_oauthlib')
+
+_lock = threading.Lock()
+_phases: Dict[str, Dict[str, Optional[float]]] = {}
+_preloads: Dict[str, Dict[str, Any]] = {}
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started (Linux), or None."""
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces; fields after it are space separated
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def mark(phase: str):
+    """Record that a startup phase has finished."""
+    age = process_age()
+    with _lock:
+        _phases[phase] = {
+            "since_app_import_ms": round((time.perf_counter() - IMPORT_STARTED) * 1000, 1),
+            "process_age_ms": round(age * 1000) if age is not None else None,
+        }
+
+
+def preload(name: str, loader: Callable[[], Any]):
+    """Run loader on a daemon thread and record how long it took."""
+    def run():
+        started = time.perf_counter()
+        entry = {"status": "running"}
+        with _lock:
+            _preloads[name] = entry
+        try:
+            loader()
+            entry["status"] = "done"
+        except Exception as e:
+            entry.update(status="failed", error=str(e))
+            print(f"Preloading {name} failed: {e}")
+        entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    threading.Thread(target=run, name=f"preload-{name}", daemon=True).start()
+
+
+def get_startup_report() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "phases": {phase: dict(values) for phase, values in _phases.items()},
+            "preload": {name: dict(entry) for name, entry in _preloads.items()},
+            "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        }
@@ -0,0 +1,123 @@
+import hashlib
+import os
+
+import pytest
+
+import content_store
+from content_store import ContentStore
+
+PDF = b'%PDF-1.4 test document'
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # No background compactions racing the tests
+    monkeypatch.setattr(content_store, 'COMPACT_EVERY', 0)
+    return ContentStore(str(tmp_path / 'cas'))
+
+
+def age(path, days):
+    """Make the object's last upload days older."""
+    seen_path = path + content_store.SEEN_SUFFIX
+    old = os.stat(seen_path).st_mtime - days * 86400
+    os.utime(seen_path, (old, old))
+
+
+def test_identical_uploads_are_stored_once(store):
+    first = store.put_bytes(PDF)
+    second = store.put_bytes(PDF)
+
+    assert first.content_hash == hashlib.sha256(PDF).hexdigest()
+    assert not first.deduplicated
+    assert second.deduplicated
+    assert first.path == second.path == store.object_path(first.content_hash)
+    assert store.put_bytes(b'other').content_hash != first.content_hash
+    assert os.listdir(os.path.join(store.root, 'tmp')) == []
+
+
+def test_reupload_leaves_stored_and_filed_copies_untouched(store, tmp_path):
+    stored = store.put_bytes(PDF)
+    filed = store.checkout(stored.content_hash, str(tmp_path / 'work'), 'bill.pdf')
+    old = os.stat(stored.path).st_mtime - 86400
+    os.utime(stored.path, (old, old))
+    age(stored.path, 60)
+
+    assert store.put_bytes(PDF).deduplicated
+    # The filed document shares the object's inode, so its timestamps must not change
+    assert os.stat(filed).st_mtime == old
+    # Retention counts from the new upload
+    assert store.compact(retention_days=30)['objects_removed'] == 0
+    os.unlink(filed)
+    assert store.compact(retention_days=30)['objects_removed'] == 0
+
+
+def test_objects_are_read_only(store):
+    stored = store.put_bytes(PDF)
+    assert os.stat(stored.path).st_mode & 0o777 == 0o444
+
+
+def test_objects_stored_before_sidecars_go_by_their_mtime(store):
+    stored = store.put_bytes(PDF)
+    os.unlink(stored.path + content_store.SEEN_SUFFIX)
+    old = os.stat(stored.path).st_mtime - 60 * 86400
+    os.utime(stored.path, (old, old))
+
+    assert store.compact(retention_days=30)['objects_removed'] == 1
+
+
+def test_checkout_links_working_copies(store, tmp_path):
+    stored = store.put_bytes(PDF)
+    first = store.checkout(stored.content_hash, str(tmp_path / 'work'), 'bill.pdf')
+    second = store.checkout(stored.content_hash, str(tmp_path / 'work'), 'bill.pdf')
+
+    assert os.path.basename(first) == 'bill.pdf'
+    assert second != first
+    with open(second, 'rb') as f:
+        assert f.read() == PDF
+    assert store.reference_count(stored.content_hash) == 2
+
+
+def test_compact_removes_only_old_unreferenced_objects(store, tmp_path):
+    linked = store.put_bytes(PDF)
+    store.checkout(linked.content_hash, str(tmp_path / 'work'), 'bill.pdf')
+    unreferenced = store.put_bytes(b'abandoned upload')
+    recent = store.put_bytes(b'recent upload')
+    age(linked.path, 60)
+    age(unreferenced.path, 60)
+
+    stats = store.compact(retention_days=30)
+
+    assert stats['objects_scanned'] == 3
+    assert stats['objects_removed'] == 1
+    assert stats['bytes_freed'] == len(b'abandoned upload')
+    assert not os.path.exists(unreferenced.path)
+    assert not os.path.exists(unreferenced.path + content_store.SEEN_SUFFIX)
+    assert os.path.exists(linked.path) and os.path.exists(recent.path)
+    # The removed object's shard directories went with it
+    assert not os.path.exists(os.path.dirname(unreferenced.path))
+
+
+def test_reupload_after_compaction_stores_again(store):
+    stored = store.put_bytes(PDF)
+    age(stored.path, 60)
+    store.compact(retention_days=30)
+    assert store.reference_count(stored.content_hash) == 0
+
+    again = store.put_bytes(PDF)
+    assert not again.deduplicated
+    assert os.path.exists(again.path)
+
+
+def test_checkout_of_compacted_object(store, tmp_path):
+    stored = store.put_bytes(PDF)
+    age(stored.path, 60)
+    store.compact(retention_days=30)
+
+    with pytest.raises(FileNotFoundError):
+        store.checkout(stored.content_hash, str(tmp_path / 'work'), 'bill.pdf')
+
+    # Given the uploaded data, checkout stores it again
+    path = store.checkout(stored.content_hash, str(tmp_path / 'work'), 'bill.pdf', data=PDF)
+    with open(path, 'rb') as f:
+        assert f.read() == PDF
+    assert store.reference_count(stored.content_hash) == 1
@@ -0,0 +1,152 @@
+import asyncio
+import itertools
+import json
+import re
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from drive_client import DRIVE_API_URL, AsyncDriveClient, DriveAPIError
+
+
+class FakeDrive:
+    """Folders of a Drive, served over the REST endpoints the client uses."""
+
+    def __init__(self):
+        self.folders = {}  # id -> (name, parent id)
+        self.requests = 0
+        self._ids = itertools.count(1)
+
+    def exists(self, folder_id):
+        return folder_id == 'root' or folder_id in self.folders
+
+    def delete(self, folder_id):
+        for child in [child for child, (_, parent) in self.folders.items() if parent == folder_id]:
+            self.delete(child)
+        del self.folders[folder_id]
+
+    def handle(self, request):
+        self.requests += 1
+        if request.method == 'GET' and request.url.path.endswith('/files'):
+            name, parent = re.search(r"name = '([^']*)' and '([^']*)' in parents", request.url.params['q']).groups()
+            if not self.exists(parent):
+                return httpx.Response(404, text='File not found')
+            files = [{'id': folder_id, 'name': name} for folder_id, folder in self.folders.items()
+                     if folder == (name, parent)]
+            return httpx.Response(200, json={'files': files})
+        if request.method == 'POST' and request.url.path.endswith('/files'):
+            metadata = json.loads(request.content)
+            parent = metadata['parents'][0]
+            if not self.exists(parent):
+                return httpx.Response(404, text='File not found')
+            folder_id = f"f{next(self._ids)}"
+            self.folders[folder_id] = (metadata['name'], parent)
+            return httpx.Response(200, json={'id': folder_id, 'name': metadata['name']})
+        return httpx.Response(400, text='Unexpected request')
+
+
+@pytest.fixture
+def drive():
+    return FakeDrive()
+
+
+def make_client(drive):
+    http = httpx.AsyncClient(base_url=DRIVE_API_URL, transport=httpx.MockTransport(drive.handle))
+    credentials = SimpleNamespace(token='token', valid=True)
+    return AsyncDriveClient('alice', http=http, load_credentials=lambda force_refresh: credentials)
+
+
+def test_forget_folder_path_drops_ancestors_and_descendants():
+    client = make_client(FakeDrive())
+    client._folder_path_memo = {
+        ('root', 'Finance'): 'finance',
+        ('root', 'Finance', 'Invoices'): 'invoices',
+        ('root', 'Finance', 'Invoices', '2026'): '2026',
+        ('root', 'Finance', 'Invoices', '2026', 'Q1'): 'q1',
+        ('root', 'Finance', 'Receipts'): 'receipts',
+        ('root', 'Finance Archive'): 'archive',
+        ('shared', 'Finance'): 'shared-finance',
+    }
+
+    client.forget_folder_path(' Finance / Invoices ')
+
+    assert client._folder_path_memo == {
+        ('root', 'Finance', 'Receipts'): 'receipts',
+        ('root', 'Finance Archive'): 'archive',
+        ('shared', 'Finance'): 'shared-finance',
+    }
+
+
+def test_ensure_folder_path_memoizes_resolved_prefixes(drive):
+    async def main():
+        client = make_client(drive)
+        first = await client.ensure_folder_path('Finance/Invoices/2026')
+        requests = drive.requests
+        again = await client.ensure_folder_path('Finance/Invoices/2026')
+        sibling = await client.ensure_folder_path('Finance/Receipts')
+        await client._http.aclose()
+        return first, again, sibling, requests
+
+    first, again, sibling, requests = asyncio.run(main())
+    assert first == again
+    # One lookup for Finance, then each new folder is created without looking under it
+    assert requests == 4
+    assert drive.requests == requests + 2
+    invoices = drive.folders[first][1]
+    finance = drive.folders[invoices][1]
+    assert drive.folders[sibling] == ('Receipts', finance)
+
+
+def test_concurrent_calls_create_each_folder_once(drive):
+    async def main():
+        client = make_client(drive)
+        ids = await asyncio.gather(*(client.ensure_folder_path('Finance/Invoices') for _ in range(5)))
+        await client._http.aclose()
+        return ids
+
+    assert len(set(asyncio.run(main()))) == 1
+    assert sorted(name for name, _ in drive.folders.values()) == ['Finance', 'Invoices']
+
+
+def test_path_resolves_again_after_an_ancestor_was_deleted(drive):
+    async def main():
+        client = make_client(drive)
+        await client.ensure_folder_path('Finance/Invoices')
+        finance = next(folder_id for folder_id, (name, _) in drive.folders.items() if name == 'Finance')
+        drive.delete(finance)
+
+        # Creating 2026 under the memoized, deleted Finance/Invoices fails with 404, so
+        # the path is forgotten and created again
+        folder_id = await client.ensure_folder_path('Finance/Invoices/2026')
+        await client._http.aclose()
+        return client, folder_id
+
+    client, folder_id = asyncio.run(main())
+    assert drive.folders[folder_id][0] == '2026'
+    assert all(drive.exists(memoized) for memoized in client._folder_path_memo.values())
+
+
+def test_missing_root_still_fails(drive):
+    async def main():
+        client = make_client(drive)
+        try:
+            with pytest.raises(DriveAPIError) as raised:
+                await client.ensure_folder_path('Finance', root_id='deleted')
+            return raised.value.status_code
+        finally:
+            await client._http.aclose()
+
+    assert asyncio.run(main()) == 404
+
+
+def test_folder_path_locks_are_released(drive):
+    async def main():
+        client = make_client(drive)
+        await asyncio.gather(*(client.ensure_folder_path(f"Finance/{year}") for year in range(2020, 2026)))
+        await client._http.aclose()
+        return client
+
+    client = asyncio.run(main())
+    assert len(client._folder_path_memo) == 7
+    assert client._folder_path_locks == {} and client._folder_path_lock_users == {}
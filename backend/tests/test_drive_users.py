@@ -0,0 +1,196 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+
+import auth_sessions
+import drive_pool
+from drive_pool import DrivePool, current_drive_user, set_drive_user
+
+
+@pytest.fixture(autouse=True)
+def session_secret(monkeypatch):
+    monkeypatch.setattr(auth_sessions, '_secret', b'test-secret')
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    """Stored credentials per user, as (access token, refresh token)."""
+    stored = {}
+
+    def get_drive_credentials(user_id, min_valid_seconds=0):
+        if user_id not in stored:
+            return None
+        token, refresh_token = stored[user_id]
+        return SimpleNamespace(token=token, refresh_token=refresh_token, expiry=None, valid=True)
+
+    monkeypatch.setattr(drive_pool, 'get_drive_credentials', get_drive_credentials)
+    return stored
+
+
+@pytest.fixture
+def pool():
+    pool = DrivePool(max_users=2, refresh_interval=3600)
+    yield pool
+    asyncio.run(pool.aclose())
+
+
+def test_each_user_gets_their_own_session(pool, tokens):
+    tokens['alice'] = ('alice-token', 'alice-refresh')
+    tokens['bob'] = ('bob-token', 'bob-refresh')
+
+    alice, bob = pool.session('alice'), pool.session('bob')
+
+    assert alice is not bob and alice.drive is not bob.drive
+    assert pool.session('alice') is alice
+    assert (alice.drive.user_id, bob.drive.user_id) == ('alice', 'bob')
+    assert asyncio.run(alice.drive._get_token()) == 'alice-token'
+    assert asyncio.run(bob.drive._get_token()) == 'bob-token'
+    assert pool.session('carol').load_credentials() is None
+
+
+def test_least_recently_used_session_is_evicted(pool, tokens):
+    alice, bob = pool.session('alice'), pool.session('bob')
+    assert pool.session('alice') is alice
+    pool.session('carol')
+
+    assert pool.session('alice') is alice
+    assert pool.stats()['evictions'] == 1
+    # bob was least recently used; coming back, bob gets a new session (evicting carol)
+    assert pool.session('bob') is not bob
+    assert pool.stats()['evictions'] == 2
+    assert pool.stats()['users'] == 2
+
+
+def test_reloaded_credentials_update_or_replace_the_session(pool, tokens):
+    tokens['alice'] = ('token-1', 'refresh-1')
+    session = pool.session('alice')
+    creds = session.load_credentials()
+    session._service = 'service'
+
+    # A refreshed access token is written into the credentials the service was built on
+    tokens['alice'] = ('token-2', 'refresh-1')
+    assert session.load_credentials(force_refresh=True) is creds
+    assert creds.token == 'token-2' and session._service == 'service'
+
+    # A new grant starts over
+    tokens['alice'] = ('token-3', 'refresh-2')
+    assert session.load_credentials(force_refresh=True).token == 'token-3'
+    assert session._service is None
+
+
+def test_drive_user_is_per_request(pool):
+    async def request(user_id):
+        set_drive_user(user_id)
+        await asyncio.sleep(0.01)  # Let the other request set its user
+        return current_drive_user(), pool.session().user_id
+
+    async def main():
+        return await asyncio.gather(request('alice'), request('bob'), request(None))
+
+    assert asyncio.run(main()) == [('alice', 'alice'), ('bob', 'bob'), ('default', 'default')]
+
+
+def test_invalid_user_id_is_refused():
+    for user_id in ('../token', 'a/b', ' alice', 'x' * 200):
+        with pytest.raises(ValueError):
+            set_drive_user(user_id)
+
+
+def test_session_tokens():
+    token = auth_sessions.issue_session('alice')
+    assert auth_sessions.verify_session(token) == 'alice'
+
+    payload, _, signature = token.partition('.')
+    forged = auth_sessions.issue_session('bob').partition('.')[0]
+    assert auth_sessions.verify_session(f"{forged}.{signature}") is None
+    assert auth_sessions.verify_session(f"{payload}.{'0' * len(signature)}") is None
+    assert auth_sessions.verify_session(payload) is None
+    assert auth_sessions.verify_session('') is None
+    assert auth_sessions.verify_session(auth_sessions.issue_session('alice', ttl=-1)) is None
+
+
+def test_session_tokens_signed_with_another_secret_are_refused(monkeypatch):
+    token = auth_sessions.issue_session('alice')
+    monkeypatch.setattr(auth_sessions, '_secret', b'another-secret')
+    assert auth_sessions.verify_session(token) is None
+
+
+def test_oauth_state_is_single_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth_sessions, 'OAUTH_STATE_DIR', str(tmp_path / 'states'))
+
+    state = auth_sessions.create_oauth_state('alice')
+    assert auth_sessions.consume_oauth_state(state) == 'alice'
+    assert auth_sessions.consume_oauth_state(state) is None
+    assert auth_sessions.consume_oauth_state('../../session_secret') is None
+    assert auth_sessions.consume_oauth_state(None) is None
+
+    expired = auth_sessions.create_oauth_state('bob')
+    monkeypatch.setattr(auth_sessions, 'OAUTH_STATE_TTL', -1)
+    assert auth_sessions.consume_oauth_state(expired) is None
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    # Importing the app opens its stores under local_storage/
+    monkeypatch.chdir(tmp_path)
+    import app
+    return app
+
+
+def http_request(path='/documents', headers=(), cookie=None):
+    headers = [(name.lower().encode(), value.encode()) for name, value in headers]
+    if cookie:
+        headers.append((b'cookie', f"{auth_sessions.SESSION_COOKIE}={cookie}".encode()))
+    return Request({'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': headers})
+
+
+def select_user(app_module, request):
+    """The Drive user the request acts for, or the middleware's response when it is refused."""
+    async def call_next(request):
+        return current_drive_user()
+
+    return asyncio.run(app_module.select_drive_user(request, call_next))
+
+
+def test_requests_act_for_the_user_of_their_session(app_module):
+    session = auth_sessions.issue_session('alice')
+    assert select_user(app_module, http_request(headers=[('Authorization', f"Bearer {session}")])) == 'alice'
+    assert select_user(app_module, http_request(cookie=session)) == 'alice'
+    assert select_user(app_module, http_request(headers=[('Authorization', 'Bearer forged.token')])).status_code == 401
+
+
+def test_requests_without_a_session_are_refused(app_module, monkeypatch):
+    monkeypatch.setattr(auth_sessions, 'SINGLE_USER', False)
+    assert select_user(app_module, http_request()).status_code == 401
+    assert select_user(app_module, http_request('/search')).status_code == 401
+    # Naming a user without a session doesn't act for them
+    assert select_user(app_module, http_request(headers=[('X-Scout-User', 'alice')])).status_code == 401
+    assert select_user(app_module, http_request('/auth/google')) == 'default'
+    assert select_user(app_module, http_request('/stats')) == 'default'
+
+
+def test_single_user_deployment_acts_for_default(app_module, monkeypatch):
+    monkeypatch.setattr(auth_sessions, 'SINGLE_USER', True)
+    assert select_user(app_module, http_request()) == 'default'
+    assert select_user(app_module, http_request(headers=[('X-Scout-User', 'alice')])) == 'default'
+
+
+@pytest.mark.parametrize('single_user, session_user, new_account, expected', [
+    (False, None, False, 'new'),
+    (False, 'alice', False, 'alice'),
+    (False, 'default', False, 'default'),
+    (False, 'alice', True, 'new'),
+    (True, None, False, 'default'),
+    (True, None, True, 'new'),
+])
+def test_auth_flow_user(app_module, monkeypatch, single_user, session_user, new_account, expected):
+    monkeypatch.setattr(auth_sessions, 'SINGLE_USER', single_user)
+    monkeypatch.setattr(auth_sessions, 'new_user_id', lambda: 'new')
+    monkeypatch.setattr(app_module, 'get_authorization_url', lambda user_id: f"https://accounts.example/?user={user_id}")
+    request = http_request('/auth/google')
+    request.state.session_user = session_user
+
+    response = asyncio.run(app_module.auth_google(request, new_account=new_account))
+    assert response.headers['location'] == f"https://accounts.example/?user={expected}"
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from metadata_store import MetadataStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MetadataStore(str(tmp_path / 'metadata.sqlite3'))
+    yield store
+    store.close()
+
+
+def record(store, user_id, name, text):
+    store.record({'user_id': user_id, 'original_filename': name, 'renamed_file': name,
+                  'target_folder': 'Invoices', 'extracted_text': text})
+
+
+def test_users_only_see_their_own_documents(store):
+    record(store, 'alice', 'alice_invoice.pdf', 'electricity invoice for alice')
+    record(store, 'bob', 'bob_invoice.pdf', 'electricity invoice for bob')
+    store.flush()
+
+    alice = store.query_documents('alice')
+    assert alice['total'] == 1
+    assert [item['original_filename'] for item in alice['items']] == ['alice_invoice.pdf']
+    assert store.query_documents('alice', folder='Invoices')['total'] == 1
+    assert store.query_documents('carol')['total'] == 0
+
+    hits = store.search_documents('bob', 'electricity')['items']
+    assert [hit['original_filename'] for hit in hits] == ['bob_invoice.pdf']
+    assert store.search_documents('alice', 'bob')['items'] == []
+
+    bob_id = hits[0]['id']
+    assert store.get_document('bob', bob_id)['original_filename'] == 'bob_invoice.pdf'
+    assert store.get_document('alice', bob_id) is None
+
+
+def test_rows_without_a_user_belong_to_default(store):
+    store.record({'original_filename': 'legacy.pdf'})
+    store.flush()
+    assert store.query_documents('default')['total'] == 1
+
+
+def test_database_from_before_users_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.sqlite3')
+    with sqlite3.connect(path) as conn:
+        conn.execute("""CREATE TABLE documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, content_hash TEXT, original_filename TEXT NOT NULL,
+            renamed_file TEXT, target_folder TEXT, final_path TEXT, local_path TEXT, status TEXT NOT NULL,
+            error_message TEXT, processed_at TEXT NOT NULL, duration_ms REAL,
+            source TEXT NOT NULL DEFAULT 'api', import_key TEXT UNIQUE, details_json TEXT)""")
+        conn.execute("CREATE INDEX idx_documents_status ON documents(status, processed_at)")
+        conn.execute("INSERT INTO documents (original_filename, status, processed_at) "
+                     "VALUES ('old.pdf', 'success', '2026-01-01T00:00:00Z')")
+
+    store = MetadataStore(path)
+    try:
+        assert [item['original_filename'] for item in store.query_documents('default')['items']] == ['old.pdf']
+        assert store.query_documents('alice')['total'] == 0
+        assert [hit['original_filename'] for hit in store.search_documents('default', 'old')['items']] == ['old.pdf']
+    finally:
+        store.close()
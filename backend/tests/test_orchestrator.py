@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+from pipeline import Pipeline
+from scout_agents import scout_orchestrator as orchestrator
+
+
+class MemoryCheckpoint:
+    def __init__(self):
+        self.stages = {}
+
+    def completed(self, name):
+        return self.stages.get(name)
+
+    def complete(self, name, output, file_path=None):
+        self.stages[name] = output
+
+
+def pipeline_stage(name):
+    return next(stage for stage in orchestrator.PIPELINE.stages if stage.name == name)
+
+
+def run_vision(monkeypatch, analysis):
+    async def analyze_page_images(file_path=None):
+        return analysis
+
+    monkeypatch.setattr(orchestrator, 'analyze_page_images', analyze_page_images)
+    checkpoint = MemoryCheckpoint()
+    values = asyncio.run(Pipeline([pipeline_stage('vision')], inputs=('images',)).run(
+        {'images': {'success': True}}, SimpleNamespace(images_path='pages.jsonl'), checkpoint=checkpoint))
+    return values['vision_analysis'], checkpoint.stages
+
+
+def test_vision_stage_is_checkpointed_when_every_page_was_analyzed(monkeypatch):
+    analysis = "VISION ANALYSIS RESULTS:\n\nPage 1: An invoice\n\nPage 2: Its terms"
+    assert run_vision(monkeypatch, analysis) == (analysis, {'vision': {'vision_analysis': analysis}})
+
+
+def test_vision_stage_with_failed_pages_is_not_checkpointed(monkeypatch):
+    analysis = "VISION ANALYSIS RESULTS:\n\nPage 1: An invoice\n\nPage 2: Error analyzing page - rate limited"
+    # The reader analyzes the failed pages again
+    assert run_vision(monkeypatch, analysis) == (None, {})
+
+
+class Budget:
+    def record_run(self, stage, run):
+        pass
+
+    def fit(self, kind, text):
+        return text
+
+    def was_condensed(self, kind):
+        return False
+
+
+def read(monkeypatch, vision_analysis):
+    prompts = []
+
+    async def run(agent, prompt, run_config=None):
+        prompts.append(prompt)
+        return SimpleNamespace(final_output=SimpleNamespace(content='An invoice'), new_items=[])
+
+    monkeypatch.setattr(orchestrator.Runner, 'run', run)
+    ctx = SimpleNamespace(images_path='pages.jsonl', token_budget=Budget(), run_config=None, status=lambda message: None)
+    triage = SimpleNamespace(tier='full_vision')
+    outputs = asyncio.run(orchestrator._read(ctx, 'bill.pdf', 'bill.pdf', triage, {'success': True, 'page_count': 2},
+                                             vision_analysis, 'text layer'))
+    return prompts[0], outputs
+
+
+def test_reader_gets_the_vision_stage_analysis(monkeypatch):
+    prompt, outputs = read(monkeypatch, "VISION ANALYSIS RESULTS:\n\nPage 1: An invoice from ACME")
+    assert 'Page 1: An invoice from ACME' in prompt
+    assert "file_path='pages.jsonl'" not in prompt
+    assert outputs['content'] == 'An invoice'
+
+
+def test_reader_analyzes_the_pages_itself_without_the_vision_stage(monkeypatch):
+    prompt, _ = read(monkeypatch, None)
+    assert "analyze_pdf_images tool with file_path='pages.jsonl'" in prompt
+
+
+def test_filed_name_and_folder_come_from_the_move():
+    move = orchestrator.FileMoveConfirmation(source_file_path='in/Invoice.pdf', target_folder_path='out/Invoices',
+                                             new_file_path='out/Invoices/Invoice (1).pdf', status='success')
+    assert orchestrator._filed_as(move, 'Invoice.pdf', 'Invoices', 'out/Invoices') == \
+        ('Invoice (1).pdf', 'Invoices', 'out/Invoices')
+
+    failed = orchestrator.FileMoveConfirmation(source_file_path='in/Invoice.pdf', target_folder_path='out/Invoices',
+                                               status='failure', error='Target folder not found')
+    assert orchestrator._filed_as(failed, 'Invoice.pdf', 'Invoices', 'out/Invoices') == \
+        ('Invoice.pdf', 'Invoices', 'out/Invoices')
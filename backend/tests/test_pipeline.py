@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+
+import pipeline
+from pipeline import Pipeline, Stage, StageError
+
+
+def stage(name, inputs=(), outputs=(), value=None, calls=None, **kwargs):
+    """A stage whose outputs are all `value`, recording that it ran in calls."""
+    async def run(context, **values):
+        if calls is not None:
+            calls.append(name)
+        return dict.fromkeys(outputs, value)
+    return Stage(name, run, inputs=inputs, outputs=outputs, **kwargs)
+
+
+class MemoryCheckpoint:
+    def __init__(self, stages=None):
+        self.stages = dict(stages or {})
+
+    def completed(self, name):
+        return self.stages.get(name)
+
+    def complete(self, name, output, file_path=None):
+        self.stages[name] = output
+
+
+def run(pipe, values, **kwargs):
+    return asyncio.run(pipe.run(values, **kwargs))
+
+
+def test_stages_run_after_their_inputs_are_produced():
+    calls = []
+    pipe = Pipeline([
+        stage('c', inputs=('a_out', 'b_out'), outputs=('c_out',), value=3, calls=calls),
+        stage('a', inputs=('x',), outputs=('a_out',), value=1, calls=calls),
+        stage('b', inputs=('a_out',), outputs=('b_out',), value=2, calls=calls),
+    ], inputs=('x',))
+
+    assert pipe.order == ['a', 'b', 'c']
+    values = run(pipe, {'x': 0})
+    assert calls == ['a', 'b', 'c']
+    assert values == {'x': 0, 'a_out': 1, 'b_out': 2, 'c_out': 3}
+
+
+def test_independent_stages_run_concurrently():
+    async def main():
+        a_started, b_started = asyncio.Event(), asyncio.Event()
+
+        async def a(context):
+            a_started.set()
+            await b_started.wait()
+            return {'a_out': 1}
+
+        async def b(context):
+            b_started.set()
+            await a_started.wait()
+            return {'b_out': 2}
+
+        pipe = Pipeline([Stage('a', a, outputs=('a_out',)), Stage('b', b, outputs=('b_out',))])
+        # Run one after the other, the first would wait for the second forever
+        return await asyncio.wait_for(pipe.run({}), 1)
+
+    assert asyncio.run(main()) == {'a_out': 1, 'b_out': 2}
+
+
+def test_stage_skipped_by_when_yields_none():
+    calls = []
+    report = {}
+    pipe = Pipeline([
+        stage('a', inputs=('x',), outputs=('a_out',), value=1, calls=calls, when=lambda x: x > 0),
+        stage('b', inputs=('a_out',), outputs=('b_out',), value=2, calls=calls),
+    ], inputs=('x',))
+
+    values = run(pipe, {'x': 0}, report=report)
+    assert calls == ['b']
+    assert values['a_out'] is None and values['b_out'] == 2
+    assert report['a'] == {'status': 'skipped'}
+
+
+def test_optional_stage_failure_yields_none():
+    async def fail(context):
+        raise RuntimeError('boom')
+
+    report = {}
+    pipe = Pipeline([
+        Stage('a', fail, outputs=('a_out',), optional=True),
+        stage('b', inputs=('a_out',), outputs=('b_out',), value=2),
+    ])
+
+    values = run(pipe, {}, report=report)
+    assert values == {'a_out': None, 'b_out': 2}
+    assert report['a']['status'] == 'failed' and report['a']['error'] == 'boom'
+
+
+def test_required_stage_failure_raises_and_cancels_running_stages():
+    cancelled = []
+
+    async def fail(context, a_out):
+        raise RuntimeError('boom')
+
+    async def slow(context):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append('slow')
+            raise
+        return {'slow_out': 1}
+
+    pipe = Pipeline([
+        stage('a', outputs=('a_out',), value=1),
+        Stage('slow', slow, outputs=('slow_out',)),
+        Stage('fail', fail, inputs=('a_out',), outputs=('fail_out',)),
+    ])
+
+    with pytest.raises(StageError) as raised:
+        run(pipe, {})
+    assert raised.value.stage == 'fail'
+    assert isinstance(raised.value.error, RuntimeError)
+    assert raised.value.values['a_out'] == 1
+    assert cancelled == ['slow']
+
+
+def test_timeouts():
+    async def slow(context):
+        await asyncio.sleep(10)
+        return {'out': 1}
+
+    report = {}
+    optional = Pipeline([Stage('slow', slow, outputs=('out',), optional=True, timeout=0.05)])
+    assert run(optional, {}, report=report) == {'out': None}
+    assert report['slow']['status'] == 'failed'
+    assert 'timed out' in report['slow']['error']
+
+    required = Pipeline([Stage('slow', slow, outputs=('out',), timeout=0.05)])
+    with pytest.raises(StageError) as raised:
+        run(required, {})
+    assert isinstance(raised.value.error, TimeoutError)
+
+
+def test_configured_timeout_overrides_stage_timeout(monkeypatch):
+    async def slow(context):
+        await asyncio.sleep(10)
+        return {'out': 1}
+
+    monkeypatch.setitem(pipeline.STAGE_TIMEOUTS, 'slow', 0.05)
+    pipe = Pipeline([Stage('slow', slow, outputs=('out',), optional=True, timeout=60)])
+    assert run(pipe, {}) == {'out': None}
+
+
+def test_stage_returning_wrong_outputs_fails():
+    async def wrong(context):
+        return {'other': 1}
+
+    with pytest.raises(StageError) as raised:
+        run(Pipeline([Stage('a', wrong, outputs=('out',))]), {})
+    assert isinstance(raised.value.error, TypeError)
+
+
+def test_invalid_pipelines_are_refused():
+    with pytest.raises(ValueError, match='already produced'):
+        Pipeline([stage('a', outputs=('out',)), stage('b', outputs=('out',))])
+    with pytest.raises(ValueError, match='nothing produces'):
+        Pipeline([stage('a', inputs=('missing',), outputs=('out',))])
+    with pytest.raises(ValueError, match='depend on each other'):
+        Pipeline([stage('a', inputs=('b_out',), outputs=('a_out',)),
+                  stage('b', inputs=('a_out',), outputs=('b_out',))])
+    with pytest.raises(ValueError, match='inputs missing'):
+        run(Pipeline([stage('a', inputs=('x',), outputs=('out',))], inputs=('x',)), {})
+
+
+def test_checkpointed_stages_are_restored_instead_of_run():
+    calls = []
+    checkpoint = MemoryCheckpoint({'a': {'a_out': 'saved'}})
+    report = {}
+    pipe = Pipeline([
+        stage('a', outputs=('a_out',), value='fresh', calls=calls),
+        stage('b', inputs=('a_out',), outputs=('b_out',), value=2, calls=calls,
+              encode=lambda outputs: {'encoded': outputs['b_out']}),
+        stage('c', inputs=('b_out',), outputs=('c_out',), value=3, calls=calls, checkpoint=False),
+    ])
+
+    values = run(pipe, {}, checkpoint=checkpoint, report=report)
+    assert calls == ['b', 'c']
+    assert values['a_out'] == 'saved'
+    assert report['a'] == {'status': 'restored'}
+    assert checkpoint.stages == {'a': {'a_out': 'saved'}, 'b': {'encoded': 2}}
+
+
+def test_stage_rerun_when_restore_refuses_checkpoint():
+    calls = []
+    checkpoint = MemoryCheckpoint({'a': {'a_out': 'stale'}})
+    pipe = Pipeline([stage('a', outputs=('a_out',), value='fresh', calls=calls,
+                           restore=lambda context, saved: None)])
+
+    assert run(pipe, {}, checkpoint=checkpoint) == {'a_out': 'fresh'}
+    assert calls == ['a']
+    assert checkpoint.stages['a'] == {'a_out': 'fresh'}
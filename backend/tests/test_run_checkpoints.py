@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import pytest
+
+import run_checkpoints
+from pipeline import Pipeline, Stage, StageError
+from run_checkpoints import RunInProgressError, current_run, load_run, start_run
+
+
+@pytest.fixture(autouse=True)
+def runs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_checkpoints, 'RUNS_DIR', str(tmp_path / 'runs'))
+    return tmp_path / 'runs'
+
+
+def make_pipeline(calls, fail_reader):
+    async def triage(context, file_path):
+        calls.append('triage')
+        return {'tier': 'full'}
+
+    async def reader(context, tier):
+        calls.append('reader')
+        if fail_reader:
+            raise RuntimeError('reader down')
+        return {'content': f'{tier} text'}
+
+    async def move(context, file_path, content):
+        calls.append('move')
+        return {'moved_path': f'/filed/{content}.pdf'}
+
+    return Pipeline([
+        Stage('triage', triage, inputs=('file_path',), outputs=('tier',)),
+        Stage('reader', reader, inputs=('tier',), outputs=('content',)),
+        Stage('move', move, inputs=('file_path', 'content'), outputs=('moved_path',),
+              file_path=lambda outputs: outputs['moved_path']),
+    ], inputs=('file_path',))
+
+
+def process(run_id, calls, fail_reader=False):
+    """One request: claim the run, run the pipeline under its checkpoint, record the outcome."""
+    async def request():
+        run = start_run(run_id, '/inbox/bill.pdf', 'bill.pdf')
+        assert current_run() is run
+        try:
+            values = await make_pipeline(calls, fail_reader).run(
+                {'file_path': run.state['file_path']}, checkpoint=run)
+            run.finish({'path': values['moved_path']})
+        except StageError as e:
+            run.fail(str(e))
+            raise
+        finally:
+            run.release()
+        return run
+    return asyncio.run(request())
+
+
+def test_resumed_run_restores_completed_stages():
+    calls = []
+    with pytest.raises(StageError):
+        process('run-1', calls, fail_reader=True)
+    assert calls == ['triage', 'reader']
+
+    failed = load_run('run-1')
+    assert failed.status == 'failed'
+    assert failed.resumed
+    summary = failed.summary()
+    assert summary['completed_stages'] == ['triage']
+    assert summary['next_stage'] == 'images'
+    assert summary['attempts'] == 1
+    assert summary['error'] == 'reader down'
+
+    calls.clear()
+    run = process('run-1', calls)
+    # triage comes from the checkpoint; only the stages after it run again
+    assert calls == ['reader', 'move']
+    assert run.status == 'completed'
+
+    completed = load_run('run-1')
+    assert completed.state['result'] == {'path': '/filed/full text.pdf'}
+    assert completed.state['file_path'] == '/filed/full text.pdf'
+    assert completed.summary()['attempts'] == 2
+    assert completed.summary()['error'] is None
+
+
+def test_completed_run_is_not_processed_again():
+    calls = []
+    process('run-2', calls)
+    run = start_run('run-2', '/inbox/bill.pdf', 'bill.pdf')
+    try:
+        assert run.status == 'completed'
+        assert run.state['attempts'] == 1
+    finally:
+        run.release()
+
+
+def test_claimed_run_is_refused():
+    run = start_run('run-3', '/inbox/bill.pdf', 'bill.pdf')
+    try:
+        with pytest.raises(RunInProgressError):
+            start_run('run-3', '/inbox/bill.pdf', 'bill.pdf')
+    finally:
+        run.release()
+    start_run('run-3', '/inbox/bill.pdf', 'bill.pdf').release()
+    assert load_run('run-3').state['attempts'] == 2
+
+
+def test_new_run_id_is_generated_and_invalid_ids_refused():
+    run = start_run(None, '/inbox/bill.pdf', 'bill.pdf')
+    run.release()
+    assert run_checkpoints.valid_run_id(run.run_id)
+    assert load_run(run.run_id).summary()['next_stage'] == 'triage'
+    with pytest.raises(ValueError):
+        load_run('../escape')
+
+
+def test_vision_pages_survive_a_truncated_line(runs_dir):
+    run = start_run('run-4', '/inbox/bill.pdf', 'bill.pdf')
+    try:
+        run.record_vision_pages('abc', {1: 'first page', 2: 'second page'})
+        run.record_vision_pages('other', {1: 'another render'})
+        with open(run.vision_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'images': 'abc', 'page': 3, 'analysis': 'cut'})[:20])
+        assert run.vision_pages('abc') == {1: 'first page', 2: 'second page'}
+        run.finish({})
+    finally:
+        run.release()
+    assert not (runs_dir / 'run-4.vision.jsonl').exists()
+
+
+def test_run_belongs_to_the_user_who_started_it():
+    start_run('run-5', '/inbox/bill.pdf', 'bill.pdf', user_id='alice').release()
+    start_run('run-6', '/inbox/bill.pdf', 'bill.pdf').release()
+    assert load_run('run-5').user_id == 'alice'
+    assert load_run('run-6').user_id == 'default'
@@ -0,0 +1,229 @@
+"""
+Token budgeting for Scout App backend.
+
+Token count drives both latency and cost of every model call, so text that
+flows between pipeline stages (the PDF text layer and vision analyses handed
+to the reader agent, the reader's summary handed to later agents) is fitted
+to a per-stage budget. Text over budget is condensed rather than cut off:
+repeated lines (headers, footers) are dropped and the most informative
+sentences - rare words, numbers, dates, amounts - are kept in their
+original order.
+
+Each request gets a TokenBudget that records, per stage, how many tokens
+came in, how many were kept, and how many tokens the agents actually used.
+Tokens are counted with tiktoken when it is installed, otherwise estimated
+at ~4 characters per token.
+"""
+
+import contextvars
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from model_provider import AGENT_MODEL
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Token budgets per stage
+STAGE_BUDGETS = {
+    # PDF text layer returned to the reader agent
+    'pdf_text': int(os.getenv('SCOUT_BUDGET_PDF_TEXT', '3000')),
+    # Combined vision analyses returned to the reader agent
+    'vision': int(os.getenv('SCOUT_BUDGET_VISION', '3000')),
+    # Reader summary passed on to the rename, folder and indexing stages
+    'context': int(os.getenv('SCOUT_BUDGET_CONTEXT', '800')),
+    # Context excerpt included in the rename prompt
+    'rename': int(os.getenv('SCOUT_BUDGET_RENAME', '150')),
+}
+# Total output tokens for the per-page vision analyses of one document,
+# split across pages within the per-page bounds
+VISION_OUTPUT_BUDGET = int(os.getenv('SCOUT_VISION_OUTPUT_BUDGET', '2400'))
+VISION_PAGE_MIN_TOKENS = int(os.getenv('SCOUT_VISION_PAGE_MIN_TOKENS', '80'))
+VISION_PAGE_MAX_TOKENS = int(os.getenv('SCOUT_VISION_PAGE_MAX_TOKENS', '300'))
+
+CHARS_PER_TOKEN = 4
+GAP_MARKER = ' [...] '
+# Smallest remainder of a budget worth filling with the start of a sentence that didn't fit
+MIN_PARTIAL_SEGMENT_TOKENS = 20
+
+_SEGMENT_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+_WORD = re.compile(r'\w+', re.UNICODE)
+_NUMERIC = re.compile(r'\d')
+_STOPWORDS = frozenset(
+    "the and for with that this from are was were has have had not but you your our its their "
+    "der die das und mit von für ist sind ein eine den dem des auf als auch".split()
+)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def count_tokens(text: str, model: str = AGENT_MODEL) -> int:
+    """Number of tokens text takes up for model."""
+    if not text:
+        return 0
+    if TIKTOKEN_AVAILABLE:
+        return len(_encoding(model).encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = AGENT_MODEL) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ''
+    if TIKTOKEN_AVAILABLE:
+        tokens = _encoding(model).encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding(model).decode(tokens[:max_tokens])
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    # Don't end mid-word when there's a nearby space
+    space = cut.rfind(' ')
+    return cut[:space] if space > max_chars * 0.8 else cut
+
+
+def condense(text: str, max_tokens: int, model: str = AGENT_MODEL) -> str:
+    """Fit text into max_tokens, keeping its most informative sentences in their original order.
+
+    Sentences are scored by how many distinct, document-rare content words and
+    numbers they carry per token; duplicates are dropped. Gaps are marked with
+    ' [...] '. The first sentence (usually the title) is kept when it fits.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    segments: List[str] = []
+    seen = set()
+    for segment in _SEGMENT_SPLIT.split(text):
+        segment = segment.strip()
+        key = ' '.join(segment.lower().split())
+        if segment and key not in seen:
+            seen.add(key)
+            segments.append(segment)
+    if not segments:
+        return ''
+
+    words_per_segment = [{w for w in _WORD.findall(s.lower()) if len(w) > 2 and w not in _STOPWORDS}
+                         for s in segments]
+    # Words that appear all over the document (boilerplate) carry little information
+    document_frequency = Counter(w for words in words_per_segment for w in words)
+    gap_tokens = count_tokens(GAP_MARKER, model)
+
+    candidates = []
+    for i, (segment, words) in enumerate(zip(segments, words_per_segment)):
+        tokens = count_tokens(segment, model)
+        information = sum(1.0 / document_frequency[w] for w in words)
+        information += 0.5 * len(_NUMERIC.findall(segment)) ** 0.5
+        score = information / math.sqrt(tokens) + (1.0 if i == 0 else 0.0)
+        candidates.append((score, i, tokens))
+
+    selected = set()
+    used = 0
+    for score, i, tokens in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        if score <= 0:
+            break
+        if used + tokens + gap_tokens <= max_tokens:
+            selected.add(i)
+            used += tokens + gap_tokens
+
+    # Fill what's left of the budget with the beginning of the best sentence that didn't fit
+    # (if nothing fit at all, that sentence's beginning is all we return)
+    remaining = max_tokens - used - (2 * gap_tokens if selected else 0)
+    truncated = None
+    leftovers = [c for c in candidates if c[1] not in selected and c[0] > 0]
+    if leftovers and remaining >= min(MIN_PARTIAL_SEGMENT_TOKENS, max_tokens):
+        truncated = max(leftovers, key=lambda c: (c[0], -c[1]))[1]
+        selected.add(truncated)
+
+    parts = []
+    previous = -1
+    for i in sorted(selected):
+        if previous >= 0 and (i != previous + 1 or previous == truncated):
+            parts.append(GAP_MARKER.strip())
+        parts.append(truncate_to_tokens(segments[i], remaining, model) if i == truncated else segments[i])
+        previous = i
+    if len(selected) > 1 or truncated is None:
+        if previous != len(segments) - 1 or previous == truncated:
+            parts.append(GAP_MARKER.strip())
+    return ' '.join(parts)
+
+
+def vision_max_tokens(page_count: int) -> int:
+    """Output token limit per page so a whole document's vision analyses stay within budget."""
+    per_page = VISION_OUTPUT_BUDGET // max(1, page_count)
+    return max(VISION_PAGE_MIN_TOKENS, min(VISION_PAGE_MAX_TOKENS, per_page))
+
+
+class TokenBudget:
+    """Per-request record of stage budgets and token usage."""
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None, model: str = AGENT_MODEL):
+        self.budgets = dict(STAGE_BUDGETS, **(budgets or {}))
+        self.model = model
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.usage: Dict[str, Dict[str, int]] = {}
+
+    def fit(self, stage: str, text: Optional[str]) -> str:
+        """Condense text to the stage's budget and record what was kept."""
+        text = text or ''
+        budget = self.budgets.get(stage)
+        tokens_in = count_tokens(text, self.model)
+        fitted = text if budget is None or tokens_in <= budget else condense(text, budget, self.model)
+        entry = self.stages.setdefault(stage, {"budget": budget, "tokens_in": 0, "tokens_kept": 0, "condensed": False})
+        entry["tokens_in"] += tokens_in
+        entry["tokens_kept"] += tokens_in if fitted is text else count_tokens(fitted, self.model)
+        entry["condensed"] = entry["condensed"] or fitted is not text
+        return fitted
+
+    def was_condensed(self, stage: str) -> bool:
+        return self.stages.get(stage, {}).get("condensed", False)
+
+    def record_usage(self, stage: str, input_tokens: int = 0, output_tokens: int = 0, requests: int = 1):
+        entry = self.usage.setdefault(stage, {"requests": 0, "input_tokens": 0, "output_tokens": 0})
+        entry["requests"] += requests
+        entry["input_tokens"] += input_tokens or 0
+        entry["output_tokens"] += output_tokens or 0
+
+    def record_run(self, stage: str, run_result: Any):
+        """Add up the model usage of an agent run (a RunResult)."""
+        for response in getattr(run_result, 'raw_responses', []):
+            usage = response.usage
+            # Turns answered from the response cache report no requests and no tokens
+            self.record_usage(stage, usage.input_tokens, usage.output_tokens, usage.requests)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "tokenizer": "tiktoken" if TIKTOKEN_AVAILABLE else "estimate",
+            "stages": self.stages,
+            "model_usage": self.usage,
+            "total_input_tokens": sum(u["input_tokens"] for u in self.usage.values()),
+            "total_output_tokens": sum(u["output_tokens"] for u in self.usage.values()),
+        }
+
+
+_current_budget: contextvars.ContextVar[Optional[TokenBudget]] = contextvars.ContextVar('token_budget', default=None)
+
+
+def start_request_budget() -> TokenBudget:
+    """Create the budget for the current request; tools called during it record into it."""
+    budget = TokenBudget()
+    _current_budget.set(budget)
+    return budget
+
+
+def current_budget() -> TokenBudget:
+    """The current request's budget, or a standalone one when called outside a request."""
+    return _current_budget.get() or TokenBudget()
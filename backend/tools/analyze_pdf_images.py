@@ -1,26 +1,170 @@
 from agents import function_tool
-from openai import OpenAI
+from openai_client import get_openai_client
+from model_provider import VISION_MODEL
+from token_budget import current_budget, vision_max_tokens
+from llm_cache import cached_chat_completion
+from run_checkpoints import current_run
+import asyncio
+import base64
+import json
 import os
+import re
+from io import BytesIO
 from typing import List, Dict
+from metrics import timed
+
+# Maximum number of vision requests in flight per document
+VISION_CONCURRENCY = int(os.getenv('SCOUT_VISION_CONCURRENCY', '4'))
+# 'pages': several page images per request, 'contact_sheet': page thumbnails tiled into
+# one image per request, 'single': one page per request
+VISION_BATCH_MODE = os.getenv('SCOUT_VISION_BATCH_MODE', 'pages').lower()
+VISION_PAGES_PER_REQUEST = max(1, int(os.getenv('SCOUT_VISION_PAGES_PER_REQUEST', '4')))
+# Contact sheet layout: tiles per row and width of each page thumbnail in pixels
+CONTACT_SHEET_COLUMNS = max(1, int(os.getenv('SCOUT_VISION_SHEET_COLUMNS', '2')))
+CONTACT_SHEET_TILE_WIDTH = int(os.getenv('SCOUT_VISION_SHEET_TILE_WIDTH', '640'))
+
+PAGE_PROMPT = "Analyze this page from a PDF document. Extract key information, main topics, document type, and any important details that would help with file organization. Be concise but comprehensive."
+BATCH_PROMPT = (
+    "{intro} For EACH page, extract key information, main topics, document type, and any important details "
+    "that would help with file organization. Be concise but comprehensive. "
+    "Answer with one section per page, each starting on a new line with 'Page <number>:'. "
+    "Pages in this request: {pages}."
+)
+# Section headers such as 'Page 3:', '**Page 3:**' or '### Page 3 -'
+_PAGE_HEADER = re.compile(r'^[\s#*_>-]*Page\s+(\d+)\s*[*_]*\s*[:.\-–—]\s*[*_]*', re.IGNORECASE | re.MULTILINE)
+# Start of a page file line as written by extract_pdf_images
+_PAGE_LINE = re.compile(rb'\{"page": (\d+),')
+
+def split_page_analyses(text: str, pages: List) -> Dict[str, str]:
+    """Split a multi-page answer into per-page analyses, keyed by page number as a string."""
+    wanted = {str(page) for page in pages}
+    matches = list(_PAGE_HEADER.finditer(text))
+    sections = {}
+    for i, match in enumerate(matches):
+        page = match.group(1)
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if page in wanted:
+            sections[page] = (sections.get(page, '') + ' ' + text[match.end():end].strip()).strip()
+    if not sections and text.strip():
+        # The model ignored the section format; keep the whole answer with the first page
+        sections[str(pages[0])] = text.strip()
+    return sections
+
+def build_contact_sheet(batch: List[Dict]) -> str:
+    """Tile downscaled pages, labelled with their page numbers, into one base64 PNG."""
+    from PIL import Image, ImageDraw
+
+    tiles = []
+    for image_obj in batch:
+        page_image = Image.open(BytesIO(base64.b64decode(image_obj['base64_image']))).convert('RGB')
+        scale = CONTACT_SHEET_TILE_WIDTH / page_image.width
+        tiles.append(page_image.resize((CONTACT_SHEET_TILE_WIDTH, max(1, round(page_image.height * scale)))))
+    columns = min(CONTACT_SHEET_COLUMNS, len(tiles))
+    rows = -(-len(tiles) // columns)
+    tile_height = max(tile.height for tile in tiles)
+    sheet = Image.new('RGB', (columns * CONTACT_SHEET_TILE_WIDTH, rows * tile_height), 'white')
+    draw = ImageDraw.Draw(sheet)
+    for i, (tile, image_obj) in enumerate(zip(tiles, batch)):
+        x, y = (i % columns) * CONTACT_SHEET_TILE_WIDTH, (i // columns) * tile_height
+        sheet.paste(tile, (x, y))
+        draw.rectangle([x, y, x + CONTACT_SHEET_TILE_WIDTH - 1, y + tile_height - 1], outline='black', width=2)
+        draw.rectangle([x + 4, y + 4, x + 84, y + 24], fill='black')
+        draw.text((x + 8, y + 8), f"Page {image_obj['page']}", fill='white')
+    buffer = BytesIO()
+    sheet.save(buffer, format='PNG', optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def index_page_file(file_path: str) -> List[Dict]:
+    """Page numbers and offsets of a JSON-lines page file, without keeping any image in memory."""
+    entries = []
+    offset = 0
+    with open(file_path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                match = _PAGE_LINE.match(line)
+                page = int(match.group(1)) if match else json.loads(line).get('page', 'unknown')
+                entries.append({'page': page, 'source': file_path, 'offset': offset})
+            offset += len(line)
+    return entries
+
+def _load_images(batch: List[Dict]) -> List[Dict]:
+    """Read the images of page file entries; entries that carry their image are returned as they are."""
+    loaded = []
+    for image_obj in batch:
+        if 'base64_image' not in image_obj:
+            with open(image_obj['source'], 'rb') as f:
+                f.seek(image_obj['offset'])
+                image_obj = json.loads(f.readline())
+        loaded.append(image_obj)
+    return loaded
+
+def _image_part(base64_image: str) -> Dict:
+    return {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
+
+@timed("vision.batch")
+async def _analyze_batch(client, semaphore: asyncio.Semaphore, batch: List[Dict], max_tokens_per_page: int) -> List[str]:
+    """Analyze one or more pages in a single request and return one 'Page N: ...' entry per page."""
+    pages = [image_obj['page'] for image_obj in batch]
+    async with semaphore:
+        try:
+            # Pages from a page file are read only now, so just the batches in flight are in memory
+            batch = await asyncio.to_thread(_load_images, batch)
+            if len(batch) == 1:
+                content = [{"type": "text", "text": PAGE_PROMPT}, _image_part(batch[0]['base64_image'])]
+            elif VISION_BATCH_MODE == 'contact_sheet':
+                sheet = await asyncio.to_thread(build_contact_sheet, batch)
+                intro = ("The image below is a contact sheet of pages from one PDF document, tiled left to right "
+                         "and top to bottom; each tile is labelled with its page number.")
+                content = [{"type": "text", "text": BATCH_PROMPT.format(intro=intro, pages=", ".join(map(str, pages)))},
+                           _image_part(sheet)]
+            else:
+                intro = "The images below are consecutive pages of one PDF document, in order."
+                content = [{"type": "text", "text": BATCH_PROMPT.format(intro=intro, pages=", ".join(map(str, pages)))}]
+                content += [_image_part(image_obj['base64_image']) for image_obj in batch]
+
+            # Identical pages (e.g. the same template document) are served from the response cache
+            response = await cached_chat_completion(
+                client,
+                model=VISION_MODEL,
+                messages=[{"role": "user", "content": content}],
+                max_tokens=max_tokens_per_page * len(batch)
+            )
+            if response.usage:
+                current_budget().record_usage('vision', response.usage.prompt_tokens, response.usage.completion_tokens)
+            analysis = response.choices[0].message.content or ""
+            if len(batch) == 1:
+                return [f"Page {pages[0]}: {analysis}"]
+            sections = split_page_analyses(analysis, pages)
+            return [f"Page {page}: {sections.get(str(page), 'No separate analysis returned for this page.')}" for page in pages]
+
+        except Exception as e:
+            return [f"Page {page}: Error analyzing page - {str(e)}" for page in pages]
 
 @function_tool
-def analyze_pdf_images(images_data: str = None, file_path: str = None) -> str:
+@timed("tool.analyze_pdf_images")
+async def analyze_pdf_images(images_data: str = None, file_path: str = None) -> str:
     """
     Analyze PDF page images using OpenAI vision API for content understanding.
-    
+
     Args:
         images_data: JSON string containing array of image objects with 'page' and 'base64_image' fields
-        file_path: Path to JSON file containing image data (alternative to images_data)
-    
+        file_path: Path to a JSON file containing image data, or a .jsonl file with one image object
+            per line (alternative to images_data)
+
     Returns:
         Combined analysis of all PDF pages for organization purposes
     """
+    return await analyze_page_images(images_data, file_path)
+
+async def analyze_page_images(images_data: str = None, file_path: str = None) -> str:
+    """The analyze_pdf_images tool, callable directly (the orchestrator's vision stage runs it)."""
     try:
-        import json
-        
         # Parse the images data
         try:
-            if file_path and os.path.exists(file_path):
+            if file_path and file_path.endswith('.jsonl') and os.path.exists(file_path):
+                # One page per line; the images are read when their batch is analyzed
+                images = await asyncio.to_thread(index_page_file, file_path)
+            elif file_path and os.path.exists(file_path):
                 # Load from file
                 with open(file_path, 'r') as f:
                     images = json.load(f)
@@ -31,54 +175,63 @@ def analyze_pdf_images(images_data: str = None, file_path: str = None) -> str:
                 return "Error: No image data provided. Specify either images_data or file_path."
         except (json.JSONDecodeError, FileNotFoundError) as e:
             return f"Error: Failed to load images data - {str(e)}"
-        
+
         if not isinstance(images, list):
             return "Error: Images data must be an array of image objects."
-        
-        # Initialize OpenAI client
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        vision_results = []
-        for image_obj in images:
-            if not isinstance(image_obj, dict) or 'page' not in image_obj or 'base64_image' not in image_obj:
-                vision_results.append(f"Error: Invalid image object format for page {image_obj.get('page', 'unknown')}")
+
+        # Shared client: requests reuse pooled keep-alive connections
+        client = get_openai_client()
+        semaphore = asyncio.Semaphore(VISION_CONCURRENCY)
+        # Larger documents get shorter per-page analyses so the total stays within budget
+        max_tokens = vision_max_tokens(len(images))
+
+        vision_results = [None] * len(images)
+        valid = []
+        for i, image_obj in enumerate(images):
+            if not isinstance(image_obj, dict) or 'page' not in image_obj or ('base64_image' not in image_obj and 'offset' not in image_obj):
+                page_label = image_obj.get('page', 'unknown') if isinstance(image_obj, dict) else 'unknown'
+                vision_results[i] = f"Error: Invalid image object format for page {page_label}"
                 continue
-                
-            page_num = image_obj['page']
-            base64_image = image_obj['base64_image']
-            
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": "Analyze this page from a PDF document. Extract key information, main topics, document type, and any important details that would help with file organization. Be concise but comprehensive."
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/png;base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=300
-                )
-                page_analysis = response.choices[0].message.content
-                vision_results.append(f"Page {page_num}: {page_analysis}")
-                
-            except Exception as e:
-                vision_results.append(f"Page {page_num}: Error analyzing page - {str(e)}")
-        
+            valid.append((i, image_obj))
+
+        # Pages of this run's page file that an earlier attempt already analyzed aren't sent again
+        run = current_run()
+        images_sha256 = None
+        if run is not None and file_path and os.path.abspath(file_path) == os.path.abspath(run.pages_path):
+            images_sha256 = (run.completed('images') or {}).get('images', {}).get('sha256')
+        if images_sha256:
+            analyzed = await asyncio.to_thread(run.vision_pages, images_sha256)
+            pending = []
+            for i, image_obj in valid:
+                if image_obj['page'] in analyzed:
+                    vision_results[i] = analyzed[image_obj['page']]
+                else:
+                    pending.append((i, image_obj))
+            valid = pending
+
+        async def analyze(batch):
+            results = await _analyze_batch(client, semaphore, [image_obj for _, image_obj in batch], max_tokens)
+            if images_sha256:
+                # Checkpoint each batch as it completes; failed pages are retried on resume
+                analyses = {image_obj['page']: result for (_, image_obj), result in zip(batch, results)
+                            if not result.startswith(f"Page {image_obj['page']}: Error analyzing page")}
+                if analyses:
+                    await asyncio.to_thread(run.record_vision_pages, images_sha256, analyses)
+            return results
+
+        # Several pages share one request (and its instruction text) unless batching is off
+        batch_size = 1 if VISION_BATCH_MODE == 'single' else VISION_PAGES_PER_REQUEST
+        batches = [valid[start:start + batch_size] for start in range(0, len(valid), batch_size)]
+        batch_results = await asyncio.gather(*[analyze(batch) for batch in batches])
+        # Put the per-page results back in page order
+        for batch, results in zip(batches, batch_results):
+            for (i, _), result in zip(batch, results):
+                vision_results[i] = result
+
         # Combine all page analyses
-        combined_analysis = "\n\n".join(vision_results)
-        
+        combined_analysis = current_budget().fit('vision', "\n\n".join(vision_results))
+
         return f"VISION ANALYSIS RESULTS:\n\n{combined_analysis}"
-        
+
     except Exception as e:
-        return f"Error in analyze_pdf_images: {str(e)}"
\ No newline at end of file
+        return f"Error in analyze_pdf_images: {str(e)}"
@@ -1,9 +1,11 @@
 from agents import function_tool
 from typing import Annotated, Dict, Optional
-from google_drive_auth import get_drive_service
+from drive_client import get_async_drive_client
+from metrics import timed
 
 @function_tool
-def create_drive_folder(new_folder_name: str, parent_folder_id: str) -> Dict[str, str]:
+@timed("tool.create_drive_folder")
+async def create_drive_folder(new_folder_name: str, parent_folder_id: str) -> Dict[str, str]:
     """Creates a new folder in Google Drive.
 
     Args:
@@ -19,24 +21,16 @@ def create_drive_folder(new_folder_name: str, parent_folder_id: str) -> Dict[str
         Exception: If the folder creation fails or if drive service cannot be obtained.
     """
     try:
-        drive_service = get_drive_service()
-        if not drive_service:
-            raise Exception("Could not obtain Google Drive service. User might not be authenticated.")
+        drive_client = get_async_drive_client()
 
         if not new_folder_name or not new_folder_name.strip():
             raise ValueError("New folder name cannot be empty.")
 
-        folder_metadata = {
-            'name': new_folder_name.strip(),
-            'mimeType': 'application/vnd.google-apps.folder'
-        }
-        if parent_folder_id:
-            folder_metadata['parents'] = [parent_folder_id]
-        
-        created_folder = drive_service.files().create(
-            body=folder_metadata,
+        created_folder = await drive_client.create_folder(
+            new_folder_name.strip(),
+            parent_id=parent_folder_id or None,
             fields='id, name'
-        ).execute()
+        )
         
         folder_id = created_folder.get('id')
         folder_name = created_folder.get('name')
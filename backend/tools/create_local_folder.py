@@ -1,8 +1,11 @@
 import os
 from agents import function_tool
 from typing import Annotated
+from folder_index import notify_folder_created
+from metrics import timed
 
 @function_tool
+@timed("tool.create_local_folder")
 def create_local_folder(
     base_path: Annotated[str, "The base directory where to create the folder"],
     folder_name: Annotated[str, "The name of the folder to create"]
@@ -20,5 +23,7 @@ def create_local_folder(
     
     if not os.path.exists(folder_path):
         os.makedirs(folder_path, exist_ok=True)
+        # Make the new folder searchable right away
+        notify_folder_created(folder_path)
     
     return folder_path
\ No newline at end of file
@@ -1,8 +1,10 @@
 import os
 import shutil
 from agents import function_tool
+from metrics import timed
 
 @function_tool
+@timed("tool.create_folder")
 def create_folder(name: str) -> None:
     """Create a folder in the 'scout-app/backend/assets' folder named after the input string."""
     path = os.path.join(os.path.dirname(__file__), "../assets", name)
@@ -10,6 +12,7 @@ def create_folder(name: str) -> None:
         os.mkdir(path)
 
 @function_tool
+@timed("tool.move_file")
 def move_file(old_path: str, new_path: str) -> bool:
     """
     Move a file from the 'scout-app/backend/assets' folder to another location in the same path.
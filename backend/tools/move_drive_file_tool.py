@@ -1,9 +1,11 @@
 from agents import function_tool
 from typing import Dict
-from google_drive_auth import get_drive_service
+from drive_client import get_async_drive_client
+from metrics import timed
 
 @function_tool
-def move_drive_file(file_id: str, target_folder_id: str) -> Dict[str, str]:
+@timed("tool.move_drive_file")
+async def move_drive_file(file_id: str, target_folder_id: str) -> Dict[str, str]:
     """Moves a file to a specified folder in Google Drive.
 
     This is achieved by updating the file's parentage. Any existing parents will be removed 
@@ -21,9 +23,7 @@ def move_drive_file(file_id: str, target_folder_id: str) -> Dict[str, str]:
         Exception: If the move operation fails or if drive service cannot be obtained.
     """
     try:
-        drive_service = get_drive_service()
-        if not drive_service:
-            raise Exception("Could not obtain Google Drive service. User might not be authenticated.")
+        drive_client = get_async_drive_client()
 
         if not file_id or not file_id.strip():
             raise ValueError("File ID cannot be empty.")
@@ -31,18 +31,18 @@ def move_drive_file(file_id: str, target_folder_id: str) -> Dict[str, str]:
             raise ValueError("Target folder ID cannot be empty.")
 
         # Retrieve the file to get its current parents
-        file_metadata = drive_service.files().get(fileId=file_id, fields='parents').execute()
+        file_metadata = await drive_client.get_file(file_id, fields='parents')
         previous_parents = ",".join(file_metadata.get('parents', []))
 
         # Update the file's parents
-        updated_file = drive_service.files().update(
-            fileId=file_id,
-            addParents=target_folder_id,
-            removeParents=previous_parents, # Remove all old parents to ensure a 'move'
+        updated_file = await drive_client.update_file(
+            file_id,
+            add_parents=target_folder_id,
+            remove_parents=previous_parents, # Remove all old parents to ensure a 'move'
             fields='id, parents'
-        ).execute()
+        )
 
-        new_parents = updated_file.get('parents')
+        new_parents = updated_file.get('parents', [])
         if target_folder_id in new_parents:
             print(f"File ID '{file_id}' successfully moved to folder ID '{target_folder_id}'.")
             return {'file_id': file_id, 'moved_to_folder_id': target_folder_id, 'status': 'success'}
@@ -1,18 +1,27 @@
+import asyncio
 import os
-import shutil
 from agents import function_tool
-from typing import Annotated
+from typing import Annotated, Optional
+from file_placement import place_file
+from metrics import timed
 
 @function_tool
-def move_local_file(
+@timed("tool.move_local_file")
+async def move_local_file(
     source_file_path: Annotated[str, "The current full path of the file to move"],
-    target_folder_path: Annotated[str, "The target folder path where to move the file"]
+    target_folder_path: Annotated[str, "The target folder path where to move the file"],
+    new_filename: Annotated[Optional[str], "Optional new filename (without path) to give the file as part of the move"] = None
 ) -> dict:
     """Move a local file to a target folder and return confirmation.
     
+    The file is placed atomically at its final path, renamed in the same step if
+    new_filename is given. If a file with that name already exists in the target
+    folder, a ' (n)' suffix is added instead of overwriting it.
+    
     Args:
         source_file_path: The current full path of the file to move
         target_folder_path: The target folder path where to move the file
+        new_filename: Optional new filename for the file
         
     Returns:
         Dictionary with move confirmation details
@@ -34,14 +43,9 @@ def move_local_file(
         }
     
     try:
-        # Get the filename from the source path
-        filename = os.path.basename(source_file_path)
-        
-        # Create the destination path
-        destination_path = os.path.join(target_folder_path, filename)
-        
-        # Move the file
-        shutil.move(source_file_path, destination_path)
+        # Rename and move in one placement, even across filesystems; copies and fsyncs
+        # block, so keep them off the event loop
+        destination_path = await asyncio.to_thread(place_file, source_file_path, target_folder_path, new_filename)
         
         return {
             "source_file_path": source_file_path,
@@ -56,4 +60,4 @@ def move_local_file(
             "target_folder_path": target_folder_path,
             "status": "failure",
             "error": str(e)
-        }
\ No newline at end of file
+        }
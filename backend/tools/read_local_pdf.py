@@ -1,8 +1,39 @@
 import os
+import threading
+from collections import OrderedDict
 from PyPDF2 import PdfReader
 from agents import function_tool
+from token_budget import current_budget
+from metrics import timed
+
+# Text layers of the most recently read files; the orchestrator's text stage and
+# the reader's read_local_pdf call read the same file
+_TEXT_CACHE_SIZE = 4
+_text_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_text_cache_lock = threading.Lock()
+
+@timed("pdf.extract_text")
+def extract_pdf_text(file_path: str) -> str:
+    """Extract the text layer of a local PDF file."""
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _text_cache_lock:
+        if key in _text_cache:
+            _text_cache.move_to_end(key)
+            return _text_cache[key]
+    reader = PdfReader(file_path)
+    text = ""
+    for page in reader.pages:
+        text += (page.extract_text() or "") + "\n"
+    text = text.strip()
+    with _text_cache_lock:
+        _text_cache[key] = text
+        while len(_text_cache) > _TEXT_CACHE_SIZE:
+            _text_cache.popitem(last=False)
+    return text
 
 @function_tool
+@timed("tool.read_local_pdf")
 def read_local_pdf(file_path: str) -> str:
     """Read a PDF file from any local path and return its content as text."""
     
@@ -13,10 +44,7 @@ def read_local_pdf(file_path: str) -> str:
         raise ValueError(f"File {file_path} is not a PDF file")
     
     try:
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
+        # Long documents are condensed to the reader's text budget
+        return current_budget().fit('pdf_text', extract_pdf_text(file_path))
     except Exception as e:
-        raise ValueError(f"Error reading PDF file: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Error reading PDF file: {str(e)}")
@@ -1,8 +1,10 @@
 import os
 from PyPDF2 import PdfReader
 from agents import function_tool
+from metrics import timed
 
 @function_tool
+@timed("tool.read_pdf")
 def read_pdf(filename: str) -> str:
     """Read a PDF file from the assets folder and return its content as text."""
     assets_dir = os.path.join(os.path.dirname(__file__), "../assets")
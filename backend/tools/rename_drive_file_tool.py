@@ -1,8 +1,10 @@
 from agents import function_tool
-from google_drive_auth import get_drive_service
+from drive_client import get_async_drive_client
+from metrics import timed
 
 @function_tool
-def rename_drive_file(
+@timed("tool.rename_drive_file")
+async def rename_drive_file(
     file_id: str,
     new_name: str
 ) -> str:
@@ -19,19 +21,17 @@ def rename_drive_file(
         Exception: If the renaming operation fails or if drive service cannot be obtained.
     """
     try:
-        drive_service = get_drive_service()
-        if not drive_service:
-            raise Exception("Could not obtain Google Drive service. User might not be authenticated.")
+        drive_client = get_async_drive_client()
 
         if not new_name or not new_name.strip():
             raise ValueError("New name cannot be empty.")
         
         file_metadata = {'name': new_name.strip()}
-        updated_file = drive_service.files().update(
-            fileId=file_id,
+        updated_file = await drive_client.update_file(
+            file_id,
             body=file_metadata,
             fields='id, name'
-        ).execute()
+        )
         
         successfully_renamed_name = updated_file.get('name')
         print(f"File with ID '{file_id}' successfully renamed to '{successfully_renamed_name}' in Google Drive.")
@@ -1,9 +1,13 @@
+import asyncio
 import os
 from agents import function_tool
 from typing import Annotated
+from file_placement import place_file
+from metrics import timed
 
 @function_tool
-def rename_local_file(
+@timed("tool.rename_local_file")
+async def rename_local_file(
     current_file_path: Annotated[str, "The current full path of the file"],
     new_filename: Annotated[str, "The new filename (without path)"]
 ) -> str:
@@ -14,18 +18,16 @@ def rename_local_file(
         new_filename: The new filename (without path)
         
     Returns:
-        The new full path of the renamed file
+        The new full path of the renamed file. If the name was already taken,
+        a ' (n)' suffix is added instead of overwriting the existing file.
     """
     if not os.path.exists(current_file_path):
         raise FileNotFoundError(f"File not found at path: {current_file_path}")
     
     # Get the directory of the current file
-    current_dir = os.path.dirname(current_file_path)
+    current_dir = os.path.dirname(current_file_path) or '.'
     
-    # Create the new file path
-    new_file_path = os.path.join(current_dir, new_filename)
-    
-    # Rename the file
-    os.rename(current_file_path, new_file_path)
+    # Rename the file without clobbering an existing one
+    new_file_path = await asyncio.to_thread(place_file, current_file_path, current_dir, new_filename)
     
     return new_file_path
\ No newline at end of file
@@ -1,8 +1,10 @@
 import os
 from agents import function_tool
 from typing import Annotated
+from metrics import timed
 
 @function_tool
+@timed("tool.rename_pdf")
 def rename_pdf(
     old_name: Annotated[str, "The current name of the PDF file"],
     new_name: Annotated[str, "The new name of the PDF file"]
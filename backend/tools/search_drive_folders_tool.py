@@ -1,9 +1,11 @@
 from agents import function_tool
 from typing import List, Dict
-from google_drive_auth import get_drive_service
+from drive_client import get_async_drive_client, escape_query_value, FOLDER_MIME_TYPE
+from metrics import timed
 
 @function_tool
-def search_drive_folders(folder_name_query: str) -> List[Dict[str, str]]:
+@timed("tool.search_drive_folders")
+async def search_drive_folders(folder_name_query: str) -> List[Dict[str, str]]:
     """Searches for folders in Google Drive by name.
 
     Args:
@@ -16,10 +18,7 @@ def search_drive_folders(folder_name_query: str) -> List[Dict[str, str]]:
     """
     folders_found = []
     try:
-        drive_service = get_drive_service()
-        if not drive_service:
-            print("Could not obtain Google Drive service. User might not be authenticated. Returning empty list.")
-            return [] # Return empty list as per existing error handling for this tool
+        drive_client = get_async_drive_client()
 
         if not folder_name_query or not folder_name_query.strip():
             # Consider if an empty query should list all root folders or return error/empty.
@@ -27,23 +26,11 @@ def search_drive_folders(folder_name_query: str) -> List[Dict[str, str]]:
             print("Folder name query is empty. Returning no results.")
             return []
 
-        query = f"mimeType='application/vnd.google-apps.folder' and name contains '{folder_name_query.strip()}' and trashed=false"
+        query = f"mimeType='{FOLDER_MIME_TYPE}' and name contains '{escape_query_value(folder_name_query.strip())}' and trashed=false"
         
-        page_token = None
-        while True:
-            response = drive_service.files().list(
-                q=query,
-                spaces='drive',
-                fields='nextPageToken, files(id, name)',
-                pageToken=page_token
-            ).execute()
-            
-            for folder in response.get('files', []):
-                folders_found.append({'id': folder.get('id'), 'name': folder.get('name')})
-            
-            page_token = response.get('nextPageToken', None)
-            if page_token is None:
-                break
+        # The client follows nextPageToken for us
+        for folder in await drive_client.list_files(query, fields='nextPageToken, files(id, name)'):
+            folders_found.append({'id': folder.get('id'), 'name': folder.get('name')})
         
         print(f"Found {len(folders_found)} folder(s) matching query '{folder_name_query}': {folders_found}")
         return folders_found
@@ -1,35 +1,31 @@
 import os
 from agents import function_tool
 from typing import Annotated, List
+from folder_index import get_folder_index
+from metrics import timed
 
 @function_tool
+@timed("tool.search_local_folders")
 def search_local_folders(
     base_path: Annotated[str, "The base directory to search in"],
-    folder_name_pattern: Annotated[str, "The folder name or pattern to search for"]
+    folder_name_pattern: Annotated[str, "The folder name or pattern to search for"],
+    max_depth: Annotated[int, "How many directory levels below base_path to search (1 = direct subfolders only)"] = 1
 ) -> List[str]:
     """Search for local folders that match a given pattern.
     
+    Uses the in-memory folder index covering base_path, so repeated searches don't rescan the disk.
+    Exact name matches come first, then prefix, substring and fuzzy matches.
+    
     Args:
         base_path: The base directory to search in
         folder_name_pattern: The folder name or pattern to search for
+        max_depth: How many directory levels below base_path to search
         
     Returns:
-        List of full paths to matching folders
+        List of full paths to matching folders, best matches first
     """
-    matching_folders = []
-    
-    if not os.path.exists(base_path):
-        return matching_folders
-    
-    try:
-        for item in os.listdir(base_path):
-            item_path = os.path.join(base_path, item)
-            if os.path.isdir(item_path):
-                # Simple pattern matching - check if pattern is in folder name (case insensitive)
-                if folder_name_pattern.lower() in item.lower():
-                    matching_folders.append(item_path)
-    except PermissionError:
-        # Return empty list if we can't access the directory
-        pass
+    if not os.path.isdir(base_path):
+        return []
     
-    return matching_folders
\ No newline at end of file
+    index = get_folder_index(base_path)
+    return [path for path, _score in index.search(folder_name_pattern, max_depth=max(1, max_depth), base=base_path)]